@@ -1,108 +1,384 @@
-import google.generativeai as genai
 import sqlite3
 import pandas as pd
 import json
 import os
-from typing import Dict, Any, Optional
-import plotly.express as px
+import time
+import threading
+import contextvars
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Iterator, Callable, Tuple
+# plotly.graph_objects loads its submodules lazily; plotly.express and make_subplots are imported on first chart
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import base64
-import io
+from query_cache import QuestionCache, ResultCache, data_version, normalize_question
+from db_pool import ConnectionPool
+from intent_router import IntentRouter, IntentMatch
+from query_rewriter import QueryRewriter
+from columnar_engine import ColumnarEngine
+from result_pager import ResultHandles, StaleResultError, read_bounded, iter_records, decode_cursor, encode_cursor
+from result_digest import ResultDigest, estimate_tokens
+from chart_renderer import VISUALIZATION_FORMATS, ChartRenderer
+from query_guard import QueryGuard, QueryRejected, QueryBudgetExceeded
+from cancellation import CancellationTracker, Cancelled, interrupt_on_cancel, is_cancelled, record_interrupted
+from index_advisor import WorkloadLog
+from llm_client import LLMClient
+from model_backends import ModelBackend, create_backend
+from metrics import Metrics, request_prompt_tokens
+from prompt_builder import LEGACY_SCHEMA, PromptBuilder, compact_schema
 
 class AIAgent:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, metrics: Optional[Metrics] = None):
         """Initialize the AI agent with Gemini API"""
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        # Each stage has its own model backend, timeout and generation settings, so SQL can use a stronger
+        # model than the narrative answer; SQL_MODEL_* and RESPONSE_MODEL_* override the shared MODEL_* settings
+        self.sql_model = self.create_model('SQL', api_key)
+        self.response_model = self.create_model('RESPONSE', api_key)
+        
+        # Every model call goes through one client: identical in-flight prompts share a call, outbound
+        # concurrency and rate are capped, and quota or transient errors are retried with jittered backoff
+        self.llm = LLMClient(
+            max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '8')),
+            rate_per_second=float(os.getenv('LLM_RATE_PER_SECOND', '0')),
+            burst=int(os.getenv('LLM_BURST', '0')),
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', '3')),
+            backoff_base=float(os.getenv('LLM_BACKOFF_BASE_SECONDS', '0.5')),
+            backoff_max=float(os.getenv('LLM_BACKOFF_MAX_SECONDS', '8'))
+        )
         self.db_path = 'product_data.db'
+        self.db_pool = ConnectionPool(
+            self.db_path,
+            size=int(os.getenv('DB_POOL_SIZE', '4')),
+            mmap_size=int(os.getenv('DB_MMAP_SIZE_MB', '256')) * 1024 * 1024,
+            cache_size_kb=int(os.getenv('DB_CACHE_SIZE_MB', '64')) * 1024
+        )
         
-        # Database schema for context
-        self.schema_info = """
-        Database Schema:
-        
-        1. ad_sales_metrics table:
-           - date: Date of the metrics
-           - item_id: Product identifier
-           - ad_sales: Sales generated from advertising
-           - impressions: Number of ad impressions
-           - ad_spend: Cost of advertising
-           - clicks: Number of ad clicks
-           - units_sold: Number of units sold from ads
-        
-        2. total_sales_metrics table:
-           - date: Date of the metrics
-           - item_id: Product identifier
-           - total_sales: Total sales (including organic and ad-driven)
-           - total_units_ordered: Total units ordered
-        
-        3. product_eligibility table:
-           - eligibility_datetime_utc: Timestamp of eligibility check
-           - item_id: Product identifier
-           - eligibility: 1 for eligible, 0 for not eligible
-           - message: Reason for ineligibility (if any)
-        
-        Key relationships:
-        - All tables can be joined on item_id
-        - date columns can be used for time-based analysis
-        """
-    
-    def get_sql_query(self, question: str) -> str:
-        """Convert natural language question to SQL query"""
+        # SQL prompts: a compact schema read from the live database, sent as a static prefix ahead of the question
+        # so providers can cache it; COMPACT_PROMPTS=false (or an unreadable database) keeps the original prompts
+        schema = ""
+        if os.getenv('COMPACT_PROMPTS', 'true').lower() == 'true':
+            try:
+                with self.db_pool.connection() as conn:
+                    schema = compact_schema(conn)
+            except sqlite3.Error as e:
+                print(f"Error reading schema: {e}")
+        self.schema_info = schema or LEGACY_SCHEMA
+        self.prompts = PromptBuilder(self.schema_info, compact=bool(schema))
+        if isinstance(self.sql_model, ModelBackend) and self.prompts.prefix:
+            self.sql_model.cache_prefix(self.prompts.prefix)
         
-        prompt = f"""
-        You are a SQL expert. Given the following database schema and a question, generate the appropriate SQL query.
+        # Run narrative generation and chart rendering side by side once results are in
+        self.pipelined = os.getenv('PIPELINED_STAGES', 'true').lower() == 'true'
+        self.stage_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('PIPELINE_WORKERS', '8')),
+            thread_name_prefix='agent-stage'
+        )
         
-        {self.schema_info}
+        # Batches generate SQL for up to BATCH_SQL_SIZE questions per model call, then answer questions concurrently
+        self.batch_sql_size = int(os.getenv('BATCH_SQL_SIZE', '10'))
+        self.batch_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('BATCH_WORKERS', '8')),
+            thread_name_prefix='agent-batch'
+        )
         
-        Question: {question}
+        # Route eligible aggregate queries to the rollup tables built by database_setup.py
+        self.query_rewriter = QueryRewriter(self.db_pool) if os.getenv('ROLLUPS_ENABLED', 'true').lower() == 'true' else None
         
-        Generate a SQLite-compatible SQL query that answers this question. 
-        Return ONLY the SQL query, nothing else.
+        # EXECUTION_BACKEND=columnar runs common aggregate shapes on an in-memory NumPy copy of the tables
+        self.columnar_engine = ColumnarEngine(self.db_pool) if os.getenv('EXECUTION_BACKEND', 'sqlite').lower() == 'columnar' else None
         
-        Common calculations:
-        - RoAS (Return on Ad Spend) = ad_sales / ad_spend
-        - CPC (Cost Per Click) = ad_spend / clicks
-        - CTR (Click Through Rate) = clicks / impressions
-        """
+        # Check generated SQL's plan before it runs and bound how long it may run
+        self.query_guard = QueryGuard(
+            max_cost=float(os.getenv('QUERY_MAX_COST', '10000000')),
+            row_limit=int(os.getenv('QUERY_GUARD_ROW_LIMIT', '10000')),
+            max_seconds=float(os.getenv('QUERY_TIMEOUT_SECONDS', '10')),
+            max_vm_steps=int(os.getenv('QUERY_MAX_VM_STEPS', '0'))
+        ) if os.getenv('QUERY_GUARD_ENABLED', 'true').lower() == 'true' else None
+        
+        # Executed queries are logged by shape for index_advisor.py to recommend indexes from
+        workload_path = os.getenv('WORKLOAD_LOG_PATH', 'query_workload.db')
+        self.workload_log = WorkloadLog(
+            path=workload_path,
+            max_queries=int(os.getenv('WORKLOAD_LOG_MAX_QUERIES', '1000'))
+        ) if workload_path else None
+        
+        # Known KPI questions are answered from SQL templates without calling the model
+        self.intent_router = IntentRouter() if os.getenv('FAST_PATH_ENABLED', 'true').lower() == 'true' else None
+        
+        # Cache of question -> SQL so repeated questions skip the model round trip
+        self.sql_cache = QuestionCache(
+            path=os.getenv('SQL_CACHE_PATH', 'query_cache.db'),
+            max_memory_entries=int(os.getenv('SQL_CACHE_MEMORY_ENTRIES', '256')),
+            max_disk_entries=int(os.getenv('SQL_CACHE_DISK_ENTRIES', '5000')),
+            ttl_seconds=float(os.getenv('SQL_CACHE_TTL_SECONDS', '86400'))
+        )
+        
+        # Results past the row cap are returned truncated with a handle to page or stream the rest
+        self.max_result_rows = int(os.getenv('MAX_RESULT_ROWS', '500'))
+        self.result_handles = ResultHandles(
+            ttl_seconds=float(os.getenv('RESULT_HANDLE_TTL_SECONDS', '3600')),
+            max_handles=int(os.getenv('RESULT_HANDLE_MAX', '1024'))
+        )
+        
+        # Results too large for the response prompt's token budget are summarized instead of inlined
+        self.result_digest = ResultDigest(
+            token_budget=int(os.getenv('RESPONSE_TOKEN_BUDGET', '1500')),
+            top_k=int(os.getenv('RESPONSE_DIGEST_TOP_K', '5')),
+            preview_points=int(os.getenv('RESPONSE_DIGEST_PREVIEW_POINTS', '12'))
+        )
+        
+        # Charts are returned as Plotly JSON for the client to render; server-side PNG is opt-in
+        self.visualization_format = os.getenv('VISUALIZATION_FORMAT', 'plotly_json').lower()
+        if self.visualization_format not in VISUALIZATION_FORMATS:
+            raise ValueError(f"VISUALIZATION_FORMAT must be one of {', '.join(VISUALIZATION_FORMATS)}")
+        
+        # Encoded charts are cached per chart type and result data; PNG renders run on warm worker processes,
+        # which the API server starts (render in-process when the pool is not running)
+        self.chart_renderer = ChartRenderer(
+            workers=int(os.getenv('RENDER_PROCESSES', '2')),
+            cache_bytes=int(os.getenv('CHART_CACHE_MAX_MB', '32')) * 1024 * 1024,
+            compact=os.getenv('VISUALIZATION_COMPACT', 'true').lower() == 'true'
+        )
         
+        # Work for requests whose client disconnected is skipped or interrupted, and counted here
+        self.cancellation = CancellationTracker()
+        
+        # Stage latency histograms and error counters, served by the API at /metrics
+        self.metrics = metrics if metrics is not None else Metrics()
+        
+        # Set once warm_up has loaded the model client and chart libraries
+        self.warmed_up = threading.Event()
+        self.warm_up_seconds = None
+        
+        # Cache of query results, invalidated whenever the database file changes
+        self.result_cache = ResultCache(
+            max_bytes=int(os.getenv('RESULT_CACHE_MAX_MB', '64')) * 1024 * 1024,
+            max_entry_bytes=int(os.getenv('RESULT_CACHE_MAX_ENTRY_MB', '8')) * 1024 * 1024
+        )
+    
+    def create_model(self, stage: str, api_key: str) -> ModelBackend:
+        """Build a stage's model backend from {stage}_MODEL_* settings, falling back to the shared MODEL_* ones"""
+        def setting(key: str, default: str = '') -> str:
+            return os.getenv(f'{stage}_MODEL_{key}', os.getenv(f'MODEL_{key}', default))
+        
+        temperature = setting('TEMPERATURE')
+        max_output_tokens = setting('MAX_OUTPUT_TOKENS')
+        return create_backend(
+            setting('BACKEND', 'gemini'),
+            model_name=setting('NAME') or None,
+            api_key=api_key,
+            latency=float(setting('LATENCY_SECONDS', '0')),
+            cache_min_tokens=int(setting('CONTEXT_CACHE_MIN_TOKENS', '32768')),
+            cache_ttl=float(setting('CONTEXT_CACHE_TTL_SECONDS', '3600')),
+            timeout=float(setting('TIMEOUT_SECONDS', '60')),
+            temperature=float(temperature) if temperature else None,
+            max_output_tokens=int(max_output_tokens) if max_output_tokens else None
+        )
+    
+    def warm_up(self) -> None:
+        """Import the model client and plotly ahead of the first request; the server runs this in the background"""
+        start_time = time.perf_counter()
         try:
-            response = self.model.generate_content(prompt)
-            sql_query = response.text.strip()
-            
-            # Clean up the response to extract just the SQL
-            if sql_query.startswith('```sql'):
-                sql_query = sql_query[6:]
-            if sql_query.endswith('```'):
-                sql_query = sql_query[:-3]
-            
-            return sql_query.strip()
+            for model in (self.sql_model, self.response_model):
+                if isinstance(model, ModelBackend):
+                    model.warm_up()
+            # Building one small chart loads plotly.express and the figure validators
+            self.build_figure('histogram', pd.DataFrame({'value': [0.0, 1.0]})).to_json()
+        except Exception as e:
+            print(f"Error warming up: {e}")
+        finally:
+            self.warm_up_seconds = time.perf_counter() - start_time
+            self.warmed_up.set()
+    
+    def model_stats(self) -> Dict[str, Any]:
+        """Latency and token usage per stage backend"""
+        return {stage: model.stats() for stage, model in (("sql", self.sql_model), ("response", self.response_model))
+                if isinstance(model, ModelBackend)}
+    
+    def match_intent(self, question: str) -> Optional[IntentMatch]:
+        """Return the fast-path template for a recognised KPI question, if any"""
+        if self.intent_router is None:
+            return None
+        return self.intent_router.match(question)
+    
+    def get_sql_query(self, question: str) -> str:
+        """Convert natural language question to SQL query"""
+        
+        cached_sql = self.sql_cache.get(question, self.schema_info)
+        if cached_sql:
+            return cached_sql
+        
+        prompt = self.prompts.sql_prompt(question)
+        self.metrics.observe_prompt_tokens("sql_generation", estimate_tokens(prompt))
+        
+        try:
+            response = self.llm.generate(self.sql_model, prompt)
+            sql_query = self.strip_code_fence(response.text, 'sql')
+            if sql_query:
+                self.sql_cache.put(question, self.schema_info, sql_query)
+            return sql_query
         except Exception as e:
             print(f"Error generating SQL: {e}")
+            self.metrics.count_error("sql_generation")
             return None
     
-    def execute_query(self, sql_query: str) -> pd.DataFrame:
+    def get_sql_queries(self, questions: List[str]) -> Dict[str, str]:
+        """Convert several questions to SQL in one structured model call; questions it misses are left out"""
+        sql_queries = {}
+        missing = []
+        for question in questions:
+            cached_sql = self.sql_cache.get(question, self.schema_info)
+            if cached_sql:
+                sql_queries[question] = cached_sql
+            else:
+                missing.append(question)
+        if not missing:
+            return sql_queries
+        
+        prompt = self.prompts.batch_sql_prompt(missing)
+        self.metrics.observe_prompt_tokens("sql_generation", estimate_tokens(prompt))
+        
+        try:
+            response = self.llm.generate(self.sql_model, prompt, generation_config={"response_mime_type": "application/json"})
+            for item in json.loads(self.strip_code_fence(response.text, 'json')):
+                index = int(item["id"]) - 1
+                sql_query = self.strip_code_fence(str(item.get("sql") or ""), 'sql')
+                if 0 <= index < len(missing) and sql_query:
+                    sql_queries[missing[index]] = sql_query
+                    self.sql_cache.put(missing[index], self.schema_info, sql_query)
+        except Exception as e:
+            print(f"Error generating batched SQL: {e}")
+            self.metrics.count_error("batch_sql_generation")
+        return sql_queries
+    
+    def strip_code_fence(self, text: str, language: str) -> str:
+        """Remove the Markdown code fence the model sometimes wraps its output in"""
+        text = text.strip()
+        if text.startswith(f'```{language}'):
+            text = text[3 + len(language):]
+        elif text.startswith('```'):
+            text = text[3:]
+        if text.endswith('```'):
+            text = text[:-3]
+        return text.strip()
+    
+    def execute_query(self, sql_query: str, params: Optional[list] = None) -> pd.DataFrame:
         """Execute SQL query and return results as DataFrame"""
+        cache_key = f"{sql_query}\0{params!r}" if params else sql_query
+        version = data_version(self.db_path)
+        cached_df = self.result_cache.get(cache_key, version)
+        if cached_df is not None:
+            if "result_handle" in cached_df.attrs:
+                self.result_handles.register(sql_query, params, version, cached_df.attrs["total_rows"])
+            return cached_df
+        
+        if self.columnar_engine is not None:
+            df = self.columnar_engine.execute(sql_query, version, params)
+            if df is not None:
+                df = self.cap_result(df, sql_query, params, version, len(df))
+                self.result_cache.put(cache_key, version, df)
+                return df
+        
+        executed_sql = sql_query
+        if self.query_rewriter is not None:
+            executed_sql = self.query_rewriter.rewrite(sql_query, version)
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            df = pd.read_sql_query(sql_query, conn)
-            conn.close()
+            guard_note = None
+            with self.db_pool.connection() as conn:
+                if self.query_guard is not None:
+                    executed_sql, guard_note = self.query_guard.check(conn, executed_sql, params, version)
+                start_time = time.perf_counter()
+                with self.query_budget(conn), interrupt_on_cancel(conn.interrupt):
+                    df, total_rows = read_bounded(conn, executed_sql, params, self.max_result_rows)
+            if self.workload_log is not None:
+                self.workload_log.record(executed_sql, params, time.perf_counter() - start_time)
+            # A query the guard limited pages and streams in its limited form
+            df = self.cap_result(df, executed_sql if guard_note else sql_query, params, version, total_rows)
+            if guard_note:
+                df.attrs["guard_note"] = guard_note
+            self.result_cache.put(cache_key, version, df)
+            return df
+        except (QueryRejected, QueryBudgetExceeded) as e:
+            print(f"Query guard stopped the query: {e}")
+            self.metrics.count_error("query_guard")
+            df = pd.DataFrame()
+            df.attrs["guard_note"] = f"({e}.)"
             return df
         except Exception as e:
+            if is_cancelled():
+                record_interrupted("query_execution")
+                raise Cancelled("query_execution") from e
             print(f"Error executing query: {e}")
+            self.metrics.count_error("query_execution")
             return pd.DataFrame()
     
-    def generate_response(self, question: str, results_df: pd.DataFrame) -> str:
-        """Generate human-readable response from query results"""
+    def query_budget(self, conn):
+        """The guard's step and time budget for one statement, or no limit when the guard is off"""
+        return self.query_guard.budget(conn) if self.query_guard is not None else nullcontext()
+    
+    def cap_result(self, df: pd.DataFrame, sql_query: str, params: Optional[list],
+                   version: Optional[str], total_rows: int) -> pd.DataFrame:
+        """Trim a result to the row cap and attach a handle for fetching the rest"""
+        if self.max_result_rows <= 0 or total_rows <= self.max_result_rows:
+            return df
+        df = df.head(self.max_result_rows).copy()
+        df.attrs["total_rows"] = total_rows
+        df.attrs["result_handle"] = self.result_handles.register(sql_query, params, version, total_rows)
+        return df
+    
+    def result_handle_entry(self, handle: str) -> Dict[str, Any]:
+        """Look up a result handle, rejecting unknown, expired or outdated ones"""
+        entry = self.result_handles.get(handle)
+        if entry is None:
+            raise KeyError(f"Unknown or expired result handle: {handle}")
+        if entry["version"] != data_version(self.db_path):
+            raise StaleResultError("The data changed since this result was produced; ask the question again")
+        if self.query_rewriter is not None:
+            entry["sql_query"] = self.query_rewriter.rewrite(entry["sql_query"], entry["version"])
+        return entry
+    
+    def fetch_result_page(self, handle: str, cursor: Optional[str] = None,
+                          limit: Optional[int] = None) -> Dict[str, Any]:
+        """Return one page of a truncated result and the cursor of the next page"""
+        entry = self.result_handle_entry(handle)
+        offset = decode_cursor(cursor)
+        page_size = self.max_result_rows if self.max_result_rows > 0 else 1000
+        limit = min(max(limit or page_size, 1), page_size)
+        
+        inner_sql = entry["sql_query"].strip().rstrip(';')
+        with self.db_pool.connection() as conn, self.query_budget(conn):
+            db_cursor = conn.execute(f"SELECT * FROM ({inner_sql}) LIMIT ? OFFSET ?",
+                                     entry["params"] + [limit + 1, offset])
+            columns = [description[0] for description in db_cursor.description]
+            rows = db_cursor.fetchall()
+        
+        return {
+            "handle": handle,
+            "columns": columns,
+            "rows": [dict(zip(columns, row)) for row in rows[:limit]],
+            "offset": offset,
+            "total_rows": entry["total_rows"],
+            "next_cursor": encode_cursor(offset + limit) if len(rows) > limit else None
+        }
+    
+    def iter_result_rows(self, handle: str, chunk_rows: int = 500) -> Iterator[list]:
+        """Stream every row of a result handle as lists of records, straight from the database cursor"""
+        entry = self.result_handle_entry(handle)
+        with self.db_pool.connection() as conn, interrupt_on_cancel(conn.interrupt):
+            yield from iter_records(conn, entry["sql_query"], entry["params"], chunk_rows)
+    
+    def build_response_prompt(self, question: str, results_df: pd.DataFrame) -> str:
+        """Build the analyst prompt used to narrate query results"""
         
-        prompt = f"""
+        return f"""
         You are a data analyst. Given a question and the results from a database query, provide a clear, 
         professional response that answers the question in a human-readable format.
         
         Question: {question}
         
         Query Results:
-        {results_df.to_string() if not results_df.empty else 'No results found'}
+        {self.result_digest.build(results_df)}
+        {self.truncation_note(results_df)}
         
         Provide a comprehensive answer that:
         1. Directly answers the question
@@ -110,95 +386,297 @@ class AIAgent:
         3. Uses proper formatting for currency, percentages, etc.
         4. Is professional and business-friendly
         """
+    
+    def truncation_note(self, results_df: pd.DataFrame) -> str:
+        """Tell the model when it is only seeing the first rows of a larger result, or why the query was cut short"""
+        notes = [results_df.attrs.get("guard_note", "")]
+        total_rows = results_df.attrs.get("total_rows", len(results_df))
+        if total_rows > len(results_df):
+            notes.append(f"(Only the first {len(results_df)} of {total_rows} rows are shown.)")
+        return " ".join(note for note in notes if note)
+    
+    def generate_response(self, question: str, results_df: pd.DataFrame) -> str:
+        """Generate human-readable response from query results"""
+        
+        prompt = self.build_response_prompt(question, results_df)
+        self.metrics.observe_prompt_tokens("response_generation", estimate_tokens(prompt))
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self.llm.generate(self.response_model, prompt)
             return response.text
         except Exception as e:
             print(f"Error generating response: {e}")
+            self.metrics.count_error("response_generation")
             return f"Error generating response: {e}"
     
-    def create_visualization(self, question: str, results_df: pd.DataFrame) -> Optional[str]:
-        """Create appropriate visualization based on question and results"""
+    def generate_response_stream(self, question: str, results_df: pd.DataFrame) -> Iterator[str]:
+        """Generate the response incrementally, yielding text chunks as the model produces them"""
         
-        if results_df.empty:
-            return None
+        prompt = self.build_response_prompt(question, results_df)
+        self.metrics.observe_prompt_tokens("response_generation", estimate_tokens(prompt))
         
         try:
-            # Determine chart type based on question keywords
-            question_lower = question.lower()
-            
-            if 'roas' in question_lower or 'return on ad spend' in question_lower:
-                if 'ad_sales' in results_df.columns and 'ad_spend' in results_df.columns:
-                    fig = px.scatter(results_df, x='ad_spend', y='ad_sales', 
-                                   title='Ad Spend vs Ad Sales (RoAS Analysis)',
-                                   labels={'ad_spend': 'Ad Spend ($)', 'ad_sales': 'Ad Sales ($)'})
-                    fig.add_trace(go.Scatter(x=[0, results_df['ad_spend'].max()], 
-                                           y=[0, results_df['ad_spend'].max()], 
-                                           mode='lines', name='1:1 Line', line=dict(dash='dash')))
-            
-            elif 'cpc' in question_lower or 'cost per click' in question_lower:
-                if 'item_id' in results_df.columns and 'ad_spend' in results_df.columns and 'clicks' in results_df.columns:
-                    results_df['cpc'] = results_df['ad_spend'] / results_df['clicks'].replace(0, 1)
-                    fig = px.bar(results_df.head(10), x='item_id', y='cpc',
-                               title='Top 10 Products by Cost Per Click (CPC)',
-                               labels={'item_id': 'Product ID', 'cpc': 'Cost Per Click ($)'})
-            
-            elif 'sales' in question_lower and 'total' in question_lower:
-                if 'total_sales' in results_df.columns:
-                    fig = px.line(results_df, x='date', y='total_sales',
-                               title='Total Sales Over Time',
-                               labels={'date': 'Date', 'total_sales': 'Total Sales ($)'})
-            
-            elif 'impressions' in question_lower or 'clicks' in question_lower:
-                if 'impressions' in results_df.columns and 'clicks' in results_df.columns:
-                    fig = make_subplots(rows=2, cols=1, subplot_titles=('Impressions', 'Clicks'))
-                    fig.add_trace(go.Scatter(x=results_df['date'], y=results_df['impressions'], name='Impressions'), row=1, col=1)
-                    fig.add_trace(go.Scatter(x=results_df['date'], y=results_df['clicks'], name='Clicks'), row=2, col=1)
-                    fig.update_layout(title='Ad Performance Metrics Over Time', height=600)
-            
-            else:
-                # Default visualization for numerical data
-                numeric_cols = results_df.select_dtypes(include=['number']).columns
-                if len(numeric_cols) > 0:
-                    fig = px.histogram(results_df, x=numeric_cols[0], title=f'Distribution of {numeric_cols[0]}')
-                else:
-                    return None
-            
-            # Convert plot to base64 string
-            img_bytes = fig.to_image(format="png")
-            img_base64 = base64.b64encode(img_bytes).decode()
-            return img_base64
-            
+            for chunk in self.llm.stream(self.response_model, prompt):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            self.metrics.count_error("response_generation")
+            yield f"Error generating response: {e}"
+    
+    def generate_answer(self, question: str, results_df: pd.DataFrame,
+                        intent: Optional[IntentMatch] = None) -> str:
+        """Fill the fast-path answer template when there is one, otherwise ask the model"""
+        if intent is not None:
+            return intent.render_answer(results_df)
+        return self.generate_response(question, results_df)
+    
+    def generate_answer_stream(self, question: str, results_df: pd.DataFrame,
+                               intent: Optional[IntentMatch] = None) -> Iterator[str]:
+        """Streaming counterpart of generate_answer"""
+        if intent is not None:
+            yield intent.render_answer(results_df)
+            return
+        yield from self.generate_response_stream(question, results_df)
+    
+    def create_visualization(self, question: str, results_df: pd.DataFrame,
+                             output_format: Optional[str] = None) -> Optional[str]:
+        """Create appropriate visualization based on question and results"""
+        
+        try:
+            chart_type = self.chart_type(question, results_df)
+            if chart_type is None:
+                return None
+            return self.chart_renderer.render(chart_type, results_df, output_format or self.visualization_format,
+                                              lambda: self.build_figure(chart_type, results_df))
+        except Cancelled:
+            raise
         except Exception as e:
             print(f"Error creating visualization: {e}")
+            self.metrics.count_error("visualization")
+            return None
+    
+    def chart_type(self, question: str, results_df: pd.DataFrame) -> Optional[str]:
+        """Pick a chart based on question keywords, or None when the results cannot support one"""
+        
+        if results_df.empty:
+            return None
+        
+        question_lower = question.lower()
+        columns = results_df.columns
+        
+        if 'roas' in question_lower or 'return on ad spend' in question_lower:
+            if 'ad_sales' in columns and 'ad_spend' in columns:
+                return 'roas_scatter'
+        
+        elif 'cpc' in question_lower or 'cost per click' in question_lower:
+            if 'item_id' in columns and 'ad_spend' in columns and 'clicks' in columns:
+                return 'cpc_bar'
+        
+        elif 'sales' in question_lower and 'total' in question_lower:
+            if 'total_sales' in columns:
+                return 'total_sales_line'
+        
+        elif 'impressions' in question_lower or 'clicks' in question_lower:
+            if 'impressions' in columns and 'clicks' in columns:
+                return 'traffic_lines'
+        
+        elif len(results_df.select_dtypes(include=['number']).columns) > 0:
+            # Default visualization for numerical data
+            return 'histogram'
+        
+        return None
+    
+    def build_figure(self, chart_type: str, results_df: pd.DataFrame) -> Optional[go.Figure]:
+        """Build the figure for a chart type chosen by chart_type"""
+        
+        import plotly.express as px
+        from plotly.subplots import make_subplots
+        
+        # Work on a copy so concurrent stages never see derived columns appear mid-read
+        results_df = results_df.copy()
+        
+        if chart_type == 'roas_scatter':
+            fig = px.scatter(results_df, x='ad_spend', y='ad_sales', 
+                           title='Ad Spend vs Ad Sales (RoAS Analysis)',
+                           labels={'ad_spend': 'Ad Spend ($)', 'ad_sales': 'Ad Sales ($)'})
+            fig.add_trace(go.Scatter(x=[0, results_df['ad_spend'].max()], 
+                                   y=[0, results_df['ad_spend'].max()], 
+                                   mode='lines', name='1:1 Line', line=dict(dash='dash')))
+        
+        elif chart_type == 'cpc_bar':
+            results_df['cpc'] = results_df['ad_spend'] / results_df['clicks'].replace(0, 1)
+            fig = px.bar(results_df.head(10), x='item_id', y='cpc',
+                       title='Top 10 Products by Cost Per Click (CPC)',
+                       labels={'item_id': 'Product ID', 'cpc': 'Cost Per Click ($)'})
+        
+        elif chart_type == 'total_sales_line':
+            fig = px.line(results_df, x='date', y='total_sales',
+                       title='Total Sales Over Time',
+                       labels={'date': 'Date', 'total_sales': 'Total Sales ($)'})
+        
+        elif chart_type == 'traffic_lines':
+            fig = make_subplots(rows=2, cols=1, subplot_titles=('Impressions', 'Clicks'))
+            fig.add_trace(go.Scatter(x=results_df['date'], y=results_df['impressions'], name='Impressions'), row=1, col=1)
+            fig.add_trace(go.Scatter(x=results_df['date'], y=results_df['clicks'], name='Clicks'), row=2, col=1)
+            fig.update_layout(title='Ad Performance Metrics Over Time', height=600)
+        
+        elif chart_type == 'histogram':
+            numeric_cols = results_df.select_dtypes(include=['number']).columns
+            fig = px.histogram(results_df, x=numeric_cols[0], title=f'Distribution of {numeric_cols[0]}')
+        
+        else:
             return None
+        
+        return fig
     
-    def process_question(self, question: str) -> Dict[str, Any]:
+    def process_question(self, question: str, pipelined: Optional[bool] = None) -> Dict[str, Any]:
         """Main method to process a question and return comprehensive response"""
         
-        # Step 1: Generate SQL query
-        sql_query = self.get_sql_query(question)
-        if not sql_query:
+        timings = {}
+        total_start = time.perf_counter()
+        
+        # Step 1: Generate SQL query, via a fast-path template when the question is a known KPI
+        intent, timings["intent_matching"] = self.timed(self.match_intent, question)
+        sql_query = None
+        if not intent:
+            sql_query, timings["sql_generation"] = self.timed(self.get_sql_query, question)
+        
+        result = self.answer_query(question, sql_query, intent, pipelined=pipelined, timings=timings)
+        timings["total"] = time.perf_counter() - total_start
+        self.metrics.observe_stages("process_question", timings)
+        return result
+    
+    def process_batch(self, questions: List[str], visualization_format: Optional[str] = None,
+                      metrics_endpoint: Optional[str] = "process_batch") -> Dict[str, Any]:
+        """Answer several questions: equivalent ones once, SQL in batched model calls, the rest concurrently.
+        Stage timings are recorded under metrics_endpoint, or left to the caller when it is None."""
+        timings = {}
+        total_start = time.perf_counter()
+        
+        # Questions that differ only in case, punctuation or spacing share one answer
+        unique = {}
+        for question in questions:
+            unique.setdefault(normalize_question(question), question)
+        pending = list(unique.values())
+        
+        # Step 1: Fast-path templates first, then one model call per BATCH_SQL_SIZE remaining questions
+        sql_start = time.perf_counter()
+        intents = {question: self.match_intent(question) for question in pending}
+        needs_sql = [question for question in pending if intents[question] is None]
+        size = max(self.batch_sql_size, 1)
+        chunks = [needs_sql[i:i + size] for i in range(0, len(needs_sql), size)]
+        sql_queries = {}
+        for generated in self.stage_executor.map(self.get_sql_queries, chunks):
+            sql_queries.update(generated)
+        # Anything the batched calls left out gets its own model call
+        missing = [question for question in needs_sql if question not in sql_queries]
+        if missing:
+            print(f"Batched SQL generation missed {len(missing)} of {len(needs_sql)} questions; "
+                  f"generating them one call each")
+            self.metrics.count_batch_sql_fallbacks(len(missing))
+        for question, sql_query in zip(missing, self.stage_executor.map(self.get_sql_query, missing)):
+            sql_queries[question] = sql_query
+        timings["sql_generation"] = time.perf_counter() - sql_start
+        
+        # Steps 2-4 for every question at once; queries share the read pool, answers and charts the stage pool
+        answer_start = time.perf_counter()
+        futures = {
+            question: self.batch_executor.submit(self.answer_query, question, sql_queries.get(question),
+                                                 intents[question], visualization_format)
+            for question in pending
+        }
+        answered = {question: future.result() for question, future in futures.items()}
+        timings["answering"] = time.perf_counter() - answer_start
+        timings["total"] = time.perf_counter() - total_start
+        if metrics_endpoint:
+            self.metrics.observe_stages(metrics_endpoint, timings)
+        
+        results = []
+        for question in questions:
+            result = dict(answered[unique[normalize_question(question)]])
+            result["question"] = question
+            results.append(result)
+        return {
+            "results": results,
+            "unique_questions": len(pending),
+            "sql_model_calls": len(chunks) + len(missing),
+            "timings": timings,
+        }
+    
+    def answer_query(self, question: str, sql_query: Optional[str], intent: Optional[IntentMatch],
+                     visualization_format: Optional[str] = None, pipelined: Optional[bool] = None,
+                     timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """Run the query for a question whose SQL is known, then generate its answer and chart"""
+        if pipelined is None:
+            pipelined = self.pipelined
+        timings = {} if timings is None else timings
+        total_start = time.perf_counter()
+        
+        if intent:
+            sql_query = intent.display_sql
+            query_args = (intent.sql_query, intent.params)
+        elif not sql_query:
             return {
                 "error": "Failed to generate SQL query",
                 "question": question
             }
+        else:
+            query_args = (sql_query,)
         
         # Step 2: Execute query
-        results_df = self.execute_query(sql_query)
+        results_df, timings["query_execution"] = self.timed(self.execute_query, *query_args)
         
-        # Step 3: Generate response
-        response = self.generate_response(question, results_df)
-        
-        # Step 4: Create visualization
-        visualization = self.create_visualization(question, results_df)
+        # Steps 3 and 4: Generate response and create visualization
+        post_query_start = time.perf_counter()
+        if pipelined:
+            # Both stages only read results_df, so run them concurrently and join; each keeps the caller's
+            # context so per-request accounting such as prompt tokens still lands on this request
+            response_future = self.stage_executor.submit(contextvars.copy_context().run, self.timed,
+                                                         self.generate_answer, question, results_df, intent)
+            visualization_future = self.stage_executor.submit(contextvars.copy_context().run, self.timed,
+                                                              self.create_visualization, question, results_df,
+                                                              visualization_format)
+            response, timings["response_generation"] = response_future.result()
+            visualization, timings["visualization"] = visualization_future.result()
+        else:
+            response, timings["response_generation"] = self.timed(self.generate_answer, question, results_df, intent)
+            visualization, timings["visualization"] = self.timed(self.create_visualization, question, results_df,
+                                                                 visualization_format)
+        timings["post_query"] = time.perf_counter() - post_query_start
+        timings["total"] = time.perf_counter() - total_start
         
+        serialization_start = time.perf_counter()
+        result = self.build_result(question, sql_query, results_df, response, visualization, timings,
+                                   intent.name if intent else None, visualization_format)
+        timings["serialization"] = time.perf_counter() - serialization_start
+        return result
+    
+    def timed(self, func: Callable, *args) -> Tuple[Any, float]:
+        """Call a pipeline stage and return its result with the elapsed seconds"""
+        start = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - start
+    
+    def build_result(self, question: str, sql_query: str, results_df: pd.DataFrame,
+                     response: str, visualization: Optional[str],
+                     timings: Optional[Dict[str, float]] = None,
+                     intent: Optional[str] = None,
+                     visualization_format: Optional[str] = None) -> Dict[str, Any]:
+        """Assemble the response payload shared by the agent and the API endpoints"""
+        total_rows = results_df.attrs.get("total_rows", len(results_df))
+        prompt_tokens = request_prompt_tokens.get()
         return {
             "question": question,
             "sql_query": sql_query,
             "results": results_df.to_dict('records') if not results_df.empty else [],
             "response": response,
             "visualization": visualization,
-            "row_count": len(results_df)
+            "visualization_format": (visualization_format or self.visualization_format) if visualization else None,
+            "row_count": total_rows,
+            "truncated": total_rows > len(results_df),
+            "result_handle": results_df.attrs.get("result_handle"),
+            "timings": timings,
+            "intent": intent,
+            "prompt_tokens": dict(prompt_tokens) if prompt_tokens is not None else None
         } 
\ No newline at end of file
@@ -1,22 +1,64 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal
 import json
 import asyncio
+import contextvars
+import functools
 import time
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from ai_agent import AIAgent
+from result_pager import StaleResultError
+from cancellation import current_token, record_interrupted
+from metrics import Metrics, MetricsMiddleware, request_timings
 import os
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+api_key = os.getenv('GEMINI_API_KEY')
+if not api_key:
+    raise ValueError("GEMINI_API_KEY environment variable is required")
+
+# Built by the lifespan hook (or get_agent) rather than at import, so importing the module stays cheap
+ai_agent: Optional[AIAgent] = None
+agent_lock = threading.Lock()
+
+# Per-stage histograms and request counters for /metrics; created up front so the middleware can use them
+metrics = Metrics()
+
+def get_agent() -> AIAgent:
+    """Return the AI agent, building it on first use"""
+    global ai_agent
+    with agent_lock:
+        if ai_agent is None:
+            ai_agent = AIAgent(api_key, metrics=metrics)
+    return ai_agent
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the agent before serving, warm the model client and plotly in the background, clean up on exit"""
+    agent = await asyncio.get_running_loop().run_in_executor(None, get_agent)
+    # Fork the renderer processes before the warm-up thread starts importing modules
+    agent.chart_renderer.start()
+    threading.Thread(target=agent.warm_up, name='warm-up', daemon=True).start()
+    yield
+    for executor in (llm_executor, db_executor, render_executor):
+        executor.shutdown(wait=False)
+    agent.chart_renderer.shutdown()
+    if agent.workload_log is not None:
+        agent.workload_log.close()
+
 app = FastAPI(
     title="Product Data AI Agent",
     description="AI agent that answers questions about product sales, advertising, and eligibility data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -28,16 +70,122 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize AI Agent
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    raise ValueError("GEMINI_API_KEY environment variable is required")
+# Server-Timing header and request metrics on every response
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# Bounded pools so blocking LLM, database and rendering work never runs on the event loop
+llm_executor = ThreadPoolExecutor(max_workers=int(os.getenv('LLM_WORKERS', '8')), thread_name_prefix='llm')
+db_executor = ThreadPoolExecutor(max_workers=int(os.getenv('DB_POOL_SIZE', '4')), thread_name_prefix='db')
+render_executor = ThreadPoolExecutor(max_workers=int(os.getenv('RENDER_WORKERS', '2')), thread_name_prefix='render')
+
+# Rows per NDJSON chunk when streaming a full result
+STREAM_CHUNK_ROWS = int(os.getenv('STREAM_CHUNK_ROWS', '500'))
 
-ai_agent = AIAgent(api_key)
+# Largest number of questions accepted by /ask/batch
+MAX_BATCH_QUESTIONS = int(os.getenv('MAX_BATCH_QUESTIONS', '100'))
+
+async def run_blocking(executor: ThreadPoolExecutor, func, *args):
+    """Run a blocking agent stage on one of the bounded pools, in the caller's context (and cancel token)"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, func, *args))
+
+async def stream_blocking(executor: ThreadPoolExecutor, func, *args, max_pending: int = 0,
+                          stage: Optional[str] = None):
+    """Drive a blocking iterator on one of the bounded pools, yielding items as they arrive.
+    With max_pending the producer waits for the consumer instead of buffering ahead of a slow client."""
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue(maxsize=max_pending)
+    done = object()
+    stopped = threading.Event()
+    
+    def put(item):
+        if max_pending:
+            asyncio.run_coroutine_threadsafe(items.put(item), loop).result()
+        else:
+            loop.call_soon_threadsafe(items.put_nowait, item)
+    
+    def produce():
+        iterator = iter(func(*args))
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    if stage:
+                        record_interrupted(stage)
+                    break
+                put(item)
+        finally:
+            # Closing the iterator releases whatever it holds, e.g. a pooled connection
+            close = getattr(iterator, 'close', None)
+            if close:
+                close()
+            if not stopped.is_set():
+                put(done)
+    
+    future = loop.run_in_executor(executor, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            item = await items.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        # If the consumer went away, unblock the producer so it can stop and free its worker
+        stopped.set()
+        while not items.empty():
+            items.get_nowait()
+    await future
+
+def stage_timings() -> Dict[str, float]:
+    """The current request's stage timings, which the metrics middleware sends as Server-Timing"""
+    timings = request_timings.get()
+    return timings if timings is not None else {}
+
+def call_stage(stage: str, func, *args):
+    """Worker-side entry of a stage: skip it if its request was cancelled while it waited for a slot"""
+    token = current_token.get()
+    if token is not None:
+        token.check(stage)
+    return func(*args)
+
+async def run_timed(timings: Dict[str, float], stage: str, executor: ThreadPoolExecutor, func, *args):
+    """Run a blocking stage on its pool and record how long it took"""
+    start = time.perf_counter()
+    future = executor.submit(contextvars.copy_context().run, call_stage, stage, func, *args)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        # Work still queued is dropped, freeing its slot; running work is told to stop by the cancel token
+        token = current_token.get()
+        if token is not None:
+            token.tracker.record(stage, "skipped" if future.cancel() else "abandoned")
+        raise
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+async def resolve_query(question: str, timings: Dict[str, float]):
+    """Return (sql_query, execute_query args, intent), calling the model only off the fast path"""
+    start = time.perf_counter()
+    intent = ai_agent.match_intent(question)
+    timings["intent_matching"] = time.perf_counter() - start
+    if intent:
+        return intent.display_sql, (intent.sql_query, intent.params), intent
+    
+    sql_query = await run_timed(timings, "sql_generation", llm_executor, ai_agent.get_sql_query, question)
+    return sql_query, (sql_query,), None
+
+def answer_executor(intent) -> ThreadPoolExecutor:
+    """Fast-path answers are template fills, so keep them off the LLM pool"""
+    return llm_executor if intent is None else db_executor
+
+def sse_event(payload: Dict[str, Any]) -> str:
+    """Format a payload as a server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
 
 class QuestionRequest(BaseModel):
     question: str
     stream: bool = False
+    visualization_format: Optional[Literal['plotly_json', 'png']] = None
 
 class QuestionResponse(BaseModel):
     question: str
@@ -45,7 +193,23 @@ class QuestionResponse(BaseModel):
     response: str
     results: list
     visualization: Optional[str] = None
+    visualization_format: Optional[str] = None
     row_count: int
+    truncated: bool = False
+    result_handle: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
+    intent: Optional[str] = None
+    prompt_tokens: Optional[Dict[str, int]] = None
+
+class BatchRequest(BaseModel):
+    questions: List[str]
+    visualization_format: Optional[Literal['plotly_json', 'png']] = None
+
+class BatchResponse(BaseModel):
+    results: list
+    unique_questions: int
+    sql_model_calls: int
+    timings: Dict[str, float]
 
 @app.get("/")
 async def root():
@@ -56,15 +220,21 @@ async def root():
         "endpoints": {
             "/ask": "POST - Ask a question about the data",
             "/ask/stream": "POST - Ask a question with streaming response",
+            "/ask/batch": "POST - Ask several questions at once",
             "/health": "GET - Health check",
-            "/schema": "GET - Database schema information"
+            "/schema": "GET - Database schema information",
+            "/stats": "GET - Cache and connection pool statistics",
+            "/metrics": "GET - Stage latency histograms and counters in Prometheus text format",
+            "/results/{handle}": "GET - Page through a truncated result",
+            "/results/{handle}/stream": "GET - Stream every row of a truncated result as NDJSON"
         }
     }
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": time.time()}
+    return {"status": "healthy", "timestamp": time.time(),
+            "warmed_up": ai_agent is not None and ai_agent.warmed_up.is_set()}
 
 @app.get("/schema")
 async def get_schema():
@@ -78,82 +248,227 @@ async def get_schema():
         ]
     }
 
+@app.get("/stats")
+async def get_stats():
+    """Get cache and connection pool statistics"""
+    return {
+        "sql_cache": ai_agent.sql_cache.stats(),
+        "result_cache": ai_agent.result_cache.stats(),
+        "fast_path": ai_agent.intent_router.stats() if ai_agent.intent_router else None,
+        "db_pool": ai_agent.db_pool.stats(),
+        "rollups": ai_agent.query_rewriter.stats() if ai_agent.query_rewriter else None,
+        "columnar": ai_agent.columnar_engine.stats() if ai_agent.columnar_engine else None,
+        "result_handles": ai_agent.result_handles.stats(),
+        "charts": ai_agent.chart_renderer.stats(),
+        "query_guard": ai_agent.query_guard.stats() if ai_agent.query_guard else None,
+        "cancellations": ai_agent.cancellation.stats(),
+        "workload_log": ai_agent.workload_log.stats() if ai_agent.workload_log else None,
+        "llm": ai_agent.llm.stats(),
+        "models": ai_agent.model_stats(),
+        "prompts": ai_agent.prompts.stats()
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint: stage latency histograms, cache hit rates, pool utilization and error counters"""
+    return PlainTextResponse(ai_agent.metrics.render(ai_agent), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/ask", response_model=QuestionResponse)
 async def ask_question(request: QuestionRequest):
     """Ask a question and get a complete response"""
     try:
-        result = ai_agent.process_question(request.question)
+        timings = stage_timings()
+        total_start = time.perf_counter()
+        
+        sql_query, query_args, intent = await resolve_query(request.question, timings)
+        if not sql_query:
+            raise HTTPException(status_code=400, detail="Failed to generate SQL query")
         
-        if "error" in result:
-            raise HTTPException(status_code=400, detail=result["error"])
+        results_df = await run_timed(timings, "query_execution", db_executor, ai_agent.execute_query, *query_args)
         
-        return QuestionResponse(**result)
+        post_query_start = time.perf_counter()
+        response_stage = run_timed(timings, "response_generation", answer_executor(intent),
+                                   ai_agent.generate_answer, request.question, results_df, intent)
+        visualization_stage = run_timed(timings, "visualization", render_executor,
+                                        ai_agent.create_visualization, request.question, results_df,
+                                        request.visualization_format)
+        if ai_agent.pipelined:
+            response, visualization = await asyncio.gather(response_stage, visualization_stage)
+        else:
+            response = await response_stage
+            visualization = await visualization_stage
+        timings["post_query"] = time.perf_counter() - post_query_start
+        timings["total"] = time.perf_counter() - total_start
+        
+        # Serialize here rather than in FastAPI so the time lands in the metrics and Server-Timing
+        serialization_start = time.perf_counter()
+        result = ai_agent.build_result(request.question, sql_query, results_df, response, visualization, timings,
+                                       intent.name if intent else None, request.visualization_format)
+        response = JSONResponse(QuestionResponse(**result).model_dump(mode="json"))
+        timings["serialization"] = time.perf_counter() - serialization_start
+        ai_agent.metrics.observe_stages("/ask", timings)
+        return response
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
 
+@app.post("/ask/batch", response_model=BatchResponse)
+async def ask_batch(request: BatchRequest):
+    """Ask several questions at once; duplicates are answered once and SQL is generated in batched model calls"""
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions given")
+    if len(request.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch")
+    try:
+        result = await run_blocking(llm_executor, ai_agent.process_batch, request.questions,
+                                    request.visualization_format, None)
+        timings = stage_timings()
+        timings.update(result["timings"])
+        
+        serialization_start = time.perf_counter()
+        response = JSONResponse(BatchResponse(**result).model_dump(mode="json"))
+        timings["serialization"] = time.perf_counter() - serialization_start
+        ai_agent.metrics.observe_stages("/ask/batch", timings)
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing batch: {str(e)}")
+
 @app.post("/ask/stream")
 async def ask_question_stream(request: QuestionRequest):
     """Ask a question and get a streaming response"""
     
     async def generate_stream():
+        request_start = time.perf_counter()
+        timings = {}
+        token = ai_agent.cancellation.token()
+        current_token.set(token)
+        visualization_stage = None
         try:
             # Step 1: Generate SQL query
-            yield f"data: {json.dumps({'step': 'generating_sql', 'message': 'Generating SQL query...'})}\n\n"
-            await asyncio.sleep(0.5)
+            yield sse_event({'step': 'generating_sql', 'message': 'Generating SQL query...'})
             
-            sql_query = ai_agent.get_sql_query(request.question)
+            sql_query, query_args, intent = await resolve_query(request.question, timings)
             if not sql_query:
-                yield f"data: {json.dumps({'step': 'error', 'message': 'Failed to generate SQL query'})}\n\n"
+                yield sse_event({'step': 'error', 'message': 'Failed to generate SQL query'})
                 return
             
-            yield f"data: {json.dumps({'step': 'sql_generated', 'sql_query': sql_query})}\n\n"
-            await asyncio.sleep(0.5)
+            yield sse_event({'step': 'sql_generated', 'sql_query': sql_query})
             
             # Step 2: Execute query
-            yield f"data: {json.dumps({'step': 'executing_query', 'message': 'Executing database query...'})}\n\n"
-            await asyncio.sleep(0.5)
+            yield sse_event({'step': 'executing_query', 'message': 'Executing database query...'})
+            
+            results_df = await run_timed(timings, "query_execution", db_executor, ai_agent.execute_query, *query_args)
+            yield sse_event({'step': 'query_executed', 'row_count': len(results_df)})
             
-            results_df = ai_agent.execute_query(sql_query)
-            yield f"data: {json.dumps({'step': 'query_executed', 'row_count': len(results_df)})}\n\n"
-            await asyncio.sleep(0.5)
+            # Render the chart in the background while the answer streams
+            post_query_start = time.perf_counter()
+            visualization_stage = run_timed(timings, "visualization", render_executor,
+                                            ai_agent.create_visualization, request.question, results_df,
+                                            request.visualization_format)
+            if ai_agent.pipelined:
+                visualization_stage = asyncio.ensure_future(visualization_stage)
             
-            # Step 3: Generate response
-            yield f"data: {json.dumps({'step': 'generating_response', 'message': 'Generating human-readable response...'})}\n\n"
-            await asyncio.sleep(0.5)
+            # Step 3: Stream the response as the model produces it
+            yield sse_event({'step': 'generating_response', 'message': 'Generating human-readable response...'})
             
-            response = ai_agent.generate_response(request.question, results_df)
-            yield f"data: {json.dumps({'step': 'response_generated', 'response': response})}\n\n"
-            await asyncio.sleep(0.5)
+            chunks = []
+            time_to_first_token = None
+            response_start = time.perf_counter()
+            async for chunk in stream_blocking(answer_executor(intent), ai_agent.generate_answer_stream,
+                                               request.question, results_df, intent, stage="response_generation"):
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - request_start
+                chunks.append(chunk)
+                yield sse_event({'step': 'response_chunk', 'text': chunk})
+            timings["response_generation"] = time.perf_counter() - response_start
+            
+            response = ''.join(chunks)
+            if time_to_first_token is not None:
+                ai_agent.metrics.observe_time_to_first_token("/ask/stream", time_to_first_token)
+            yield sse_event({'step': 'response_generated', 'response': response,
+                             'time_to_first_token': time_to_first_token})
             
             # Step 4: Create visualization
-            yield f"data: {json.dumps({'step': 'creating_visualization', 'message': 'Creating visualization...'})}\n\n"
-            await asyncio.sleep(0.5)
+            yield sse_event({'step': 'creating_visualization', 'message': 'Creating visualization...'})
             
-            visualization = ai_agent.create_visualization(request.question, results_df)
+            visualization = await visualization_stage
+            timings["post_query"] = time.perf_counter() - post_query_start
+            timings["total"] = time.perf_counter() - request_start
             
             # Final result
-            final_result = {
-                "step": "complete",
-                "question": request.question,
-                "sql_query": sql_query,
-                "response": response,
-                "results": results_df.to_dict('records') if not results_df.empty else [],
-                "visualization": visualization,
-                "row_count": len(results_df)
-            }
+            serialization_start = time.perf_counter()
+            final_result = {"step": "complete"}
+            final_result.update(ai_agent.build_result(request.question, sql_query, results_df, response, visualization,
+                                                      timings, intent.name if intent else None,
+                                                      request.visualization_format))
+            final_result["time_to_first_token"] = time_to_first_token
+            final_result["total_time"] = timings["total"]
+            event = sse_event(final_result)
+            timings["serialization"] = time.perf_counter() - serialization_start
+            ai_agent.metrics.observe_stages("/ask/stream", timings)
             
-            yield f"data: {json.dumps(final_result)}\n\n"
+            yield event
             
         except Exception as e:
-            yield f"data: {json.dumps({'step': 'error', 'message': f'Error: {str(e)}'})}\n\n"
+            yield sse_event({'step': 'error', 'message': f'Error: {str(e)}'})
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client disconnected: interrupt running work and drop what has not started
+            token.cancel()
+            if isinstance(visualization_stage, asyncio.Future):
+                visualization_stage.cancel()
+            elif visualization_stage is not None:
+                visualization_stage.close()
+            raise
     
     return StreamingResponse(
         generate_stream(),
-        media_type="text/plain",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
     )
 
+def result_error(error: Exception) -> HTTPException:
+    """Map result handle lookup failures to HTTP errors"""
+    if isinstance(error, KeyError):
+        return HTTPException(status_code=404, detail=error.args[0])
+    if isinstance(error, StaleResultError):
+        return HTTPException(status_code=410, detail=str(error))
+    return HTTPException(status_code=400, detail=str(error))
+
+@app.get("/results/{handle}")
+async def get_result_page(handle: str, cursor: Optional[str] = None,
+                          limit: Optional[int] = Query(None, ge=1)):
+    """Fetch one page of a truncated result; follow next_cursor for the rest"""
+    try:
+        return await run_blocking(db_executor, ai_agent.fetch_result_page, handle, cursor, limit)
+    except (KeyError, StaleResultError, ValueError) as e:
+        raise result_error(e)
+
+@app.get("/results/{handle}/stream")
+async def stream_result(handle: str):
+    """Stream every row of a truncated result as newline-delimited JSON"""
+    try:
+        ai_agent.result_handle_entry(handle)
+    except (KeyError, StaleResultError) as e:
+        raise result_error(e)
+    
+    async def generate_rows():
+        token = ai_agent.cancellation.token()
+        current_token.set(token)
+        try:
+            # At most a few chunks are buffered, so memory stays flat however many rows there are
+            async for records in stream_blocking(db_executor, ai_agent.iter_result_rows, handle, STREAM_CHUNK_ROWS,
+                                                 max_pending=2, stage="result_stream"):
+                yield ''.join(json.dumps(record, default=str) + '\n' for record in records)
+        except (asyncio.CancelledError, GeneratorExit):
+            # Interrupt the statement if the producer is blocked inside SQLite
+            token.cancel()
+            raise
+    
+    return StreamingResponse(generate_rows(), media_type="application/x-ndjson",
+                             headers={"X-Accel-Buffering": "no"})
+
 @app.get("/example-questions")
 async def get_example_questions():
     """Get example questions for testing"""
@@ -0,0 +1,92 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from db_pool import ConnectionPool
+from columnar_engine import ColumnarEngine
+from query_cache import data_version
+
+# Shapes the model generates for the example questions, plus filters and top-N variants
+QUERIES = [
+    "SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics",
+    "SELECT SUM(ad_sales) / SUM(ad_spend) AS roas FROM ad_sales_metrics",
+    "SELECT CAST(SUM(clicks) AS REAL) / SUM(impressions) AS ctr FROM ad_sales_metrics WHERE date >= '2025-06-05'",
+    "SELECT COUNT(*) AS eligible FROM product_eligibility WHERE eligibility = 1",
+    "SELECT item_id, SUM(ad_spend) / SUM(clicks) AS cpc FROM ad_sales_metrics GROUP BY item_id ORDER BY cpc DESC LIMIT 1",
+    "SELECT item_id, SUM(ad_sales) AS ad_sales FROM ad_sales_metrics GROUP BY item_id ORDER BY ad_sales DESC LIMIT 10",
+    "SELECT date, SUM(ad_sales) AS ad_sales, SUM(ad_spend) AS ad_spend FROM ad_sales_metrics GROUP BY date ORDER BY date",
+    "SELECT date, ROUND(SUM(total_sales), 2) AS total_sales, AVG(total_units_ordered) AS avg_units FROM total_sales_metrics GROUP BY date",
+    "SELECT item_id, MAX(impressions) AS peak_impressions, MIN(date) AS first_seen FROM ad_sales_metrics WHERE item_id IN (1, 2, 3, 5, 8) GROUP BY item_id",
+    "SELECT date, item_id, ad_sales FROM ad_sales_metrics WHERE ad_spend > 0 ORDER BY ad_sales DESC LIMIT 5",
+    "SELECT item_id, COUNT(*) AS checks FROM product_eligibility WHERE eligibility = 0 GROUP BY item_id ORDER BY checks DESC, item_id LIMIT 10",
+]
+
+def run_sqlite(pool, sql):
+    with pool.connection() as conn:
+        return pd.read_sql_query(sql, conn)
+
+def results_match(expected: pd.DataFrame, actual: pd.DataFrame) -> bool:
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    for column in expected.columns:
+        left, right = expected[column].to_numpy(), actual[column].to_numpy()
+        if pd.api.types.is_numeric_dtype(expected[column]) and pd.api.types.is_numeric_dtype(actual[column]):
+            if not np.allclose(left.astype(float), right.astype(float), rtol=1e-9, equal_nan=True):
+                return False
+        elif [None if pd.isna(v) else v for v in left] != [None if pd.isna(v) else v for v in right]:
+            return False
+    return True
+
+def best_of(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the SQLite and columnar execution backends")
+    parser.add_argument("--db", default="product_data.db", help="SQLite database to benchmark against")
+    parser.add_argument("--iterations", type=int, default=5, help="Runs per query; the best time is reported")
+    args = parser.parse_args()
+    
+    pool = ConnectionPool(args.db, size=1)
+    engine = ColumnarEngine(pool)
+    version = data_version(args.db)
+    
+    print("Execution Backend Benchmark")
+    print("=" * 80)
+    start_time = time.perf_counter()
+    engine.store(version)
+    print(f"Columnar load: {engine.stats()['rows']:,} rows in {time.perf_counter() - start_time:.2f}s")
+    print("=" * 80)
+    print(f"{'query':<52} {'sqlite ms':>9} {'columnar ms':>11} {'speedup':>8}")
+    
+    sqlite_total, columnar_total = 0.0, 0.0
+    for sql in QUERIES:
+        expected = run_sqlite(pool, sql)
+        actual = engine.execute(sql, version)
+        label = sql[:50] + ('..' if len(sql) > 50 else '')
+        if actual is None:
+            print(f"{label:<52} fell back to SQLite")
+            continue
+        if not results_match(expected, actual):
+            print(f"{label:<52} ❌ results differ from SQLite")
+            print(expected.head(), actual.head(), sep="\n")
+            continue
+        
+        sqlite_time = best_of(lambda: run_sqlite(pool, sql), args.iterations)
+        columnar_time = best_of(lambda: engine.execute(sql, version), args.iterations)
+        sqlite_total += sqlite_time
+        columnar_total += columnar_time
+        print(f"{label:<52} {sqlite_time * 1000:9.2f} {columnar_time * 1000:11.2f} {sqlite_time / columnar_time:7.1f}x")
+    
+    print("=" * 80)
+    if columnar_total:
+        print(f"Total: sqlite {sqlite_total * 1000:.1f}ms, columnar {columnar_total * 1000:.1f}ms "
+              f"({sqlite_total / columnar_total:.1f}x)")
+    pool.close_all()
+
+if __name__ == "__main__":
+    main()
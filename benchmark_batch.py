@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+
+# Questions a reporting job might loop over, with repeats that differ only in case and punctuation
+QUESTIONS = [
+    ("What is my total sales?", "SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics"),
+    ("Calculate the RoAS (Return on Ad Spend).", "SELECT SUM(ad_sales) / SUM(ad_spend) AS roas FROM ad_sales_metrics WHERE ad_spend > 0"),
+    ("Which product had the highest CPC (Cost Per Click)?", "SELECT item_id, SUM(ad_spend) / SUM(clicks) AS cpc FROM ad_sales_metrics GROUP BY item_id HAVING SUM(clicks) > 0 ORDER BY cpc DESC LIMIT 1"),
+    ("How many products are eligible for advertising?", "SELECT COUNT(DISTINCT item_id) AS eligible FROM product_eligibility WHERE eligibility = 1"),
+    ("What is the total ad spend across all products?", "SELECT SUM(ad_spend) AS ad_spend FROM ad_sales_metrics"),
+    ("Which products have the highest impressions?", "SELECT item_id, SUM(impressions) AS impressions FROM ad_sales_metrics GROUP BY item_id ORDER BY impressions DESC LIMIT 10"),
+    ("What is the average cost per click?", "SELECT SUM(ad_spend) / SUM(clicks) AS cpc FROM ad_sales_metrics WHERE clicks > 0"),
+    ("How many units were sold from advertising?", "SELECT SUM(units_sold) AS units_sold FROM ad_sales_metrics"),
+    ("Which products are not eligible and why?", "SELECT item_id, message FROM product_eligibility WHERE eligibility = 0 GROUP BY item_id, message LIMIT 50"),
+    ("What is the total revenue from ads vs organic sales?", "SELECT SUM(a.ad_sales) AS ad_sales, SUM(t.total_sales) - SUM(a.ad_sales) AS organic_sales FROM ad_sales_metrics a JOIN total_sales_metrics t ON a.item_id = t.item_id AND a.date = t.date"),
+    ("Show daily total sales", "SELECT date, SUM(total_sales) AS total_sales FROM total_sales_metrics GROUP BY date ORDER BY date"),
+    ("What is the click through rate?", "SELECT CAST(SUM(clicks) AS REAL) / SUM(impressions) AS ctr FROM ad_sales_metrics"),
+]
+REPEATS = ["what is my total sales", "WHAT IS THE AVERAGE COST PER CLICK", "Calculate the RoAS (Return on Ad Spend)",
+           "How many products are eligible for advertising", "Show daily total sales!"]
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+class StubModel:
+    """Offline stand-in for Gemini: a fixed round-trip latency plus a little per question in batched prompts"""
+    
+    def __init__(self, latency, per_question, jitter=0.0):
+        self.latency = latency
+        self.per_question = per_question
+        # Up to this fraction of extra latency, derived from the prompt so repeated runs sleep the same
+        self.jitter = jitter
+        self.calls = 0
+        self.sql_by_question = {question.lower().rstrip('?.!'): sql for question, sql in QUESTIONS}
+    
+    def lookup(self, question):
+        return self.sql_by_question.get(question.strip().lower().rstrip('?.!'), QUESTIONS[0][1])
+    
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        numbered = re.findall(r'^\s*(\d+)\. (.+)$', prompt, re.MULTILINE) if 'JSON array' in prompt else []
+        spread = self.jitter * (zlib.crc32(prompt.encode()) / 0xFFFFFFFF)
+        time.sleep(self.latency * (1 + spread) + self.per_question * len(numbered))
+        if numbered:
+            return StubResponse(json.dumps([{"id": int(i), "sql": self.lookup(q)} for i, q in numbered]))
+        if 'SQL expert' in prompt:
+            return StubResponse(self.lookup(re.search(r'Question: (.+)', prompt).group(1)))
+        if stream:
+            return [StubResponse("Here is the answer "), StubResponse("based on the query results.")]
+        return StubResponse("Here is the answer based on the query results.")
+
+def new_agent(model):
+    from ai_agent import AIAgent
+    agent = AIAgent(os.environ['GEMINI_API_KEY'])
+    agent.sql_model = agent.response_model = model
+    return agent
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a sequential /ask-style loop with process_batch (offline, simulated model)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per model round trip")
+    parser.add_argument("--per-question", type=float, default=0.05, help="Extra simulated seconds per question in a batched prompt")
+    parser.add_argument("--copies", type=int, default=2, help="Times the question list is repeated")
+    args = parser.parse_args()
+    
+    os.environ.setdefault('GEMINI_API_KEY', 'offline-benchmark')
+    os.environ.update(SQL_CACHE_PATH='', FAST_PATH_ENABLED='false', WORKLOAD_LOG_PATH='')
+    questions = ([question for question, _ in QUESTIONS] + REPEATS) * args.copies
+    
+    print("Batch Question Benchmark")
+    print("=" * 60)
+    print(f"{len(questions)} questions, simulated model latency {args.latency}s per call")
+    
+    # Before: one question at a time, the way test_agent.py loops over /ask
+    model = StubModel(args.latency, args.per_question)
+    agent = new_agent(model)
+    start_time = time.perf_counter()
+    sequential = [agent.process_question(question) for question in questions]
+    sequential_time = time.perf_counter() - start_time
+    print(f"Sequential loop: {sequential_time:6.2f}s, {model.calls:3d} model calls, "
+          f"{len(questions) / sequential_time:5.2f} questions/sec")
+    
+    # After: one batch with deduplication, batched SQL prompts and concurrent answering
+    model = StubModel(args.latency, args.per_question)
+    agent = new_agent(model)
+    start_time = time.perf_counter()
+    batch = agent.process_batch(questions)
+    batch_time = time.perf_counter() - start_time
+    print(f"process_batch:   {batch_time:6.2f}s, {model.calls:3d} model calls, "
+          f"{len(questions) / batch_time:5.2f} questions/sec "
+          f"({batch['unique_questions']} unique, {batch['sql_model_calls']} SQL calls)")
+    
+    mismatched = [result["question"] for result, expected in zip(batch["results"], sequential)
+                  if result.get("sql_query") != expected.get("sql_query") or result.get("row_count") != expected.get("row_count")]
+    print("=" * 60)
+    if mismatched:
+        print(f"Results differ for {len(mismatched)} questions, e.g. {mismatched[0]}")
+    print(f"Throughput: {sequential_time / batch_time:.1f}x the sequential loop")
+
+if __name__ == "__main__":
+    main()
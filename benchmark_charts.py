@@ -0,0 +1,71 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import plotly.express as px
+from db_pool import ConnectionPool
+from chart_renderer import ChartRenderer
+
+def item_frames(db_path, count):
+    """One daily ad sales series per product, so every chart has different data"""
+    pool = ConnectionPool(db_path, size=1)
+    with pool.connection() as conn:
+        df = pd.read_sql_query("SELECT date, item_id, ad_sales FROM ad_sales_metrics ORDER BY item_id, date", conn)
+    pool.close_all()
+    return [group.reset_index(drop=True) for _, group in list(df.groupby('item_id'))[:count]]
+
+def render_all(renderer, frames, output_format, threads):
+    """Render one chart per frame from a number of request threads and return the wall time"""
+    def render(frame):
+        fig = lambda: px.line(frame, x='date', y='ad_sales', title=f"Ad sales for item {frame['item_id'].iloc[0]}")
+        return renderer.render('item_sales_line', frame, output_format, fig)
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(render, frames))
+    elapsed = time.perf_counter() - start_time
+    if any(result is None for result in results):
+        raise RuntimeError("A chart failed to render")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process PNG rendering with the warm renderer pool and chart cache")
+    parser.add_argument("--db", default="product_data.db", help="SQLite database to chart")
+    parser.add_argument("--charts", type=int, default=40, help="Distinct charts to render")
+    parser.add_argument("--workers", type=int, default=4, help="Renderer processes (and request threads)")
+    args = parser.parse_args()
+    
+    frames = item_frames(args.db, args.charts)
+    print("Chart Rendering Benchmark")
+    print("=" * 60)
+    
+    # Before: every render in the request thread, paying kaleido's startup on the first one
+    in_process = ChartRenderer(workers=0)
+    start_time = time.perf_counter()
+    render_all(in_process, frames[:1], 'png', 1)
+    first_render = time.perf_counter() - start_time
+    in_process_time = render_all(in_process, frames[1:], 'png', args.workers)
+    print(f"In-process PNG:  first render {first_render * 1000:7.1f}ms, "
+          f"{len(frames) - 1} more in {in_process_time:.2f}s")
+    
+    # After: warm worker processes started up front, then the cache for repeats
+    pooled = ChartRenderer(workers=args.workers)
+    start_time = time.perf_counter()
+    pooled.start(wait=True)
+    print(f"Renderer pool:   {args.workers} workers warmed in {time.perf_counter() - start_time:.2f}s (at server startup)")
+    pooled_time = render_all(pooled, frames, 'png', args.workers)
+    stats = pooled.stats()["latency"]["png"]
+    print(f"Pooled PNG:      {len(frames)} renders in {pooled_time:.2f}s, "
+          f"avg {stats['avg_seconds'] * 1000:.1f}ms, max {stats['max_seconds'] * 1000:.1f}ms")
+    cached_time = render_all(pooled, frames, 'png', args.workers)
+    print(f"Cached PNG:      {len(frames)} repeats in {cached_time * 1000:.1f}ms "
+          f"(hit rate {pooled.stats()['cache']['hit_rate']:.0%})")
+    json_time = render_all(ChartRenderer(workers=0), frames, 'plotly_json', args.workers)
+    print(f"Plotly JSON:     {len(frames)} charts in {json_time:.2f}s")
+    pooled.shutdown()
+    
+    print("=" * 60)
+    print(f"Per-chart PNG: {in_process_time / (len(frames) - 1) * 1000:.1f}ms in-process vs "
+          f"{pooled_time / len(frames) * 1000:.1f}ms pooled")
+
+if __name__ == "__main__":
+    main()
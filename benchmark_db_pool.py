@@ -0,0 +1,71 @@
+import argparse
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from db_pool import ConnectionPool
+
+# Representative queries of the shape the agent generates
+BENCHMARK_QUERIES = [
+    "SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics",
+    "SELECT SUM(ad_sales) / SUM(ad_spend) AS roas FROM ad_sales_metrics WHERE ad_spend > 0",
+    "SELECT item_id, SUM(ad_spend) / SUM(clicks) AS cpc FROM ad_sales_metrics GROUP BY item_id HAVING SUM(clicks) > 0 ORDER BY cpc DESC LIMIT 1",
+    "SELECT COUNT(DISTINCT item_id) AS eligible FROM product_eligibility WHERE eligibility = 1",
+    "SELECT item_id, SUM(impressions) AS impressions FROM ad_sales_metrics GROUP BY item_id ORDER BY impressions DESC LIMIT 10",
+]
+
+def run_open_per_call(db_path, sql_query):
+    """Baseline: the original connect / query / close per question"""
+    conn = sqlite3.connect(db_path)
+    df = pd.read_sql_query(sql_query, conn)
+    conn.close()
+    return df
+
+def run_pooled(pool, sql_query):
+    """Pooled: borrow a long-lived read-only connection"""
+    with pool.connection() as conn:
+        return pd.read_sql_query(sql_query, conn)
+
+def measure(label, func, iterations, threads):
+    """Run the query mix and report queries/sec"""
+    work = [BENCHMARK_QUERIES[i % len(BENCHMARK_QUERIES)] for i in range(iterations)]
+
+    start_time = time.perf_counter()
+    if threads == 1:
+        for sql_query in work:
+            func(sql_query)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(func, work))
+    elapsed = time.perf_counter() - start_time
+
+    qps = iterations / elapsed
+    print(f"{label:<20} {iterations} queries in {elapsed:.2f}s -> {qps:,.1f} queries/sec")
+    return qps
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare open-per-call SQLite access with the connection pool")
+    parser.add_argument("--db", default="product_data.db", help="Path to the product database")
+    parser.add_argument("--iterations", type=int, default=2000, help="Number of queries per run")
+    parser.add_argument("--threads", type=int, default=4, help="Concurrent worker threads")
+    args = parser.parse_args()
+
+    print("SQLite Connection Pool Benchmark")
+    print("=" * 60)
+
+    pool = ConnectionPool(args.db, size=args.threads)
+
+    # Warm the OS page cache so both runs start from the same state
+    for sql_query in BENCHMARK_QUERIES:
+        run_open_per_call(args.db, sql_query)
+
+    baseline = measure("open-per-call", lambda q: run_open_per_call(args.db, q), args.iterations, args.threads)
+    pooled = measure("pooled (mode=ro)", lambda q: run_pooled(pool, q), args.iterations, args.threads)
+
+    print("=" * 60)
+    print(f"Speedup: {pooled / baseline:.2f}x")
+    print(f"Pool stats: {pool.stats()}")
+    pool.close_all()
+
+if __name__ == "__main__":
+    main()
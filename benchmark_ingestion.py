@@ -0,0 +1,100 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from database_setup import rebuild_database, ingest_incremental
+
+def synthetic_frames(items, days, seed=42):
+    """Build ad/total/eligibility frames shaped like the real exports: one row per item per day"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2024-01-01', periods=days, freq='D')
+    
+    date_col = np.repeat(dates.values, items)
+    item_col = np.tile(np.arange(items), days)
+    rows = len(date_col)
+    
+    impressions = rng.integers(0, 5000, rows)
+    clicks = rng.binomial(impressions, 0.01)
+    ad_sales_df = pd.DataFrame({
+        'date': date_col,
+        'item_id': item_col,
+        'ad_sales': np.round(rng.gamma(2.0, 50.0, rows), 2),
+        'impressions': impressions,
+        'ad_spend': np.round(clicks * rng.uniform(0.5, 3.0, rows), 2),
+        'clicks': clicks,
+        'units_sold': rng.poisson(2, rows),
+    })
+    
+    # Organic sales are reported for roughly a fifth of the items each day
+    organic = rng.random(rows) < 0.2
+    total_sales_df = pd.DataFrame({
+        'date': date_col[organic],
+        'item_id': item_col[organic],
+        'total_sales': np.round(rng.gamma(2.0, 150.0, organic.sum()), 2),
+        'total_units_ordered': rng.poisson(3, organic.sum()),
+    })
+    
+    checks = pd.date_range('2024-01-01 08:50', periods=max(days // 7, 1), freq='7D')
+    eligibility_df = pd.DataFrame({
+        'eligibility_datetime_utc': np.repeat(checks.values, items),
+        'item_id': np.tile(np.arange(items), len(checks)),
+        'eligibility': rng.integers(0, 2, items * len(checks)),
+        'message': None,
+    })
+    
+    return {
+        'ad_sales_metrics': ad_sales_df,
+        'total_sales_metrics': total_sales_df,
+        'product_eligibility': eligibility_df,
+    }
+
+def drop_last_day(frames):
+    """The previous night's export: everything except the newest day"""
+    previous = dict(frames)
+    for table_name in ('ad_sales_metrics', 'total_sales_metrics'):
+        df = frames[table_name]
+        previous[table_name] = df[df['date'] < df['date'].max()]
+    return previous
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a full rebuild with incremental ingestion of one new day")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Approximate ad_sales_metrics rows")
+    parser.add_argument("--items", type=int, default=2000, help="Products per day")
+    args = parser.parse_args()
+    
+    days = max(args.rows // args.items, 2)
+    print("Ingestion Benchmark")
+    print("=" * 60)
+    print(f"Generating {args.items} items x {days} days...")
+    frames = synthetic_frames(args.items, days)
+    previous = drop_last_day(frames)
+    total_rows = sum(len(df) for df in frames.values())
+    print(f"Synthetic export: {total_rows:,} rows across {len(frames)} tables")
+    
+    workdir = tempfile.mkdtemp(prefix="ingestion_benchmark_")
+    try:
+        # Full rebuild of today's export
+        full_db = os.path.join(workdir, "full.db")
+        start_time = time.perf_counter()
+        rebuild_database(frames, full_db)
+        full_time = time.perf_counter() - start_time
+        print(f"Full rebuild:        {full_time:8.2f}s ({total_rows / full_time:,.0f} rows/sec)")
+        
+        # Incremental: yesterday's database plus today's export
+        incremental_db = os.path.join(workdir, "incremental.db")
+        rebuild_database(previous, incremental_db)
+        start_time = time.perf_counter()
+        written = ingest_incremental(frames, incremental_db)
+        incremental_time = time.perf_counter() - start_time
+        print(f"Incremental ingest:  {incremental_time:8.2f}s ({sum(written.values()):,} rows written)")
+        
+        print("=" * 60)
+        print(f"Speedup: {full_time / incremental_time:.1f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+from benchmark_batch import QUESTIONS, REPEATS, StubModel
+
+PERCENTILES = (50, 95, 99)
+DEFAULT_MIX = "/ask=6,/ask/stream=3,/ask/batch=1"
+
+def serve(args):
+    """Run api_server on args.port with the stub model in place of Gemini (main starts this in a subprocess)"""
+    import uvicorn
+    import api_server
+    agent = api_server.get_agent()
+    agent.sql_model = agent.response_model = StubModel(args.latency, args.per_question, args.jitter)
+    uvicorn.run(api_server.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(args):
+    """Start the stubbed API server and wait until /health answers"""
+    import httpx
+    
+    port = args.port or free_port()
+    env = dict(os.environ)
+    env.setdefault('GEMINI_API_KEY', 'offline-benchmark')
+    # Keep the benchmark from reading or writing the on-disk SQL cache and workload log
+    env.update(SQL_CACHE_PATH='', WORKLOAD_LOG_PATH='')
+    if not args.fast_path:
+        env['FAST_PATH_ENABLED'] = 'false'
+    command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port),
+               "--latency", str(args.latency), "--per-question", str(args.per_question), "--jitter", str(args.jitter)]
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with code {process.returncode} (see --server-log)")
+        try:
+            if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"API server did not become healthy within {args.startup_timeout}s")
+
+def parse_mix(mix):
+    """'/ask=6,/ask/stream=3' -> {'/ask': 6.0, '/ask/stream': 3.0}"""
+    weights = {}
+    for part in mix.split(','):
+        endpoint, _, weight = part.partition('=')
+        weights[endpoint.strip()] = float(weight or 1)
+    unknown = set(weights) - {"/ask", "/ask/stream", "/ask/batch"}
+    if unknown:
+        raise ValueError(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+def build_schedule(count, weights, batch_size, seed):
+    """The same seed always yields the same sequence of endpoints and questions"""
+    rng = random.Random(seed)
+    questions = [question for question, _ in QUESTIONS] + REPEATS
+    endpoints, endpoint_weights = list(weights), list(weights.values())
+    schedule = []
+    for _ in range(count):
+        endpoint = rng.choices(endpoints, endpoint_weights)[0]
+        if endpoint == "/ask/batch":
+            payload = {"questions": rng.sample(questions, min(batch_size, len(questions)))}
+        else:
+            payload = {"question": rng.choice(questions)}
+        schedule.append((endpoint, payload))
+    return schedule
+
+async def send(client, endpoint, payload):
+    """Send one request and return its latency, status and the stage timings the server reported"""
+    start_time = time.perf_counter()
+    stages, ok = {}, False
+    try:
+        if endpoint == "/ask/stream":
+            async with client.stream("POST", endpoint, json=payload) as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: "):])
+                    if event.get("step") == "complete":
+                        ok = True
+                        stages = dict(event.get("timings") or {})
+                        if event.get("time_to_first_token") is not None:
+                            stages["time_to_first_token"] = event["time_to_first_token"]
+        else:
+            response = await client.post(endpoint, json=payload)
+            ok = response.status_code == 200
+            if ok:
+                stages = response.json().get("timings") or {}
+        status = response.status_code
+    except Exception as e:
+        status = type(e).__name__
+    return {"endpoint": endpoint, "status": status, "ok": ok,
+            "seconds": time.perf_counter() - start_time, "stages": stages}
+
+async def run_load(url, schedule, concurrency, timeout):
+    """Closed-loop load: `concurrency` clients each send their next request as soon as the last one returns"""
+    import httpx
+    
+    samples = []
+    position = 0
+    
+    async def client_loop(client):
+        nonlocal position
+        while position < len(schedule):
+            endpoint, payload = schedule[position]
+            position += 1
+            samples.append(await send(client, endpoint, payload))
+    
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        start_time = time.perf_counter()
+        await asyncio.gather(*[client_loop(client) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start_time
+        try:
+            server_stats = (await client.get("/stats")).json()
+        except Exception:
+            server_stats = {}
+    return samples, elapsed, server_stats
+
+def distribution(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=float)
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary.update(mean=float(values.mean()), max=float(values.max()))
+    return summary
+
+def summarize(samples, elapsed):
+    """Throughput and latency percentiles overall, per endpoint and per stage"""
+    endpoints = {}
+    for endpoint in sorted({sample["endpoint"] for sample in samples}):
+        matching = [sample for sample in samples if sample["endpoint"] == endpoint]
+        succeeded = [sample for sample in matching if sample["ok"]]
+        stage_names = sorted({stage for sample in succeeded for stage in sample["stages"]})
+        endpoints[endpoint] = {
+            "requests": len(matching),
+            "errors": len(matching) - len(succeeded),
+            "throughput_rps": len(succeeded) / elapsed if elapsed else 0.0,
+            "latency": distribution([sample["seconds"] for sample in succeeded]),
+            "stages": {stage: distribution([sample["stages"][stage] for sample in succeeded if stage in sample["stages"]])
+                       for stage in stage_names},
+        }
+    succeeded = [sample for sample in samples if sample["ok"]]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(succeeded),
+        "wall_seconds": elapsed,
+        "throughput_rps": len(succeeded) / elapsed if elapsed else 0.0,
+        "latency": distribution([sample["seconds"] for sample in succeeded]),
+        "endpoints": endpoints,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(report, baseline, tolerance):
+    """List latency percentiles and throughput that got worse than the baseline by more than `tolerance`"""
+    regressions = []
+    for endpoint, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous or not current["latency"] or not previous.get("latency"):
+            continue
+        for percentile in (f"p{p}" for p in PERCENTILES):
+            before, after = previous["latency"][percentile], current["latency"][percentile]
+            if after > before * (1 + tolerance):
+                regressions.append(f"{endpoint} {percentile}: {before * 1000:.1f}ms -> {after * 1000:.1f}ms")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{endpoint} throughput: {previous['throughput_rps']:.2f} -> "
+                               f"{current['throughput_rps']:.2f} req/s")
+    return regressions
+
+def print_report(report):
+    def ms(summary, key):
+        return f"{summary[key] * 1000:8.1f}" if summary else "       -"
+    
+    print(f"{'endpoint / stage':32s} {'count':>6s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s}")
+    for endpoint, data in report["endpoints"].items():
+        latency = data["latency"]
+        print(f"{endpoint:32s} {data['requests']:6d} {ms(latency, 'p50')} {ms(latency, 'p95')} {ms(latency, 'p99')}"
+              f"  ({data['errors']} errors, {data['throughput_rps']:.2f} req/s)")
+        for stage, summary in data["stages"].items():
+            print(f"  {stage:30s} {'':6s} {ms(summary, 'p50')} {ms(summary, 'p95')} {ms(summary, 'p99')}")
+    print("=" * 70)
+    print(f"{report['requests']} requests in {report['wall_seconds']:.2f}s, {report['errors']} errors, "
+          f"{report['throughput_rps']:.2f} req/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test api_server offline against a deterministic stub model")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests to send")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent before measuring (not reported)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients sending requests at once")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights, e.g. /ask=6,/ask/stream=3,/ask/batch=1")
+    parser.add_argument("--batch-size", type=int, default=5, help="Questions per /ask/batch request")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per model round trip")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Up to this fraction of extra latency per prompt")
+    parser.add_argument("--per-question", type=float, default=0.02, help="Extra simulated seconds per question in a batched prompt")
+    parser.add_argument("--fast-path", action="store_true",
+                        help="Answer known KPI questions from SQL templates, as a default server does, instead of calling the model")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request schedule")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--url", help="Load an already running server instead of starting a stubbed one")
+    parser.add_argument("--port", type=int, default=0, help="Port for the stubbed server (default: any free port)")
+    parser.add_argument("--startup-timeout", type=float, default=120.0, help="Seconds to wait for /health")
+    parser.add_argument("--server-log", help="Write the stubbed server's output to this file")
+    parser.add_argument("--output", default="load_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against --baseline (0.2 = 20%%)")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.serve:
+        serve(args)
+        return
+    
+    weights = parse_mix(args.mix)
+    schedule = build_schedule(args.warmup + args.requests, weights, args.batch_size, args.seed)
+    
+    print("Load Test")
+    print("=" * 70)
+    process, url = (None, args.url) if args.url else start_server(args)
+    try:
+        if not args.url:
+            print(f"Stub model: {args.latency}s per call (+{args.jitter:.0%} jitter), server at {url}")
+        print(f"{args.requests} requests ({args.warmup} warm-up) from {args.concurrency} clients, mix {args.mix}")
+        print("=" * 70)
+        if args.warmup:
+            asyncio.run(run_load(url, schedule[:args.warmup], args.concurrency, args.timeout))
+        samples, elapsed, server_stats = asyncio.run(run_load(url, schedule[args.warmup:], args.concurrency, args.timeout))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+    
+    report = summarize(samples, elapsed)
+    report["config"] = {key: value for key, value in vars(args).items()
+                        if key not in ("serve", "output", "baseline", "server_log")}
+    report["revision"] = git_revision()
+    report["server"] = {key: server_stats.get(key) for key in ("llm", "db_pool", "sql_cache", "result_cache")}
+    print_report(report)
+    
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import time
+from dotenv import load_dotenv
+from db_pool import ConnectionPool
+from result_pager import read_bounded
+from result_digest import ResultDigest, estimate_tokens
+
+load_dotenv()
+
+# Result shapes behind the example questions, from a single value up to raw row dumps
+QUERIES = {
+    "total sales": "SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics",
+    "top 10 items": "SELECT item_id, SUM(ad_sales) AS ad_sales FROM ad_sales_metrics GROUP BY item_id ORDER BY ad_sales DESC LIMIT 10",
+    "daily sales": "SELECT date, SUM(ad_sales) AS ad_sales, SUM(ad_spend) AS ad_spend FROM ad_sales_metrics GROUP BY date ORDER BY date",
+    "per item roas": "SELECT item_id, SUM(ad_sales) AS ad_sales, SUM(ad_spend) AS ad_spend, SUM(ad_sales) / SUM(ad_spend) AS roas FROM ad_sales_metrics GROUP BY item_id",
+    "all ad rows": "SELECT * FROM ad_sales_metrics",
+    "eligibility log": "SELECT * FROM product_eligibility ORDER BY eligibility_datetime_utc",
+}
+
+QUESTION = "Summarize these results"
+
+def timed(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start_time)
+    return result, min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare response prompt size and latency with and without result digests")
+    parser.add_argument("--db", default="product_data.db", help="SQLite database to query")
+    parser.add_argument("--max-rows", type=int, default=int(os.getenv('MAX_RESULT_ROWS', '500')), help="Result row cap")
+    parser.add_argument("--budget", type=int, default=int(os.getenv('RESPONSE_TOKEN_BUDGET', '1500')), help="Digest token budget")
+    parser.add_argument("--iterations", type=int, default=5, help="Runs per prompt build; the best time is reported")
+    parser.add_argument("--live", action="store_true", help="Also time Gemini responses for both prompts (needs GEMINI_API_KEY)")
+    args = parser.parse_args()
+    
+    pool = ConnectionPool(args.db, size=1)
+    digest = ResultDigest(token_budget=args.budget)
+    model = None
+    if args.live:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+        model = genai.GenerativeModel('gemini-2.5-flash')
+    
+    def agent_prompt(results_text):
+        return f"You are a data analyst.\nQuestion: {QUESTION}\nQuery Results:\n{results_text}\nProvide a comprehensive answer."
+    
+    print("Response Prompt Digest Benchmark")
+    print("=" * 88)
+    print(f"{'result':<16} {'rows':>6} {'tokens before':>13} {'tokens after':>12} {'build ms before':>15} {'build ms after':>14}")
+    
+    totals = [0, 0]
+    for label, sql in QUERIES.items():
+        with pool.connection() as conn:
+            df, total_rows = read_bounded(conn, sql, None, args.max_rows)
+        df.attrs["total_rows"] = total_rows
+        
+        raw, raw_time = timed(lambda: agent_prompt(df.to_string() if not df.empty else "No results found"), args.iterations)
+        digested, digest_time = timed(lambda: agent_prompt(digest.build(df)), args.iterations)
+        raw_tokens, digest_tokens = estimate_tokens(raw), estimate_tokens(digested)
+        totals[0] += raw_tokens
+        totals[1] += digest_tokens
+        print(f"{label:<16} {total_rows:>6} {raw_tokens:>13,} {digest_tokens:>12,} "
+              f"{raw_time * 1000:>15.2f} {digest_time * 1000:>14.2f}")
+        
+        if model is not None:
+            for name, prompt in (("before", raw), ("after", digested)):
+                start_time = time.perf_counter()
+                response = model.generate_content(prompt)
+                usage = getattr(response, "usage_metadata", None)
+                prompt_tokens = getattr(usage, "prompt_token_count", "?")
+                print(f"    {name:<6} gemini {time.perf_counter() - start_time:6.2f}s, {prompt_tokens} prompt tokens")
+    
+    print("=" * 88)
+    print(f"Estimated prompt tokens: {totals[0]:,} before, {totals[1]:,} after "
+          f"({totals[0] / max(totals[1], 1):.1f}x smaller)")
+    pool.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import time
+from dotenv import load_dotenv
+from benchmark_batch import QUESTIONS
+from prompt_builder import LEGACY_SCHEMA, PromptBuilder, compact_schema
+from result_digest import estimate_tokens
+
+load_dotenv()
+
+def valid_sql(conn, sql):
+    try:
+        conn.execute(f"EXPLAIN {sql}")
+        return True
+    except sqlite3.Error:
+        return False
+
+def strip_fence(text):
+    return text.strip().removeprefix('```sql').removeprefix('```').removesuffix('```').strip()
+
+def time_live(backend, build_prompt, questions, conn):
+    """Median latency, total prompt tokens reported by Gemini and how many answers were valid SQL"""
+    latencies, valid = [], 0
+    before = backend.stats()["prompt_tokens"]
+    for question in questions:
+        start_time = time.perf_counter()
+        response = backend.generate_content(build_prompt(question))
+        latencies.append(time.perf_counter() - start_time)
+        valid += valid_sql(conn, strip_fence(response.text))
+    return statistics.median(latencies), backend.stats()["prompt_tokens"] - before, valid
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SQL prompt size (and, live, latency) of the original and compact prompts")
+    parser.add_argument("--db", default="product_data.db", help="Database the compact schema is read from")
+    parser.add_argument("--batch-size", type=int, default=10, help="Questions per batched prompt")
+    parser.add_argument("--live", action="store_true", help="Also time Gemini on both prompts (needs GEMINI_API_KEY)")
+    parser.add_argument("--model", default=os.getenv('SQL_MODEL_NAME', os.getenv('MODEL_NAME', 'gemini-1.5-flash')),
+                        help="Gemini model for --live")
+    args = parser.parse_args()
+    
+    conn = sqlite3.connect(args.db)
+    legacy = PromptBuilder(LEGACY_SCHEMA, compact=False)
+    compact = PromptBuilder(compact_schema(conn))
+    questions = [question for question, _ in QUESTIONS]
+    batch = questions[:args.batch_size]
+    
+    print("SQL Prompt Benchmark")
+    print("=" * 72)
+    print("Compact schema:")
+    print(compact.schema)
+    print("=" * 72)
+    print(f"{'prompt':<28} {'original tokens':>15} {'compact tokens':>14} {'static prefix':>13}")
+    
+    single = [(estimate_tokens(legacy.sql_prompt(q)), estimate_tokens(compact.sql_prompt(q))) for q in questions]
+    legacy_single = sum(before for before, _ in single) / len(single)
+    compact_single = sum(after for _, after in single) / len(single)
+    prefix_tokens = compact.stats()["prefix_tokens"]
+    print(f"{'single question (mean)':<28} {legacy_single:>15.0f} {compact_single:>14.0f} {prefix_tokens:>13}")
+    legacy_batch = estimate_tokens(legacy.batch_sql_prompt(batch))
+    compact_batch = estimate_tokens(compact.batch_sql_prompt(batch))
+    print(f"{f'batch of {len(batch)}':<28} {legacy_batch:>15} {compact_batch:>14} {prefix_tokens:>13}")
+    print("=" * 72)
+    print(f"Estimated prompt tokens per question: {legacy_single:.0f} -> {compact_single:.0f} "
+          f"({legacy_single / compact_single:.1f}x smaller); {compact_single - prefix_tokens:.0f} of them vary per "
+          f"question, the rest is a prefix a context cache can hold")
+    cache_min = int(os.getenv('SQL_MODEL_CONTEXT_CACHE_MIN_TOKENS', os.getenv('MODEL_CONTEXT_CACHE_MIN_TOKENS', '32768')))
+    print(f"Explicit context caching: {'used' if prefix_tokens >= cache_min else 'not used'} "
+          f"(prefix {prefix_tokens} tokens, minimum {cache_min})")
+    
+    if args.live:
+        from model_backends import GeminiBackend
+        backend = GeminiBackend(args.model, api_key=os.getenv('GEMINI_API_KEY'))
+        print(f"Gemini ({args.model}), {len(questions)} questions each:")
+        for name, builder in (("original", legacy), ("compact", compact)):
+            latency, tokens, valid = time_live(backend, builder.sql_prompt, questions, conn)
+            print(f"  {name:<9} median {latency:5.2f}s, {tokens / len(questions):6.0f} prompt tokens/question, "
+                  f"{valid}/{len(questions)} valid SQL")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
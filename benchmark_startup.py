@@ -0,0 +1,101 @@
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+# A fast-path question: answered from a SQL template, so no API key is needed, but it still builds a chart
+FIRST_QUESTION = "What is the total ad spend?"
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import api_server; print(time.perf_counter() - start)"
+
+def server_env():
+    env = dict(os.environ)
+    env.setdefault('GEMINI_API_KEY', 'offline-benchmark')
+    env.update(SQL_CACHE_PATH='', WORKLOAD_LOG_PATH='')
+    return env
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure_import(app_dir):
+    """Seconds to import api_server in a fresh interpreter"""
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=app_dir, env=server_env(),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def measure_server(app_dir, timeout):
+    """Start uvicorn and time the first healthy /health, the background warm-up and the first answered question"""
+    import httpx
+    
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    start_time = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "api_server:app", "--port", str(port),
+                                "--log-level", "warning"],
+                               cwd=app_dir, env=server_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings = {"healthy": None, "warmed_up": None, "first_answer": None}
+    try:
+        deadline = start_time + timeout
+        while timings["healthy"] is None and time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            try:
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    timings["healthy"] = time.perf_counter() - start_time
+            except httpx.HTTPError:
+                time.sleep(0.01)
+        if timings["healthy"] is None:
+            raise RuntimeError(f"Server was not healthy within {timeout}s")
+        
+        # The first request pays for whatever the warm-up has not loaded yet
+        ask_start = time.perf_counter()
+        httpx.post(f"{url}/ask", json={"question": FIRST_QUESTION}, timeout=timeout).raise_for_status()
+        timings["first_answer"] = time.perf_counter() - ask_start
+        
+        while time.perf_counter() < deadline:
+            health = httpx.get(f"{url}/health", timeout=1).json()
+            if "warmed_up" not in health:
+                break
+            if health["warmed_up"]:
+                timings["warmed_up"] = time.perf_counter() - start_time
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return timings
+
+def describe(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return "     -"
+    return f"{statistics.median(values):6.2f}s (min {min(values):.2f}s)"
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure api_server import time and time to the first healthy /health")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters / server starts per measurement")
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Checkout to measure, e.g. a worktree of an older commit to compare against")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for the server")
+    args = parser.parse_args()
+    
+    print("Startup Benchmark")
+    print("=" * 60)
+    print(f"{args.app_dir}, {args.runs} runs each (median)")
+    
+    imports = [measure_import(args.app_dir) for _ in range(args.runs)]
+    servers = [measure_server(args.app_dir, args.timeout) for _ in range(args.runs)]
+    
+    print("=" * 60)
+    print(f"import api_server:        {describe(imports)}")
+    print(f"start to healthy /health: {describe([server['healthy'] for server in servers])}")
+    print(f"start to warmed up:       {describe([server['warmed_up'] for server in servers])}")
+    print(f"first /ask after healthy: {describe([server['first_answer'] for server in servers])}")
+
+if __name__ == "__main__":
+    main()
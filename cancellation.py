@@ -0,0 +1,116 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+
+class Cancelled(Exception):
+    """The request that owned this work went away"""
+
+
+class CancelToken:
+    """Cancellation flag for one request, with callbacks that interrupt whatever is running for it"""
+    
+    def __init__(self, tracker: "CancellationTracker"):
+        self.tracker = tracker
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_id = 0
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def cancel(self) -> None:
+        """Mark the request cancelled and run every registered interrupt callback once"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+        self.tracker.record_request()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error cancelling work: {e}")
+    
+    def check(self, stage: str) -> None:
+        """Raise Cancelled instead of starting a stage for a request that has gone away"""
+        if self.cancelled:
+            self.tracker.record(stage, "skipped")
+            raise Cancelled(stage)
+    
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], Any]):
+        """Run callback if the request is cancelled while this block is executing"""
+        with self._lock:
+            callback_id = self._next_id
+            self._next_id += 1
+            self._callbacks[callback_id] = callback
+            already_cancelled = self._event.is_set()
+        if already_cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.pop(callback_id, None)
+
+
+class CancellationTracker:
+    """Issues cancel tokens and counts the work they skipped or interrupted, per stage"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._stages = {}
+    
+    def token(self) -> CancelToken:
+        return CancelToken(self)
+    
+    def record_request(self) -> None:
+        with self._lock:
+            self._requests += 1
+    
+    def record(self, stage: str, outcome: str) -> None:
+        """Count a stage that was skipped, abandoned to finish unobserved, or interrupted while running"""
+        with self._lock:
+            counts = self._stages.setdefault(stage, {"skipped": 0, "abandoned": 0, "interrupted": 0})
+            counts[outcome] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return cancelled requests and the stage work reclaimed from them"""
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "stages": {stage: dict(counts) for stage, counts in self._stages.items()},
+            }
+
+
+# Token of the request the current thread is working for; copied into worker threads with the context
+current_token: ContextVar[Optional[CancelToken]] = ContextVar('cancel_token', default=None)
+
+
+def is_cancelled() -> bool:
+    token = current_token.get()
+    return token is not None and token.cancelled
+
+
+def record_interrupted(stage: str) -> None:
+    """Count a running stage that stopped early because its request was cancelled"""
+    token = current_token.get()
+    if token is not None:
+        token.tracker.record(stage, "interrupted")
+
+
+@contextmanager
+def interrupt_on_cancel(callback: Callable[[], Any]):
+    """Register an interrupt callback with the current request's token, if there is one"""
+    token = current_token.get()
+    if token is None:
+        yield
+        return
+    with token.on_cancel(callback):
+        yield
@@ -0,0 +1,223 @@
+import base64
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+from cancellation import Cancelled, interrupt_on_cancel, record_interrupted
+
+# plotly_json is rendered by the client; png goes through kaleido on the server and is opt-in
+VISUALIZATION_FORMATS = ('plotly_json', 'png')
+
+# Trace attributes that carry the data arrays worth compacting
+DATA_ATTRIBUTES = ('x', 'y', 'z')
+
+
+def round_significant(values: np.ndarray, digits: int) -> list:
+    """Round floats to a number of significant digits so they serialize as short JSON numbers"""
+    return [None if np.isnan(value) else float(f"{value:.{digits}g}") for value in values]
+
+
+def compact_figure(fig: go.Figure, significant_digits: int = 6) -> go.Figure:
+    """Drop the embedded theme template and trim float precision in trace data"""
+    # The default template is most of the JSON; clients apply their own theme anyway
+    fig.update_layout(template=None)
+    for trace in fig.data:
+        for attribute in DATA_ATTRIBUTES:
+            values = trace[attribute] if attribute in trace else None
+            if values is None:
+                continue
+            array = np.asarray(values)
+            if array.dtype.kind == 'f' and array.ndim == 1:
+                trace[attribute] = round_significant(array, significant_digits)
+    return fig
+
+
+def encode_figure(fig: go.Figure, output_format: str = 'plotly_json', compact: bool = True,
+                  significant_digits: int = 6) -> Optional[str]:
+    """Serialize a figure as Plotly JSON for client-side rendering, or as a base64 PNG"""
+    if output_format not in VISUALIZATION_FORMATS:
+        raise ValueError(f"Unknown visualization format: {output_format}")
+    if output_format == 'png':
+        return base64.b64encode(fig.to_image(format="png")).decode()
+    if compact:
+        fig = compact_figure(fig, significant_digits)
+    return fig.to_json()
+
+
+def png_from_json(figure_json: str) -> str:
+    """Render a serialized figure to a base64 PNG; runs inside a renderer worker process"""
+    # The figure was validated when it was built, so hand kaleido the plain dict
+    return base64.b64encode(pio.to_image(json.loads(figure_json), format="png", validate=False)).decode()
+
+
+def warm_renderer() -> None:
+    """Start kaleido in a new worker so the first real render skips its startup cost"""
+    try:
+        go.Figure(go.Scatter(x=[0], y=[0])).to_image(format="png")
+    except Exception as e:
+        print(f"Error warming chart renderer: {e}")
+
+
+def worker_ready() -> bool:
+    return True
+
+
+def data_hash(df: pd.DataFrame) -> str:
+    """Content hash of a result: column names, dtypes and every value"""
+    digest = hashlib.sha256()
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+class ChartCache:
+    """Memory-bounded LRU of encoded charts keyed on chart type, output format and result data"""
+    
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+    
+    def put(self, key: str, value: str) -> None:
+        """Store an encoded chart, evicting least recently used entries past the byte budget"""
+        size = len(value)
+        with self._lock:
+            if size > self.max_bytes:
+                return
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats["evictions"] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current memory usage"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+
+class ChartRenderer:
+    """Encodes figures through the chart cache, sending PNG renders to a pool of warm worker processes"""
+    
+    def __init__(self, workers: int = 2, cache_bytes: int = 32 * 1024 * 1024,
+                 compact: bool = True, significant_digits: int = 6):
+        self.workers = workers
+        self.compact = compact
+        self.significant_digits = significant_digits
+        self.cache = ChartCache(cache_bytes)
+        
+        self._pool = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._latency = {output_format: {"renders": 0, "total_seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0}
+                         for output_format in VISUALIZATION_FORMATS}
+    
+    def start(self, wait: bool = False) -> None:
+        """Launch the renderer processes and warm kaleido in each, optionally blocking until they are ready"""
+        if self.workers <= 0 or self._pool is not None:
+            return
+        # Forked workers start every process up front, while the server has few threads,
+        # and do not re-import the server module the way spawned workers would
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=warm_renderer)
+        ready = [self._pool.submit(worker_ready) for _ in range(self.workers)]
+        if wait:
+            for future in ready:
+                future.result()
+    
+    def shutdown(self) -> None:
+        """Stop the renderer processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+    
+    def render(self, chart_type: str, results_df: pd.DataFrame, output_format: str,
+               build_figure: Callable[[], Optional[go.Figure]]) -> Optional[str]:
+        """Return the encoded chart from the cache, or build it and encode it (PNG on a worker process)"""
+        if output_format not in VISUALIZATION_FORMATS:
+            raise ValueError(f"Unknown visualization format: {output_format}")
+        key = f"{chart_type}:{output_format}:{int(self.compact)}:{data_hash(results_df)}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        
+        start = time.perf_counter()
+        fig = build_figure()
+        if fig is None:
+            return None
+        pool = self._pool
+        if output_format == 'png' and pool is not None:
+            with self._lock:
+                self._in_flight += 1
+            try:
+                future = pool.submit(png_from_json, fig.to_json())
+                # A render still queued for a worker is dropped if the request goes away
+                with interrupt_on_cancel(future.cancel):
+                    encoded = future.result()
+            except CancelledError:
+                record_interrupted("visualization")
+                raise Cancelled("visualization")
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+        else:
+            encoded = encode_figure(fig, output_format, self.compact, self.significant_digits)
+        self.record(output_format, time.perf_counter() - start)
+        
+        self.cache.put(key, encoded)
+        return encoded
+    
+    def record(self, output_format: str, seconds: float) -> None:
+        with self._lock:
+            latency = self._latency[output_format]
+            latency["renders"] += 1
+            latency["total_seconds"] += seconds
+            latency["max_seconds"] = max(latency["max_seconds"], seconds)
+            latency["last_seconds"] = seconds
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return render latency per format, worker queue depth and cache counters"""
+        with self._lock:
+            latency = {}
+            for output_format, values in self._latency.items():
+                latency[output_format] = dict(values)
+                latency[output_format]["avg_seconds"] = (
+                    values["total_seconds"] / values["renders"] if values["renders"] else 0.0
+                )
+            in_flight = self._in_flight
+        return {
+            "workers": self.workers if self._pool is not None else 0,
+            "in_flight": in_flight,
+            "queue_depth": max(in_flight - self.workers, 0) if self._pool is not None else 0,
+            "latency": latency,
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,758 @@
+import re
+import threading
+import time
+from typing import Dict, Any, Optional, List, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+# Raw tables loaded into the columnar store
+COLUMNAR_TABLES = ("ad_sales_metrics", "total_sales_metrics", "product_eligibility")
+
+AGGREGATES = {"sum", "total", "avg", "min", "max", "count"}
+SCALAR_FUNCTIONS = {"round", "abs", "coalesce", "ifnull", "nullif"}
+CLAUSE_KEYWORDS = {"from", "where", "group", "having", "order", "limit", "offset", "join", "inner",
+                   "left", "right", "cross", "natural", "union", "intersect", "except", "window"}
+RESERVED = CLAUSE_KEYWORDS | {
+    "select", "distinct", "all", "as", "by", "and", "or", "not", "in", "is", "null", "between", "like",
+    "glob", "case", "when", "then", "else", "end", "exists", "cast", "asc", "desc", "on", "using", "with",
+}
+CAST_TYPES = {"real": "float", "float": "float", "double": "float", "numeric": "float",
+              "integer": "int", "int": "int", "bigint": "int"}
+
+TOKEN_PATTERN = re.compile(r"""\s*(?:
+      (?P<number>\d+\.\d*(?:[eE][-+]?\d+)?|\.\d+|\d+)
+    | (?P<string>'(?:[^']|'')*')
+    | (?P<name>[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)?)
+    | (?P<op><>|!=|<=|>=|==|[-+*/(),=<>?;])
+    )""", re.VERBOSE)
+
+
+class Unsupported(Exception):
+    """Raised when a query falls outside the shapes the columnar engine executes"""
+
+
+class Text:
+    """Dictionary-encoded text column: int codes into a sorted array of distinct values, -1 for NULL"""
+    
+    def __init__(self, codes: np.ndarray, dictionary: np.ndarray):
+        self.codes = codes
+        self.dictionary = dictionary
+    
+    def take(self, indices: np.ndarray) -> "Text":
+        return Text(self.codes[indices], self.dictionary)
+    
+    def decode(self) -> np.ndarray:
+        values = self.dictionary[np.maximum(self.codes, 0)].astype(object)
+        values[self.codes < 0] = None
+        return values
+
+
+def tokenize(sql: str, params: Optional[Sequence[Any]]) -> List[Tuple[str, Any, int, int]]:
+    """Split SQL into (kind, value, start, end) tokens, substituting ? parameters as literals"""
+    tokens = []
+    params = list(params or [])
+    position = 0
+    sql = sql.rstrip()
+    while position < len(sql):
+        match = TOKEN_PATTERN.match(sql, position)
+        if not match or match.end() == position:
+            raise Unsupported(f"cannot tokenize near {sql[position:position + 10]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        start, end = match.start(kind), match.end()
+        position = end
+        if kind == "number":
+            tokens.append(("lit", float(value) if any(c in value for c in ".eE") else int(value), start, end))
+        elif kind == "string":
+            tokens.append(("lit", value[1:-1].replace("''", "'"), start, end))
+        elif kind == "name":
+            tokens.append(("name", value.lower(), start, end))
+        elif value == "?":
+            if not params:
+                raise Unsupported("missing parameter")
+            param = params.pop(0)
+            if isinstance(param, (bool, np.bool_)) or not isinstance(param, (int, float, str, np.integer, np.floating)):
+                raise Unsupported("unsupported parameter type")
+            tokens.append(("lit", param.item() if isinstance(param, np.generic) else param, start, end))
+        else:
+            tokens.append(("op", value, start, end))
+    if tokens and tokens[-1][:2] == ("op", ";"):
+        tokens.pop()
+    return tokens
+
+
+class QueryParser:
+    """Recursive-descent parser for single-table SELECT ... WHERE ... GROUP BY ... ORDER BY ... LIMIT"""
+    
+    def __init__(self, sql: str, params: Optional[Sequence[Any]] = None):
+        self.sql = sql
+        self.tokens = tokenize(sql, params)
+        self.position = 0
+    
+    def parse(self) -> Dict[str, Any]:
+        query = {"where": [], "group_by": [], "order_by": [], "limit": None, "offset": 0}
+        self.expect_keyword("select")
+        if self.peek_keyword("distinct"):
+            raise Unsupported("DISTINCT")
+        self.accept_keyword("all")
+        
+        query["select"] = [self.parse_select_item()]
+        while self.accept_op(","):
+            query["select"].append(self.parse_select_item())
+        
+        self.expect_keyword("from")
+        query["table"] = self.expect_name()
+        query["alias"] = None
+        if self.accept_keyword("as"):
+            query["alias"] = self.expect_name()
+        elif self.peek_kind("name") and self.peek()[1] not in RESERVED:
+            query["alias"] = self.expect_name()
+        
+        if self.accept_keyword("where"):
+            query["where"].append(self.parse_condition())
+            while self.accept_keyword("and"):
+                query["where"].append(self.parse_condition())
+        if self.accept_keyword("group"):
+            self.expect_keyword("by")
+            query["group_by"].append(self.parse_expression())
+            while self.accept_op(","):
+                query["group_by"].append(self.parse_expression())
+        if self.peek_keyword("having"):
+            raise Unsupported("HAVING")
+        if self.accept_keyword("order"):
+            self.expect_keyword("by")
+            query["order_by"].append(self.parse_order_term())
+            while self.accept_op(","):
+                query["order_by"].append(self.parse_order_term())
+        if self.accept_keyword("limit"):
+            query["limit"] = self.expect_integer()
+            if self.accept_op(","):
+                query["offset"], query["limit"] = query["limit"], self.expect_integer()
+            elif self.accept_keyword("offset"):
+                query["offset"] = self.expect_integer()
+        
+        if self.position != len(self.tokens):
+            raise Unsupported(f"unexpected {self.peek()[1]!r}")
+        return query
+    
+    def parse_select_item(self) -> Dict[str, Any]:
+        if self.accept_op("*"):
+            return {"expr": ("star",), "name": None, "alias": None}
+        start = self.peek()[2]
+        expr = self.parse_expression()
+        name = self.sql[start:self.tokens[self.position - 1][3]].strip()
+        if expr[0] == "col":
+            name = name.split(".")[-1]
+        alias = None
+        if self.accept_keyword("as"):
+            alias = self.expect_alias()
+        elif self.peek_kind("name") and self.peek()[1] not in RESERVED:
+            alias = self.expect_alias()
+        return {"expr": expr, "name": alias or name, "alias": alias}
+    
+    def parse_order_term(self) -> Tuple[tuple, bool]:
+        expr = self.parse_expression()
+        if self.accept_keyword("desc"):
+            return expr, True
+        self.accept_keyword("asc")
+        return expr, False
+    
+    def parse_condition(self) -> tuple:
+        if self.peek_op("("):
+            raise Unsupported("parenthesized condition")
+        left = self.parse_expression()
+        negate = self.accept_keyword("not")
+        if self.accept_keyword("between") and not negate:
+            low = self.parse_expression()
+            self.expect_keyword("and")
+            return ("between", left, low, self.parse_expression())
+        if self.accept_keyword("in"):
+            self.expect_op("(")
+            values = [self.parse_expression()]
+            while self.accept_op(","):
+                values.append(self.parse_expression())
+            self.expect_op(")")
+            return ("in", left, values, negate)
+        if self.accept_keyword("is") and not negate:
+            is_not = self.accept_keyword("not")
+            self.expect_keyword("null")
+            return ("isnull", left, is_not)
+        token = self.peek()
+        if not negate and token and token[0] == "op" and token[1] in ("=", "==", "!=", "<>", "<", "<=", ">", ">="):
+            self.position += 1
+            op = {"==": "=", "<>": "!="}.get(token[1], token[1])
+            return ("cmp", op, left, self.parse_expression())
+        raise Unsupported("unsupported condition")
+    
+    def parse_expression(self) -> tuple:
+        node = self.parse_term()
+        while self.peek_op("+") or self.peek_op("-"):
+            op = self.next()[1]
+            node = ("bin", op, node, self.parse_term())
+        return node
+    
+    def parse_term(self) -> tuple:
+        node = self.parse_unary()
+        while self.peek_op("*") or self.peek_op("/"):
+            op = self.next()[1]
+            node = ("bin", op, node, self.parse_unary())
+        return node
+    
+    def parse_unary(self) -> tuple:
+        if self.accept_op("-"):
+            return ("neg", self.parse_unary())
+        if self.accept_op("+"):
+            return self.parse_unary()
+        return self.parse_primary()
+    
+    def parse_primary(self) -> tuple:
+        token = self.next()
+        if token is None:
+            raise Unsupported("unexpected end of query")
+        kind, value = token[0], token[1]
+        if kind == "lit":
+            return ("lit", value)
+        if kind == "op" and value == "(":
+            node = self.parse_expression()
+            self.expect_op(")")
+            return node
+        if kind != "name":
+            raise Unsupported(f"unexpected {value!r}")
+        if value == "cast":
+            self.expect_op("(")
+            node = self.parse_expression()
+            self.expect_keyword("as")
+            target = CAST_TYPES.get(self.expect_name())
+            self.expect_op(")")
+            if target is None:
+                raise Unsupported("CAST target")
+            return ("cast", node, target)
+        if value in RESERVED:
+            raise Unsupported(f"keyword {value!r}")
+        if not self.peek_op("("):
+            return ("col", value)
+        
+        self.position += 1
+        if value in AGGREGATES:
+            if self.peek_keyword("distinct"):
+                raise Unsupported("aggregate DISTINCT")
+            if value == "count" and self.accept_op("*"):
+                self.expect_op(")")
+                return ("agg", "count", None)
+            argument = self.parse_expression()
+            if self.peek_op(","):
+                raise Unsupported("multi-argument aggregate")
+            self.expect_op(")")
+            return ("agg", value, argument)
+        if value in SCALAR_FUNCTIONS:
+            arguments = [self.parse_expression()]
+            while self.accept_op(","):
+                arguments.append(self.parse_expression())
+            self.expect_op(")")
+            return ("call", value, arguments)
+        raise Unsupported(f"function {value!r}")
+    
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+    
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+    
+    def peek_kind(self, kind: str) -> bool:
+        token = self.peek()
+        return token is not None and token[0] == kind
+    
+    def peek_op(self, op: str) -> bool:
+        token = self.peek()
+        return token is not None and token[0] == "op" and token[1] == op
+    
+    def peek_keyword(self, keyword: str) -> bool:
+        token = self.peek()
+        return token is not None and token[0] == "name" and token[1] == keyword
+    
+    def accept_op(self, op: str) -> bool:
+        if self.peek_op(op):
+            self.position += 1
+            return True
+        return False
+    
+    def accept_keyword(self, keyword: str) -> bool:
+        if self.peek_keyword(keyword):
+            self.position += 1
+            return True
+        return False
+    
+    def expect_op(self, op: str):
+        if not self.accept_op(op):
+            raise Unsupported(f"expected {op!r}")
+    
+    def expect_keyword(self, keyword: str):
+        if not self.accept_keyword(keyword):
+            raise Unsupported(f"expected {keyword!r}")
+    
+    def expect_name(self) -> str:
+        token = self.next()
+        if token is None or token[0] != "name" or "." in token[1]:
+            raise Unsupported("expected a name")
+        return token[1]
+    
+    def expect_alias(self) -> str:
+        token = self.next()
+        if token is None or token[0] != "name" or "." in token[1]:
+            raise Unsupported("expected an alias")
+        return self.sql[token[2]:token[3]]
+    
+    def expect_integer(self) -> int:
+        token = self.next()
+        if token is None or token[0] != "lit" or not isinstance(token[1], int):
+            raise Unsupported("expected an integer")
+        return token[1]
+
+
+def is_null(values: np.ndarray) -> np.ndarray:
+    if isinstance(values, Text):
+        return values.codes < 0
+    if np.issubdtype(values.dtype, np.floating):
+        return np.isnan(values)
+    return np.zeros(values.shape, dtype=bool)
+
+
+def numeric(values) -> np.ndarray:
+    if isinstance(values, Text) or values.dtype.kind not in "iuf":
+        raise Unsupported("arithmetic on text")
+    return values
+
+
+def divide(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """SQLite division: integer operands truncate toward zero, division by zero is NULL"""
+    zero = right == 0
+    if np.issubdtype(left.dtype, np.integer) and np.issubdtype(right.dtype, np.integer):
+        safe = np.where(zero, 1, right)
+        quotient = np.abs(left) // np.abs(safe) * np.sign(left) * np.sign(safe)
+        if np.any(zero):
+            quotient = np.where(zero, np.nan, quotient)
+        return quotient
+    with np.errstate(divide="ignore", invalid="ignore"):
+        quotient = np.true_divide(left, right)
+    return np.where(zero, np.nan, quotient)
+
+
+def sql_round(values: np.ndarray, digits: int) -> np.ndarray:
+    """ROUND() rounds half away from zero, unlike numpy's round-half-to-even"""
+    scale = 10.0 ** digits
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+def compare(op: str, left, right) -> np.ndarray:
+    """Vectorized comparison with SQL NULL semantics (NULL never matches)"""
+    if isinstance(right, Text) and not isinstance(left, Text):
+        op = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}.get(op, op)
+        left, right = right, left
+    if isinstance(left, Text):
+        if not (isinstance(right, np.ndarray) and right.ndim == 0 and right.dtype.kind == "U"):
+            raise Unsupported("text compared with non-literal")
+        low = np.searchsorted(left.dictionary, str(right), side="left")
+        high = np.searchsorted(left.dictionary, str(right), side="right")
+        codes = left.codes
+        valid = codes >= 0
+        if op == "=":
+            return (codes >= low) & (codes < high)
+        if op == "!=":
+            return valid & ((codes < low) | (codes >= high))
+        if op == "<":
+            return valid & (codes < low)
+        if op == "<=":
+            return valid & (codes < high)
+        if op == ">":
+            return codes >= high
+        return codes >= low
+    
+    left, right = numeric(left), numeric(right)
+    with np.errstate(invalid="ignore"):
+        result = {
+            "=": np.equal, "!=": np.not_equal, "<": np.less,
+            "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+        }[op](left, right)
+    return result & ~is_null(left) & ~is_null(right)
+
+
+class GroupIndex:
+    """Row-to-group mapping shared by every aggregate in one query"""
+    
+    def __init__(self, inverse: Optional[np.ndarray], groups: int, rows: int):
+        self.inverse = inverse  # None when the whole input is a single group
+        self.groups = groups
+        self.rows = rows
+        self._order = None
+    
+    def reduce(self, ufunc, values: np.ndarray) -> np.ndarray:
+        if self.inverse is None:
+            return np.atleast_1d(ufunc.reduce(values))
+        if self._order is None:
+            self._order = np.argsort(self.inverse, kind="stable")
+            self._starts = np.searchsorted(self.inverse[self._order], np.arange(self.groups))
+        return ufunc.reduceat(values[self._order], self._starts)
+    
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        if self.inverse is None:
+            return np.atleast_1d(values.sum())
+        sums = np.bincount(self.inverse, weights=values, minlength=self.groups)
+        # bincount accumulates in float64, exact for integer sums below 2**53
+        return sums.astype(np.int64) if np.issubdtype(values.dtype, np.integer) else sums
+    
+    def count(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        if self.inverse is None:
+            return np.array([self.rows if mask is None else int(np.count_nonzero(mask))], dtype=np.int64)
+        weights = None if mask is None else mask.astype(np.float64)
+        return np.bincount(self.inverse, weights=weights, minlength=self.groups).astype(np.int64)
+
+
+def factorize(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted distinct values and each row's index into them; O(n) for dense integer keys"""
+    if values.dtype.kind in "iu" and len(values):
+        low = int(values.min())
+        span = int(values.max()) - low + 1
+        if span <= max(len(values), 1 << 16):
+            offsets = values - low
+            present = np.bincount(offsets, minlength=span) > 0
+            return np.flatnonzero(present) + low, (np.cumsum(present) - 1)[offsets]
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return uniques, inverse.ravel()
+
+
+class ColumnarTable:
+    """One table held as NumPy arrays, text columns dictionary-encoded"""
+    
+    def __init__(self, df: pd.DataFrame):
+        self.rows = len(df)
+        self.column_names = list(df.columns)
+        self.columns = {}
+        for column in df.columns:
+            series = df[column]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                self.columns[column.lower()] = series.to_numpy()
+            else:
+                codes, uniques = pd.factorize(series, sort=True)
+                self.columns[column.lower()] = Text(codes.astype(np.int32), np.asarray(uniques, dtype=object))
+
+
+class ColumnarStore:
+    """Immutable snapshot of the raw tables for one data version"""
+    
+    def __init__(self, tables: Dict[str, ColumnarTable]):
+        self.tables = tables
+    
+    def run(self, query: Dict[str, Any]) -> pd.DataFrame:
+        table = self.tables.get(query["table"])
+        if table is None:
+            raise Unsupported(f"table {query['table']!r} is not loaded")
+        qualifiers = {query["table"]} | ({query["alias"].lower()} if query["alias"] else set())
+        
+        def column(name: str):
+            if "." in name:
+                qualifier, name = name.split(".", 1)
+                if qualifier not in qualifiers:
+                    raise Unsupported(f"unknown qualifier {qualifier!r}")
+            if name not in table.columns:
+                raise Unsupported(f"unknown column {name!r}")
+            return table.columns[name]
+        
+        # Filter: one boolean mask over the full columns
+        mask = np.ones(table.rows, dtype=bool)
+        for condition in query["where"]:
+            mask &= self.evaluate_condition(condition, lambda node: self.evaluate(node, column, None))
+        row_count = int(np.count_nonzero(mask))
+        if row_count == 0:
+            raise Unsupported("empty result")
+        indices = None if row_count == table.rows else np.flatnonzero(mask)
+        
+        row_cache = {}
+        def row_column(name: str):
+            if name not in row_cache:
+                values = column(name)
+                if indices is not None:
+                    values = values.take(indices) if isinstance(values, Text) else values[indices]
+                row_cache[name] = values
+            return row_cache[name]
+        
+        select = query["select"]
+        if any(item["expr"][0] == "star" for item in select):
+            if len(select) != 1 or query["group_by"]:
+                raise Unsupported("* mixed with other items")
+            select = [{"expr": ("col", name.lower()), "name": name, "alias": None} for name in table.column_names]
+        
+        has_aggregate = any(self.contains_aggregate(item["expr"]) for item in select)
+        if query["group_by"] or has_aggregate:
+            group_keys = {}
+            if query["group_by"]:
+                keys = []
+                for key in query["group_by"]:
+                    if key[0] != "col":
+                        raise Unsupported("GROUP BY on an expression")
+                    values = row_column(key[1])
+                    raw = values.codes if isinstance(values, Text) else values
+                    uniques, inverse = factorize(raw)
+                    keys.append((key[1].split(".")[-1], values, uniques, inverse))
+                combined = keys[0][3].astype(np.int64)
+                for _, _, uniques, inverse in keys[1:]:
+                    combined = combined * len(uniques) + inverse
+                group_codes, inverse = factorize(combined)
+                groups = GroupIndex(inverse, len(group_codes), len(combined))
+                # Decode each group's combined code back into its key values
+                for name, values, uniques, _ in reversed(keys):
+                    group_codes, ranks = np.divmod(group_codes, len(uniques))
+                    key_values = uniques[ranks]
+                    group_keys[name] = Text(key_values, values.dictionary) if isinstance(values, Text) else key_values
+            else:
+                groups = GroupIndex(None, 1, row_count)
+            size = groups.groups
+            
+            def group_column(name: str):
+                key = name.split(".")[-1]
+                if key not in group_keys:
+                    raise Unsupported(f"column {name!r} is neither grouped nor aggregated")
+                column(name)  # validates the qualifier
+                return group_keys[key]
+            evaluate = lambda node: self.evaluate(node, group_column, (groups, row_column))
+        else:
+            size = row_count
+            evaluate = lambda node: self.evaluate(node, row_column, None)
+        
+        outputs = [evaluate(item["expr"]) for item in select]
+        
+        if query["order_by"]:
+            aliases = {item["alias"].lower(): i for i, item in enumerate(select) if item["alias"]}
+            sort_keys = []
+            for expr, descending in query["order_by"]:
+                if expr[0] == "col" and expr[1] in aliases:
+                    values = outputs[aliases[expr[1]]]
+                elif expr[0] == "lit" and isinstance(expr[1], int) and 1 <= expr[1] <= len(select):
+                    values = outputs[expr[1] - 1]
+                else:
+                    values = evaluate(expr)
+                sort_keys.append(self.sort_key(values, size, descending))
+        start = query["offset"]
+        stop = None if query["limit"] is None or query["limit"] < 0 else start + query["limit"]
+        
+        if not query["order_by"]:
+            order = np.arange(size)[start:stop]
+        elif len(sort_keys) == 1 and stop is not None and stop < size // 4:
+            # Top-N: select the first `stop` rows without sorting all of them; ties at the
+            # boundary keep row order so the result matches a stable full sort
+            key = sort_keys[0]
+            if stop > 0:
+                boundary = np.partition(key, stop - 1)[stop - 1]
+                below = np.flatnonzero(key < boundary)
+                candidates = np.concatenate([below, np.flatnonzero(key == boundary)[:stop - len(below)]])
+            else:
+                candidates = np.arange(0)
+            order = candidates[np.lexsort((candidates, key[candidates]))][start:]
+        else:
+            order = np.lexsort(sort_keys[::-1])[start:stop]
+        
+        result = {}
+        for item, values in zip(select, outputs):
+            if isinstance(values, Text):
+                column_values = values.take(order).decode() if values.codes.ndim else np.full(len(order), values.decode())
+            elif values.ndim == 0:
+                column_values = np.full(len(order), values.item(), dtype=object if values.dtype.kind == "U" else values.dtype)
+            else:
+                column_values = values[order]
+            result[item["name"]] = column_values
+        return pd.DataFrame(result)
+    
+    def evaluate(self, node: tuple, column, aggregate_context):
+        kind = node[0]
+        if kind == "lit":
+            if node[1] is None:
+                raise Unsupported("NULL literal")
+            return np.asarray(node[1])
+        if kind == "col":
+            return column(node[1])
+        if kind == "neg":
+            return -numeric(self.evaluate(node[1], column, aggregate_context))
+        if kind == "bin":
+            left = numeric(self.evaluate(node[2], column, aggregate_context))
+            right = numeric(self.evaluate(node[3], column, aggregate_context))
+            if node[1] == "/":
+                return divide(left, right)
+            return {"+": np.add, "-": np.subtract, "*": np.multiply}[node[1]](left, right)
+        if kind == "cast":
+            values = numeric(self.evaluate(node[1], column, aggregate_context))
+            if node[2] == "float":
+                return values.astype(np.float64)
+            if np.any(is_null(values)):
+                raise Unsupported("CAST of NULL to INTEGER")
+            return np.trunc(values).astype(np.int64)
+        if kind == "call":
+            arguments = [self.evaluate(argument, column, aggregate_context) for argument in node[2]]
+            return self.call(node[1], arguments)
+        if kind == "agg":
+            if aggregate_context is None:
+                raise Unsupported("aggregate outside an aggregate query")
+            groups, row_column = aggregate_context
+            values = None if node[2] is None else self.evaluate(node[2], row_column, None)
+            return self.aggregate(node[1], values, groups)
+        raise Unsupported(f"expression {kind!r}")
+    
+    def call(self, name: str, arguments: List[Any]):
+        if name == "round" and len(arguments) in (1, 2):
+            digits = 0
+            if len(arguments) == 2:
+                if arguments[1].ndim != 0 or arguments[1].dtype.kind not in "iu":
+                    raise Unsupported("ROUND digits")
+                digits = int(arguments[1])
+            return sql_round(numeric(arguments[0]).astype(np.float64), digits)
+        if name == "abs" and len(arguments) == 1:
+            return np.abs(numeric(arguments[0]))
+        if name in ("coalesce", "ifnull") and len(arguments) >= 2:
+            result = numeric(arguments[0])
+            for fallback in arguments[1:]:
+                fallback = numeric(fallback)
+                nulls = is_null(result)
+                if np.any(nulls):
+                    result = np.where(nulls, fallback, result)
+            return result
+        if name == "nullif" and len(arguments) == 2:
+            left, right = numeric(arguments[0]), numeric(arguments[1])
+            return np.where(left == right, np.nan, left)
+        raise Unsupported(f"function {name!r}")
+    
+    def aggregate(self, name: str, values, groups: GroupIndex):
+        if name == "count":
+            if values is None or (not isinstance(values, Text) and values.ndim == 0):
+                return groups.count()
+            return groups.count(~is_null(values))
+        
+        if isinstance(values, Text):
+            if name not in ("min", "max"):
+                raise Unsupported(f"{name.upper()} of text")
+            codes = values.codes
+            if name == "min":
+                codes = np.where(codes < 0, np.iinfo(np.int32).max, codes)
+                reduced = groups.reduce(np.minimum, codes)
+                reduced[reduced == np.iinfo(np.int32).max] = -1
+            else:
+                reduced = groups.reduce(np.maximum, codes)
+            return Text(reduced, values.dictionary)
+        
+        values = numeric(np.broadcast_to(values, (groups.rows,)))
+        present = groups.count(~is_null(values))
+        if name in ("min", "max"):
+            if np.issubdtype(values.dtype, np.integer):
+                return groups.reduce(np.minimum if name == "min" else np.maximum, values)
+            return groups.reduce(np.fmin if name == "min" else np.fmax, values)
+        
+        if np.issubdtype(values.dtype, np.integer):
+            sums = groups.sum(values.astype(np.int64))
+        else:
+            sums = groups.sum(np.where(np.isnan(values), 0.0, values))
+        if name == "total":
+            return sums.astype(np.float64)
+        if name == "avg":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(present > 0, sums / np.maximum(present, 1), np.nan)
+        if np.any(present == 0):
+            return np.where(present > 0, sums, np.nan)
+        return sums
+    
+    def evaluate_condition(self, condition: tuple, evaluate) -> np.ndarray:
+        kind = condition[0]
+        if kind == "cmp":
+            return compare(condition[1], evaluate(condition[2]), evaluate(condition[3]))
+        if kind == "between":
+            values = evaluate(condition[1])
+            return compare(">=", values, evaluate(condition[2])) & compare("<=", values, evaluate(condition[3]))
+        if kind == "in":
+            values = evaluate(condition[1])
+            options = [evaluate(option) for option in condition[2]]
+            if (not isinstance(values, Text) and values.dtype.kind in "iuf"
+                    and all(o.ndim == 0 and o.dtype.kind in "iuf" for o in options)):
+                matched = np.isin(values, [o.item() for o in options]) & ~is_null(values)
+            else:
+                matched = compare("=", values, options[0])
+                for option in options[1:]:
+                    matched |= compare("=", values, option)
+            return ~matched & ~is_null(values) if condition[3] else matched
+        if kind == "isnull":
+            nulls = is_null(evaluate(condition[1]))
+            return ~nulls if condition[2] else nulls
+        raise Unsupported(f"condition {kind!r}")
+    
+    def contains_aggregate(self, node: tuple) -> bool:
+        if node[0] == "agg":
+            return True
+        return any(isinstance(child, tuple) and self.contains_aggregate(child) for child in node[1:]) or any(
+            isinstance(child, list) and any(self.contains_aggregate(c) for c in child) for child in node[1:]
+        )
+    
+    def sort_key(self, values, size: int, descending: bool) -> np.ndarray:
+        """Numeric sort key where NULL sorts first ascending and last descending, as in SQLite"""
+        if isinstance(values, Text):
+            key = np.broadcast_to(values.codes, (size,)).astype(np.int64)
+        else:
+            values = np.broadcast_to(values, (size,))
+            if values.dtype.kind not in "iuf":
+                raise Unsupported("ORDER BY on a text expression")
+            key = np.where(np.isnan(values), -np.inf, values) if values.dtype.kind == "f" else values.astype(np.int64)
+        return -key if descending else key
+
+
+class ColumnarEngine:
+    """Executes common single-table query shapes on an in-memory columnar copy of the raw tables"""
+    
+    def __init__(self, db_pool, tables: Sequence[str] = COLUMNAR_TABLES):
+        self.db_pool = db_pool
+        self.table_names = tuple(tables)
+        self._lock = threading.Lock()
+        self._store = None
+        self._version = object()
+        self._stats = {"executed": 0, "fallbacks": 0, "loads": 0, "load_seconds": 0.0, "rows": 0}
+    
+    def execute(self, sql_query: str, version: Optional[str],
+                params: Optional[Sequence[Any]] = None) -> Optional[pd.DataFrame]:
+        """Run the query on the columnar store, or return None so the caller falls back to SQLite"""
+        try:
+            query = QueryParser(sql_query, params).parse()
+            result = self.store(version).run(query)
+        except Unsupported:
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            return None
+        except Exception as e:
+            print(f"Columnar engine error, falling back to SQLite: {e}")
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            return None
+        
+        with self._lock:
+            self._stats["executed"] += 1
+        return result
+    
+    def store(self, version: Optional[str]) -> ColumnarStore:
+        """Return the snapshot for this data version, loading it on first use"""
+        with self._lock:
+            if self._version == version and self._store is not None:
+                return self._store
+            
+            start_time = time.perf_counter()
+            tables = {}
+            with self.db_pool.connection() as conn:
+                for name in self.table_names:
+                    tables[name] = ColumnarTable(pd.read_sql_query(f"SELECT * FROM {name} ORDER BY rowid", conn))
+            self._store = ColumnarStore(tables)
+            self._version = version
+            self._stats["loads"] += 1
+            self._stats["load_seconds"] = round(time.perf_counter() - start_time, 3)
+            self._stats["rows"] = sum(table.rows for table in tables.values())
+            return self._store
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return how many queries ran columnar versus fell back to SQLite"""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["executed"] + stats["fallbacks"]
+        stats["columnar_rate"] = round(stats["executed"] / total, 3) if total else 0.0
+        return stats
@@ -1,77 +1,478 @@
 import pandas as pd
 import sqlite3
-from sqlalchemy import create_engine, text
+import argparse
 import os
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from openpyxl import load_workbook
+from index_advisor import ADVISED_PREFIX
 
-def setup_database():
-    """Convert Excel files to SQLite database with proper schema"""
-    
-    # Create SQLite database
-    engine = create_engine('sqlite:///product_data.db')
-    
-    # Read Excel files
-    print("Reading Excel files...")
-    
-    # Ad Sales and Metrics
-    ad_sales_df = pd.read_excel('Product-Level Ad Sales and Metrics (mapped).xlsx')
-    print(f"Ad Sales data: {ad_sales_df.shape}")
-    
-    # Total Sales and Metrics
-    total_sales_df = pd.read_excel('Product-Level Total Sales and Metrics (mapped).xlsx')
-    print(f"Total Sales data: {total_sales_df.shape}")
+DB_PATH = 'product_data.db'
+
+SOURCE_FILES = {
+    'ad_sales_metrics': 'Product-Level Ad Sales and Metrics (mapped).xlsx',
+    'total_sales_metrics': 'Product-Level Total Sales and Metrics (mapped).xlsx',
+    'product_eligibility': 'Product-Level Eligibility Table (mapped).xlsx',
+}
+
+# Column order and types of the raw tables, as the original pandas load created them
+TABLE_SCHEMAS = {
+    'ad_sales_metrics': [
+        ('date', 'DATETIME'), ('item_id', 'BIGINT'), ('ad_sales', 'FLOAT'), ('impressions', 'BIGINT'),
+        ('ad_spend', 'FLOAT'), ('clicks', 'BIGINT'), ('units_sold', 'BIGINT'),
+    ],
+    'total_sales_metrics': [
+        ('date', 'DATETIME'), ('item_id', 'BIGINT'), ('total_sales', 'FLOAT'), ('total_units_ordered', 'BIGINT'),
+    ],
+    'product_eligibility': [
+        ('eligibility_datetime_utc', 'DATETIME'), ('item_id', 'BIGINT'), ('eligibility', 'BIGINT'), ('message', 'TEXT'),
+    ],
+}
+
+# Rows held in memory per table at any time during a load
+LOAD_CHUNK_ROWS = 50_000
+
+# Applied to the staging file only; it is discarded if the load fails. Index and rollup
+# sorts stay on disk so memory does not grow with the table size.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -65536",
+]
+
+# Natural key of each raw table and the column that drives its high-water mark
+TABLE_KEYS = {
+    'ad_sales_metrics': (['date', 'item_id'], 'date'),
+    'total_sales_metrics': (['date', 'item_id'], 'date'),
+    'product_eligibility': (['eligibility_datetime_utc', 'item_id'], 'eligibility_datetime_utc'),
+}
+
+# Same text format SQLAlchemy used for DATETIME columns, so older databases compare equal
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+INDEX_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS idx_ad_sales_item_id ON ad_sales_metrics(item_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ad_sales_date ON ad_sales_metrics(date)",
+    "CREATE INDEX IF NOT EXISTS idx_total_sales_item_id ON total_sales_metrics(item_id)",
+    "CREATE INDEX IF NOT EXISTS idx_total_sales_date ON total_sales_metrics(date)",
+    "CREATE INDEX IF NOT EXISTS idx_eligibility_item_id ON product_eligibility(item_id)",
+    # Unique natural keys let incremental loads upsert instead of duplicating rows
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_ad_sales_date_item ON ad_sales_metrics(date, item_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_total_sales_date_item ON total_sales_metrics(date, item_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_eligibility_checked_item ON product_eligibility(eligibility_datetime_utc, item_id)",
+]
+
+INGESTION_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS ingestion_state (
+        table_name TEXT PRIMARY KEY,
+        high_water_mark TEXT,
+        updated_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ingestion_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT,
+        mode TEXT,
+        rows_read INTEGER,
+        rows_written INTEGER,
+        high_water_mark TEXT,
+        started_at TEXT,
+        finished_at TEXT
+    )
+    """,
+]
+
+# Materialized rollups. Measure columns keep their raw names so SUMs over a rollup equal
+# SUMs over the raw rows; ad_rows / total_rows let COUNT(*) be answered as well.
+# {filter} restricts a rebuild to the rows touched by an incremental load.
+ITEM_DAILY_SELECT = """
+    SELECT date, item_id,
+           SUM(ad_rows) AS ad_rows, SUM(ad_sales) AS ad_sales, SUM(impressions) AS impressions,
+           SUM(ad_spend) AS ad_spend, SUM(clicks) AS clicks, SUM(units_sold) AS units_sold,
+           SUM(total_rows) AS total_rows, SUM(total_sales) AS total_sales,
+           SUM(total_units_ordered) AS total_units_ordered,
+           SUM(ad_sales) / NULLIF(SUM(ad_spend), 0) AS roas,
+           SUM(ad_spend) / NULLIF(SUM(clicks), 0) AS cpc,
+           CAST(SUM(clicks) AS REAL) / NULLIF(SUM(impressions), 0) AS ctr
+    FROM (
+        SELECT date, item_id, 1 AS ad_rows, ad_sales, impressions, ad_spend, clicks, units_sold,
+               0 AS total_rows, NULL AS total_sales, NULL AS total_units_ordered
+        FROM ad_sales_metrics {filter}
+        UNION ALL
+        SELECT date, item_id, 0, NULL, NULL, NULL, NULL, NULL, 1, total_sales, total_units_ordered
+        FROM total_sales_metrics {filter}
+    )
+    GROUP BY date, item_id
+"""
+
+ROLLUP_MEASURES = """
+           SUM(ad_rows) AS ad_rows, SUM(ad_sales) AS ad_sales,
+           SUM(impressions) AS impressions, SUM(ad_spend) AS ad_spend, SUM(clicks) AS clicks,
+           SUM(units_sold) AS units_sold, SUM(total_rows) AS total_rows,
+           SUM(total_sales) AS total_sales, SUM(total_units_ordered) AS total_units_ordered,
+           SUM(ad_sales) / NULLIF(SUM(ad_spend), 0) AS roas,
+           SUM(ad_spend) / NULLIF(SUM(clicks), 0) AS cpc,
+           CAST(SUM(clicks) AS REAL) / NULLIF(SUM(impressions), 0) AS ctr
+"""
+
+ITEM_TOTALS_SELECT = "SELECT item_id," + ROLLUP_MEASURES + "FROM item_daily_metrics {filter} GROUP BY item_id"
+DAILY_TOTALS_SELECT = "SELECT date," + ROLLUP_MEASURES + "FROM item_daily_metrics {filter} GROUP BY date"
+
+ROLLUP_METADATA_STATEMENTS = [
+    # Source row counts at build time, so readers can tell whether the rollups are current
+    "CREATE TABLE IF NOT EXISTS rollup_metadata (source_table TEXT PRIMARY KEY, source_rows INTEGER, built_at TEXT)",
+    "DELETE FROM rollup_metadata",
+    """
+    INSERT INTO rollup_metadata
+    SELECT 'ad_sales_metrics', COUNT(*), datetime('now') FROM ad_sales_metrics
+    UNION ALL
+    SELECT 'total_sales_metrics', COUNT(*), datetime('now') FROM total_sales_metrics
+    """,
+]
+
+ROLLUP_STATEMENTS = [
+    "DROP TABLE IF EXISTS item_daily_metrics",
+    "CREATE TABLE item_daily_metrics AS " + ITEM_DAILY_SELECT.format(filter=""),
+    "CREATE UNIQUE INDEX idx_item_daily_item_date ON item_daily_metrics(item_id, date)",
+    "CREATE INDEX idx_item_daily_date ON item_daily_metrics(date)",
+    "DROP TABLE IF EXISTS item_totals",
+    "CREATE TABLE item_totals AS " + ITEM_TOTALS_SELECT.format(filter=""),
+    "CREATE UNIQUE INDEX idx_item_totals_item_id ON item_totals(item_id)",
+    "DROP TABLE IF EXISTS daily_totals",
+    "CREATE TABLE daily_totals AS " + DAILY_TOTALS_SELECT.format(filter=""),
+    "CREATE UNIQUE INDEX idx_daily_totals_date ON daily_totals(date)",
+] + ROLLUP_METADATA_STATEMENTS
+
+def build_rollups(conn: sqlite3.Connection):
+    """Rebuild the rollup tables from the raw tables"""
+    for statement in ROLLUP_STATEMENTS:
+        conn.execute(statement)
+
+def refresh_rollups(conn: sqlite3.Connection, since: str):
+    """Recompute only the rollup rows for dates on or after `since` and the items they touch"""
+    since_filter = "WHERE date >= :since"
+    items_filter = "WHERE item_id IN (SELECT item_id FROM item_daily_metrics WHERE date >= :since)"
+    params = {"since": since}
     
-    # Eligibility Table
-    eligibility_df = pd.read_excel('Product-Level Eligibility Table (mapped).xlsx')
-    print(f"Eligibility data: {eligibility_df.shape}")
+    conn.execute("DELETE FROM item_daily_metrics WHERE date >= :since", params)
+    conn.execute("INSERT INTO item_daily_metrics " + ITEM_DAILY_SELECT.format(filter=since_filter), params)
+    conn.execute("DELETE FROM daily_totals WHERE date >= :since", params)
+    conn.execute("INSERT INTO daily_totals " + DAILY_TOTALS_SELECT.format(filter=since_filter), params)
+    conn.execute("DELETE FROM item_totals " + items_filter, params)
+    conn.execute("INSERT INTO item_totals " + ITEM_TOTALS_SELECT.format(filter=items_filter), params)
+    for statement in ROLLUP_METADATA_STATEMENTS:
+        conn.execute(statement)
+
+def find_source_file(table_name: str, source_dir: str = '.') -> str:
+    """Prefer a CSV or Parquet export of the table, falling back to the mapped Excel workbook"""
+    for extension in ('.parquet', '.csv'):
+        path = os.path.join(source_dir, table_name + extension)
+        if os.path.exists(path):
+            return path
+    return os.path.join(source_dir, SOURCE_FILES[table_name])
+
+def read_excel_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Stream a workbook's first sheet without loading it whole"""
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        while header is not None:
+            chunk = list(islice(rows, chunk_rows))
+            if not chunk:
+                break
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+def read_parquet_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Stream a Parquet file one record batch at a time"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet exports requires pyarrow: pip install pyarrow")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+def read_source_chunks(path: str, chunk_rows: int = LOAD_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield raw DataFrame chunks of at most chunk_rows rows from an .xlsx, .csv or .parquet file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+    elif extension == '.parquet':
+        yield from read_parquet_chunks(path, chunk_rows)
+    else:
+        yield from read_excel_chunks(path, chunk_rows)
+
+def read_source_files(source_dir: str = '.', chunk_rows: int = LOAD_CHUNK_ROWS) -> Dict[str, Iterator[pd.DataFrame]]:
+    """Open a lazy chunk stream over each table's export"""
+    sources = {}
+    for table_name in TABLE_SCHEMAS:
+        path = find_source_file(table_name, source_dir)
+        print(f"{table_name}: reading {path}")
+        sources[table_name] = read_source_chunks(path, chunk_rows)
+    return sources
+
+def prepare_chunk(table_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Clean one chunk into the table's column order and types"""
+    df = df[[column for column, _ in TABLE_SCHEMAS[table_name]]].copy()
     
-    # Clean and prepare data
     # Convert date columns to datetime
-    ad_sales_df['date'] = pd.to_datetime(ad_sales_df['date'])
-    total_sales_df['date'] = pd.to_datetime(total_sales_df['date'])
-    eligibility_df['eligibility_datetime_utc'] = pd.to_datetime(eligibility_df['eligibility_datetime_utc'])
+    mark_column = TABLE_KEYS[table_name][1]
+    if not pd.api.types.is_datetime64_any_dtype(df[mark_column]):
+        df[mark_column] = pd.to_datetime(df[mark_column])
     
     # Ensure item_id is integer
-    ad_sales_df['item_id'] = ad_sales_df['item_id'].astype(int)
-    total_sales_df['item_id'] = total_sales_df['item_id'].astype(int)
-    eligibility_df['item_id'] = eligibility_df['item_id'].astype(int)
+    df['item_id'] = df['item_id'].astype(int)
     
     # Convert boolean to integer for SQLite compatibility
-    eligibility_df['eligibility'] = eligibility_df['eligibility'].astype(int)
+    if 'eligibility' in df.columns:
+        df['eligibility'] = df['eligibility'].astype(int)
+    return df
+
+def iter_chunks(table_name: str, source: Union[pd.DataFrame, Iterable[pd.DataFrame]]) -> Iterator[pd.DataFrame]:
+    """Accept either a whole DataFrame or a stream of chunks and yield cleaned chunks"""
+    chunks = source
+    if isinstance(source, pd.DataFrame):
+        chunks = (source.iloc[start:start + LOAD_CHUNK_ROWS] for start in range(0, len(source), LOAD_CHUNK_ROWS))
+    for chunk in chunks:
+        if len(chunk):
+            yield prepare_chunk(table_name, chunk)
+
+def chunk_records(df: pd.DataFrame) -> List[tuple]:
+    """Convert a cleaned chunk to plain Python row tuples for executemany"""
+    columns = []
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime(DATETIME_FORMAT)
+        if series.hasnans:
+            series = series.astype(object).where(series.notna(), None)
+        columns.append(series.tolist())
+    return list(zip(*columns))
+
+def format_datetime(value) -> Optional[str]:
+    """Render a timestamp the way it is stored in the database"""
+    return None if pd.isna(value) else pd.Timestamp(value).strftime(DATETIME_FORMAT)
+
+def record_ingestion(conn: sqlite3.Connection, table_name: str, mode: str, rows_read: int,
+                     rows_written: int, high_water_mark: Optional[str], started_at: str):
+    """Log an ingestion run and advance the table's high-water mark"""
+    finished_at = datetime.now(timezone.utc).isoformat()
+    conn.execute(
+        "INSERT INTO ingestion_log (table_name, mode, rows_read, rows_written, high_water_mark, started_at, finished_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (table_name, mode, rows_read, rows_written, high_water_mark, started_at, finished_at)
+    )
+    if high_water_mark is not None:
+        conn.execute(
+            "INSERT INTO ingestion_state VALUES (?, ?, ?) "
+            "ON CONFLICT(table_name) DO UPDATE SET high_water_mark = excluded.high_water_mark, updated_at = excluded.updated_at "
+            "WHERE excluded.high_water_mark > ingestion_state.high_water_mark OR ingestion_state.high_water_mark IS NULL",
+            (table_name, high_water_mark, finished_at)
+        )
+
+def rebuild_database(sources: Dict[str, Union[pd.DataFrame, Iterable[pd.DataFrame]]], db_path: str = DB_PATH) -> Dict[str, int]:
+    """Full rebuild into a staging file that atomically replaces the live database"""
+    started_at = datetime.now(timezone.utc).isoformat()
+    staging_path = f"{db_path}.staging"
+    if os.path.exists(staging_path):
+        os.remove(staging_path)
     
-    # Write to SQLite database
-    print("Writing to SQLite database...")
+    conn = sqlite3.connect(staging_path, isolation_level=None)
+    try:
+        # Nothing in the staging file matters until the rename, so skip the journal and fsyncs
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+        
+        # Keep the ingestion history of the database being replaced
+        has_previous = os.path.exists(db_path)
+        if has_previous:
+            conn.execute("ATTACH DATABASE ? AS previous", (db_path,))
+        
+        conn.execute("BEGIN")
+        loaded = {}
+        for table_name, source in sources.items():
+            table_start = time.perf_counter()
+            columns = TABLE_SCHEMAS[table_name]
+            mark_column = TABLE_KEYS[table_name][1]
+            conn.execute(f"CREATE TABLE {table_name} ({', '.join(f'{c} {t}' for c, t in columns)})")
+            insert = f"INSERT INTO {table_name} VALUES ({', '.join('?' for _ in columns)})"
+            
+            rows, high_water_mark = 0, None
+            for chunk in iter_chunks(table_name, source):
+                conn.executemany(insert, chunk_records(chunk))
+                rows += len(chunk)
+                chunk_mark = chunk[mark_column].max()
+                if pd.notna(chunk_mark) and (high_water_mark is None or chunk_mark > high_water_mark):
+                    high_water_mark = chunk_mark
+            
+            loaded[table_name] = (rows, format_datetime(high_water_mark))
+            elapsed = time.perf_counter() - table_start
+            print(f"{table_name}: {rows:,} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+        
+        # Indexes are cheaper to build once over sorted data than to maintain row by row
+        print("Building indexes...")
+        for statement in INDEX_STATEMENTS + INGESTION_STATEMENTS:
+            conn.execute(statement)
+        
+        print("Building rollup tables...")
+        build_rollups(conn)
+        
+        if has_previous:
+            # Indexes applied by index_advisor.py outlive the rebuild
+            for (statement,) in conn.execute("SELECT sql FROM previous.sqlite_master WHERE type = 'index' AND name GLOB ?",
+                                             (f"{ADVISED_PREFIX}*",)).fetchall():
+                try:
+                    conn.execute(statement)
+                except sqlite3.OperationalError as e:
+                    print(f"Skipping advised index that no longer fits the schema: {e}")
+            try:
+                conn.execute("INSERT INTO ingestion_log (table_name, mode, rows_read, rows_written, high_water_mark, started_at, finished_at) "
+                             "SELECT table_name, mode, rows_read, rows_written, high_water_mark, started_at, finished_at "
+                             "FROM previous.ingestion_log ORDER BY id")
+            except sqlite3.OperationalError:
+                pass  # the previous database predates ingestion logging
+        
+        for table_name, (rows, high_water_mark) in loaded.items():
+            record_ingestion(conn, table_name, 'full', rows, rows, high_water_mark, started_at)
+        conn.execute("COMMIT")
+        
+        if has_previous:
+            conn.execute("DETACH DATABASE previous")
+        conn.execute("PRAGMA journal_mode = DELETE")
+    except Exception:
+        conn.close()
+        os.remove(staging_path)
+        raise
+    conn.close()
     
-    with engine.connect() as conn:
-        # Create tables
-        ad_sales_df.to_sql('ad_sales_metrics', conn, if_exists='replace', index=False)
-        total_sales_df.to_sql('total_sales_metrics', conn, if_exists='replace', index=False)
-        eligibility_df.to_sql('product_eligibility', conn, if_exists='replace', index=False)
+    # Readers never see a half-built database: the swap is a single rename
+    os.replace(staging_path, db_path)
+    return {table_name: rows for table_name, (rows, _) in loaded.items()}
+
+def ingest_incremental(sources: Dict[str, Union[pd.DataFrame, Iterable[pd.DataFrame]]], db_path: str = DB_PATH) -> Dict[str, int]:
+    """Upsert only rows at or beyond each table's high-water mark, in one transaction"""
+    conn = sqlite3.connect(db_path)
+    written = {}
+    try:
+        for statement in INDEX_STATEMENTS + INGESTION_STATEMENTS:
+            conn.execute(statement)
+        state = dict(conn.execute("SELECT table_name, high_water_mark FROM ingestion_state").fetchall())
+        rollups_since = None
         
-        # Create indexes for better performance
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ad_sales_item_id ON ad_sales_metrics(item_id)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ad_sales_date ON ad_sales_metrics(date)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_total_sales_item_id ON total_sales_metrics(item_id)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_total_sales_date ON total_sales_metrics(date)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_eligibility_item_id ON product_eligibility(item_id)"))
+        # All tables and their rollups become visible to readers in a single commit
+        conn.execute("BEGIN")
+        
+        for table_name, source in sources.items():
+            started_at = datetime.now(timezone.utc).isoformat()
+            key_columns, mark_column = TABLE_KEYS[table_name]
+            high_water_mark = state.get(table_name)
+            
+            columns = [column for column, _ in TABLE_SCHEMAS[table_name]]
+            placeholders = ', '.join('?' for _ in columns)
+            value_columns = [c for c in columns if c not in key_columns]
+            updates = ', '.join(f"{c} = excluded.{c}" for c in value_columns)
+            changed = ' OR '.join(f"{c} IS NOT excluded.{c}" for c in value_columns)
+            # Unchanged rows re-sent at the mark are skipped rather than rewritten
+            statement = (
+                f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) "
+                f"ON CONFLICT({', '.join(key_columns)}) DO "
+                + (f"UPDATE SET {updates} WHERE {changed}" if value_columns else "NOTHING")
+            )
+            
+            rows_read, rows_new, new_mark, since = 0, 0, None, None
+            changes_before = conn.total_changes
+            for chunk in iter_chunks(table_name, source):
+                rows_read += len(chunk)
+                # Rows at the mark are re-upserted: the last exported day may have been partial
+                if high_water_mark is not None:
+                    chunk = chunk[chunk[mark_column] >= pd.Timestamp(high_water_mark)]
+                if not len(chunk):
+                    continue
+                conn.executemany(statement, chunk_records(chunk))
+                rows_new += len(chunk)
+                chunk_max, chunk_min = chunk[mark_column].max(), chunk[mark_column].min()
+                new_mark = chunk_max if new_mark is None else max(new_mark, chunk_max)
+                since = chunk_min if since is None else min(since, chunk_min)
+            written[table_name] = conn.total_changes - changes_before
+            
+            record_ingestion(conn, table_name, 'incremental', rows_read, written[table_name],
+                             format_datetime(new_mark) if rows_new else high_water_mark, started_at)
+            print(f"{table_name}: {rows_new} of {rows_read} rows at or past the high-water mark, {written[table_name]} written")
+            
+            # Rows re-sent unchanged are not written, so they do not trigger a rollup refresh
+            if table_name in ('ad_sales_metrics', 'total_sales_metrics') and written[table_name]:
+                since = format_datetime(since)
+                rollups_since = since if rollups_since is None else min(rollups_since, since)
+        
+        if not any(written.values()):
+            # Logging a no-op run would still rewrite the file and invalidate every reader's caches
+            print("No new or changed rows; database left untouched")
+            conn.rollback()
+            return written
+        
+        if rollups_since is not None:
+            print(f"Refreshing rollups from {rollups_since}...")
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'item_daily_metrics'").fetchone():
+                refresh_rollups(conn, rollups_since)
+            else:
+                build_rollups(conn)
         
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return written
+
+def setup_database(incremental: bool = False, db_path: str = DB_PATH, source_dir: str = '.',
+                   chunk_rows: int = LOAD_CHUNK_ROWS):
+    """Convert Excel files to SQLite database with proper schema"""
+    
+    start_time = time.perf_counter()
+    sources = read_source_files(source_dir, chunk_rows)
     
-    print("Database setup completed!")
+    if incremental and os.path.exists(db_path):
+        print("Ingesting new rows incrementally...")
+        ingest_incremental(sources, db_path)
+        print(f"Database setup completed in {time.perf_counter() - start_time:.2f}s!")
+    else:
+        rows = sum(rebuild_database(sources, db_path).values())
+        elapsed = time.perf_counter() - start_time
+        print(f"Database setup completed in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec overall)!")
     print("Tables created:")
     print("- ad_sales_metrics")
-    print("- total_sales_metrics") 
+    print("- total_sales_metrics")
     print("- product_eligibility")
-    
+    print("- item_daily_metrics, item_totals, daily_totals (rollups)")
+
     # Verify data
-    with engine.connect() as conn:
-        result = conn.execute(text("SELECT COUNT(*) as count FROM ad_sales_metrics"))
+    conn = sqlite3.connect(db_path)
+    try:
+        result = conn.execute("SELECT COUNT(*) as count FROM ad_sales_metrics")
         print(f"Ad sales records: {result.fetchone()[0]}")
-        
-        result = conn.execute(text("SELECT COUNT(*) as count FROM total_sales_metrics"))
+
+        result = conn.execute("SELECT COUNT(*) as count FROM total_sales_metrics")
         print(f"Total sales records: {result.fetchone()[0]}")
-        
-        result = conn.execute(text("SELECT COUNT(*) as count FROM product_eligibility"))
+
+        result = conn.execute("SELECT COUNT(*) as count FROM product_eligibility")
         print(f"Eligibility records: {result.fetchone()[0]}")
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
-    setup_database() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load the product exports (Excel, CSV or Parquet) into SQLite")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Upsert only rows past each table's high-water mark instead of rebuilding")
+    parser.add_argument("--source-dir", default=".",
+                        help="Directory holding <table>.parquet, <table>.csv or the mapped Excel files")
+    parser.add_argument("--chunk-rows", type=int, default=LOAD_CHUNK_ROWS,
+                        help="Rows read and inserted per batch")
+    args = parser.parse_args()
+    setup_database(incremental=args.incremental, source_dir=args.source_dir, chunk_rows=args.chunk_rows)
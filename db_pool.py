@@ -0,0 +1,134 @@
+import sqlite3
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+from urllib.request import pathname2url
+
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived, read-only SQLite connections"""
+
+    def __init__(self, db_path: str, size: int = 4, mmap_size: int = 256 * 1024 * 1024,
+                 cache_size_kb: int = 64 * 1024, acquire_timeout: float = 30.0):
+        self.db_path = db_path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._stats = {"acquired": 0, "waits": 0, "opened": 0, "reopened": 0, "health_check_failures": 0}
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, returning it to the pool afterwards"""
+        conn = self._acquire()
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            if not self._is_healthy(conn):
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+
+    def close_all(self) -> None:
+        """Close every idle connection; busy ones are closed when returned and reacquired"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool size, utilization and lifecycle counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["open"] = self._opened
+        stats["idle"] = self._idle.qsize()
+        stats["in_use"] = stats["open"] - stats["idle"]
+        return stats
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            self._stats["acquired"] += 1
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open_if_room()
+            if conn is None:
+                with self._lock:
+                    self._stats["waits"] += 1
+                conn = self._idle.get(timeout=self.acquire_timeout)
+
+        # Reopen when the database file has been replaced underneath us
+        if conn.file_identity != self._file_identity():
+            self._discard(conn)
+            conn = self._open()
+            with self._lock:
+                self._opened += 1
+                self._stats["reopened"] += 1
+        return conn
+
+    def _open_if_room(self) -> Optional[sqlite3.Connection]:
+        with self._lock:
+            if self._opened >= self.size:
+                return None
+            self._opened += 1
+        try:
+            return self._open()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _open(self) -> sqlite3.Connection:
+        uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        conn = PooledConnection(uri, uri=True, check_same_thread=False)
+        conn.file_identity = self._file_identity()
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA query_only = 1")
+        with self._lock:
+            self._stats["opened"] += 1
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def _file_identity(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino)
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection that remembers which database file it was opened on"""
+
+    file_identity = None
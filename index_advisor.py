@@ -0,0 +1,487 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from query_guard import QueryGuard, TABLE_REFERENCE_PATTERN, INDEX_NAME_PATTERN
+
+STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+NUMBER_PATTERN = re.compile(r'\b\d+(?:\.\d+)?\b')
+COLUMN_PATTERN = re.compile(r'\b(?:(\w+)\.)?(\w+)\b')
+CLAUSE_PATTERN = re.compile(r'\b(select|from|join|on|where|group\s+by|having|order\s+by|limit)\b', re.IGNORECASE)
+
+# How a column is compared in a WHERE or ON clause, looking at the text on either side of it
+EQUALITY_AFTER = re.compile(r'\s*(?:=|in\b|is\s+(?!not\b))', re.IGNORECASE)
+RANGE_AFTER = re.compile(r'\s*(?:[<>]|between\b|like\b|glob\b)', re.IGNORECASE)
+EQUALITY_BEFORE = re.compile(r'(?<![<>!])=\s*$')
+RANGE_BEFORE = re.compile(r'[<>]=?\s*$')
+
+# Indexes created by the advisor; database_setup.py carries them over full rebuilds
+ADVISED_PREFIX = 'idx_advised_'
+MAX_INDEX_COLUMNS = 6
+
+
+def query_fingerprint(sql_query: str) -> str:
+    """Hash of the query with literals masked, so queries differing only in values share a workload entry"""
+    masked = NUMBER_PATTERN.sub('?', STRING_PATTERN.sub('?', sql_query))
+    return hashlib.sha256(' '.join(masked.lower().split()).encode()).hexdigest()
+
+
+class WorkloadLog:
+    """Executed queries aggregated by shape, kept in SQLite for the index advisor"""
+    
+    def __init__(self, path: str = 'query_workload.db', max_queries: int = 1000, flush_seconds: float = 30.0):
+        self.path = path
+        self.max_queries = max_queries
+        self.flush_seconds = flush_seconds
+        
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._stats = {"recorded": 0, "flushes": 0}
+        
+        self._conn = None
+        try:
+            self._conn = sqlite3.connect(path or ':memory:', check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_workload (
+                    fingerprint TEXT PRIMARY KEY,
+                    sql_query TEXT,
+                    params TEXT,
+                    executions INTEGER,
+                    total_seconds REAL,
+                    max_seconds REAL,
+                    last_seen REAL
+                )
+            """)
+            self._conn.commit()
+        except Exception as e:
+            print(f"Error opening workload log at {path}: {e}")
+            self._conn = None
+    
+    def record(self, sql_query: str, params: Optional[list], seconds: float) -> None:
+        """Count one execution of a query; executions are written to disk in batches"""
+        key = query_fingerprint(sql_query)
+        with self._lock:
+            entry = self._pending.setdefault(key, {"executions": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            entry["sql_query"] = sql_query
+            entry["params"] = params
+            entry["executions"] += 1
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["last_seen"] = time.time()
+            self._stats["recorded"] += 1
+            due = time.monotonic() - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Write pending executions and keep only the most recently seen max_queries shapes"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            if not pending or self._conn is None:
+                return
+            rows = [
+                (key, entry["sql_query"], json.dumps(entry["params"] or [], default=str), entry["executions"],
+                 entry["total_seconds"], entry["max_seconds"], entry["last_seen"])
+                for key, entry in pending.items()
+            ]
+            try:
+                self._conn.executemany("""
+                    INSERT INTO query_workload VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(fingerprint) DO UPDATE SET
+                        sql_query = excluded.sql_query,
+                        params = excluded.params,
+                        executions = executions + excluded.executions,
+                        total_seconds = total_seconds + excluded.total_seconds,
+                        max_seconds = MAX(max_seconds, excluded.max_seconds),
+                        last_seen = excluded.last_seen
+                """, rows)
+                self._conn.execute(
+                    "DELETE FROM query_workload WHERE fingerprint NOT IN "
+                    "(SELECT fingerprint FROM query_workload ORDER BY last_seen DESC LIMIT ?)",
+                    (self.max_queries,)
+                )
+                self._conn.commit()
+                self._stats["flushes"] += 1
+            except Exception as e:
+                print(f"Error writing workload log: {e}")
+    
+    def queries(self) -> List[Dict[str, Any]]:
+        """Every recorded query shape with a sample SQL and parameters, most total time first"""
+        self.flush()
+        if self._conn is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sql_query, params, executions, total_seconds, max_seconds FROM query_workload "
+                "ORDER BY total_seconds DESC"
+            ).fetchall()
+        return [
+            {"sql_query": sql_query, "params": json.loads(params), "executions": executions,
+             "total_seconds": total_seconds, "max_seconds": max_seconds}
+            for sql_query, params, executions, total_seconds, max_seconds in rows
+        ]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return logging counters and the number of query shapes on disk"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            if self._conn is not None:
+                stats["queries"] = self._conn.execute("SELECT COUNT(*) FROM query_workload").fetchone()[0]
+        return stats
+    
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class IndexCandidate:
+    """A proposed index: a table and its ordered key columns"""
+    
+    def __init__(self, table: str, columns: Tuple[str, ...]):
+        self.table = table
+        self.columns = columns
+    
+    @property
+    def name(self) -> str:
+        return f"{ADVISED_PREFIX}{self.table}_{'_'.join(self.columns)}"
+    
+    @property
+    def sql(self) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table}({', '.join(self.columns)})"
+
+
+class IndexAdvisor:
+    """Proposes composite and covering indexes for a recorded workload by costing what-if query plans"""
+    
+    def __init__(self, db_path: str = 'product_data.db', max_indexes: int = 5, min_improvement: float = 0.05):
+        self.db_path = db_path
+        self.max_indexes = max_indexes
+        self.min_improvement = min_improvement
+        # Reuse the guard's plan cost model; its limits play no part here
+        self.guard = QueryGuard()
+    
+    def advise(self, workload: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Greedily pick the candidate indexes that cut the workload's estimated cost the most"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            schema = self.schema(conn)
+            tables = self.guard.table_info(conn, None)
+            candidates = self.candidates(workload, schema)
+            statistics = self.statistics(conn, schema, candidates)
+        finally:
+            conn.close()
+        
+        # Only queries that plan against this schema can be costed
+        scratch = self.scratch_database(schema, [], statistics)
+        try:
+            queries = [query for query in workload if self._plans(scratch, query)]
+        finally:
+            scratch.close()
+        
+        baseline = self.plan_costs(queries, schema, [], tables, statistics)
+        chosen, current = [], baseline
+        while len(chosen) < self.max_indexes:
+            best, best_costs = None, None
+            for candidate in candidates:
+                if candidate in chosen:
+                    continue
+                costs = self.plan_costs(queries, schema, chosen + [candidate], tables, statistics)
+                if best_costs is None or self._total(queries, costs) < self._total(queries, best_costs):
+                    best, best_costs = candidate, costs
+            if best is None:
+                break
+            # Judge the gain against the queries whose plans changed, so one heavy query does not mask the rest
+            changed = [i for i, ((cost, _), (best_cost, _)) in enumerate(zip(current, best_costs)) if best_cost != cost]
+            changed_before = self._total([queries[i] for i in changed], [current[i] for i in changed])
+            changed_after = self._total([queries[i] for i in changed], [best_costs[i] for i in changed])
+            if not changed_before or changed_after > changed_before * (1 - self.min_improvement):
+                break
+            chosen.append(best)
+            current = best_costs
+        
+        # An index chosen early can be made redundant by a wider one chosen later
+        used = {name for _, names in current for name in names}
+        chosen = [candidate for candidate in chosen if candidate.name in used]
+        
+        before, after = self._total(queries, baseline), self._total(queries, current)
+        return {
+            "queries": [
+                {"sql_query": query["sql_query"], "params": query["params"], "executions": query["executions"],
+                 "estimated_cost_before": cost_before, "estimated_cost_after": cost_after, "indexes": names}
+                for query, (cost_before, _), (cost_after, names) in zip(queries, baseline, current)
+            ],
+            "indexes": [
+                {"name": candidate.name, "table": candidate.table, "columns": list(candidate.columns), "sql": candidate.sql,
+                 "queries": sum(candidate.name in names for _, names in current)}
+                for candidate in chosen
+            ],
+            "estimated_cost_before": before,
+            "estimated_cost_after": after,
+            "estimated_speedup": before / after if after else 1.0,
+        }
+    
+    def schema(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        """Table and index DDL, each table's columns and the key columns of its existing indexes"""
+        schema = {"tables": [], "indexes": [], "columns": {}, "index_columns": {}}
+        for kind, name, table, sql in conn.execute(
+            "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' AND sql IS NOT NULL"
+        ).fetchall():
+            if kind == 'table':
+                schema["tables"].append(sql)
+                schema["columns"][name.lower()] = [row[1].lower() for row in conn.execute(f'PRAGMA table_info("{name}")')]
+            elif kind == 'index':
+                schema["indexes"].append(sql)
+        for table in schema["columns"]:
+            schema["index_columns"][table] = [
+                tuple(row[2].lower() for row in conn.execute(f'PRAGMA index_info("{index_name}")'))
+                for _, index_name, *_ in conn.execute(f'PRAGMA index_list("{table}")').fetchall()
+            ]
+        return schema
+    
+    def query_columns(self, sql_query: str, columns: Dict[str, List[str]]) -> Dict[str, Dict[str, List[str]]]:
+        """Columns of each referenced table used in equality and range predicates, GROUP BY, ORDER BY or anywhere"""
+        sql = STRING_PATTERN.sub('?', sql_query)
+        aliases = {}
+        for table, alias in TABLE_REFERENCE_PATTERN.findall(sql):
+            if table.lower() in columns:
+                aliases[table.lower()] = table.lower()
+                if alias:
+                    aliases[alias.lower()] = table.lower()
+        used = {table: {"equality": [], "range": [], "group": [], "order": [], "read": []} for table in set(aliases.values())}
+        clauses = [(match.start(), ' '.join(match.group(1).lower().split())) for match in CLAUSE_PATTERN.finditer(sql)]
+        
+        for match in COLUMN_PATTERN.finditer(sql):
+            qualifier, column = match.group(1), match.group(2).lower()
+            if qualifier:
+                owners = [aliases[qualifier.lower()]] if qualifier.lower() in aliases else []
+            else:
+                owners = list(used)
+            owners = [table for table in owners if column in columns[table]]
+            if not owners:
+                continue
+            
+            clause = next((name for start, name in reversed(clauses) if start < match.start()), 'select')
+            role = None
+            if clause in ('where', 'on'):
+                after, before = sql[match.end():], sql[:match.start()]
+                if EQUALITY_AFTER.match(after) or EQUALITY_BEFORE.search(before):
+                    role = "equality"
+                elif RANGE_AFTER.match(after) or RANGE_BEFORE.search(before):
+                    role = "range"
+            elif clause == 'group by':
+                role = "group"
+            elif clause == 'order by':
+                role = "order"
+            for table in owners:
+                for key in (role, "read"):
+                    if key and column not in used[table][key]:
+                        used[table][key].append(column)
+        return used
+    
+    def candidates(self, workload: List[Dict[str, Any]], schema: Dict[str, Any]) -> List[IndexCandidate]:
+        """Composite keys (equalities, then a range or the grouping/sort columns) and their covering extensions"""
+        found = []
+        for query in workload:
+            for table, used in self.query_columns(query["sql_query"], schema["columns"]).items():
+                equality = used["equality"]
+                keys = [equality + used["range"][:1]]
+                for sort_columns in (used["group"], used["order"]):
+                    if sort_columns:
+                        keys.append(equality + [column for column in sort_columns if column not in equality])
+                # Covering versions answer the query from the index without touching the table
+                for key in list(keys):
+                    covering = key + [column for column in used["read"] if column not in key]
+                    if covering != key and len(covering) <= MAX_INDEX_COLUMNS:
+                        keys.append(covering)
+                for key in keys:
+                    key = tuple(dict.fromkeys(key))
+                    existing = schema["index_columns"].get(table, [])
+                    if not key or any(columns[:len(key)] == key for columns in existing) or (table, key) in found:
+                        continue
+                    found.append((table, key))
+        return [IndexCandidate(table, key) for table, key in found]
+    
+    def statistics(self, conn: sqlite3.Connection, schema: Dict[str, Any],
+                   candidates: List[IndexCandidate]) -> Optional[List[tuple]]:
+        """sqlite_stat1 rows for the existing and candidate indexes, or None when the database was never analyzed"""
+        try:
+            rows = conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1").fetchall()
+        except sqlite3.OperationalError:
+            return None
+        # The planner reads "rows avg-rows-per-prefix..." per index; derive it for the indexes that do not exist yet
+        for candidate in candidates:
+            total = conn.execute(f'SELECT COUNT(*) FROM "{candidate.table}"').fetchone()[0]
+            averages = []
+            for width in range(1, len(candidate.columns) + 1):
+                prefix = ', '.join(candidate.columns[:width])
+                distinct = conn.execute(f'SELECT COUNT(*) FROM (SELECT DISTINCT {prefix} FROM "{candidate.table}")').fetchone()[0]
+                averages.append(str(math.ceil(total / max(distinct, 1))))
+            rows.append((candidate.table, candidate.name, f"{total} {' '.join(averages)}"))
+        return rows
+    
+    def scratch_database(self, schema: Dict[str, Any], indexes: List[IndexCandidate],
+                         statistics: Optional[List[tuple]]) -> sqlite3.Connection:
+        """Empty in-memory copy of the schema plus the given indexes, planning with the real statistics"""
+        scratch = sqlite3.connect(':memory:')
+        for sql in schema["tables"] + schema["indexes"] + [candidate.sql for candidate in indexes]:
+            scratch.execute(sql)
+        if statistics is not None:
+            scratch.execute("ANALYZE")
+            scratch.execute("DELETE FROM sqlite_stat1")
+            scratch.executemany("INSERT INTO sqlite_stat1 VALUES (?, ?, ?)", statistics)
+            scratch.execute("ANALYZE sqlite_schema")
+        return scratch
+    
+    def plan_costs(self, queries: List[Dict[str, Any]], schema: Dict[str, Any], indexes: List[IndexCandidate],
+                   tables: Dict[str, Dict[str, Any]], statistics: Optional[List[tuple]]) -> List[Tuple[float, List[str]]]:
+        """Estimated cost of each query with the given indexes added, and the advised indexes its plan uses"""
+        scratch = self.scratch_database(schema, indexes, statistics)
+        try:
+            costs = []
+            for query in queries:
+                plan = scratch.execute(f"EXPLAIN QUERY PLAN {query['sql_query']}", query["params"] or []).fetchall()
+                aliases = {alias.lower(): table.lower() for table, alias in TABLE_REFERENCE_PATTERN.findall(query["sql_query"]) if alias}
+                names = sorted({match.group(1) for *_, detail in plan for match in INDEX_NAME_PATTERN.finditer(detail)
+                                if match.group(1).startswith(ADVISED_PREFIX)})
+                costs.append((self.guard.estimate_cost(plan, tables, aliases, detailed=True), names))
+            return costs
+        finally:
+            scratch.close()
+    
+    def measure(self, db_path: str, indexes: List[Dict[str, Any]], queries: List[Dict[str, Any]],
+                repeat: int = 3) -> Dict[str, Any]:
+        """Time the workload, create the indexes in db_path, and time it again"""
+        before = self.time_queries(db_path, queries, repeat)
+        conn = sqlite3.connect(db_path)
+        try:
+            analyzed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+            for index in indexes:
+                start = time.perf_counter()
+                conn.execute(index["sql"])
+                if analyzed:
+                    conn.execute(f"ANALYZE {index['name']}")
+                index["build_seconds"] = time.perf_counter() - start
+            conn.commit()
+        finally:
+            conn.close()
+        after = self.time_queries(db_path, queries, repeat)
+        
+        total_before = sum(query["executions"] * seconds for query, seconds in zip(queries, before))
+        total_after = sum(query["executions"] * seconds for query, seconds in zip(queries, after))
+        for query, seconds_before, seconds_after in zip(queries, before, after):
+            query["seconds_before"], query["seconds_after"] = seconds_before, seconds_after
+        return {
+            "workload_seconds_before": total_before,
+            "workload_seconds_after": total_after,
+            "measured_speedup": total_before / total_after if total_after else 1.0,
+        }
+    
+    def time_queries(self, db_path: str, queries: List[Dict[str, Any]], repeat: int) -> List[float]:
+        """Best-of-repeat wall time of each query on a fresh read-only connection, after one warm-up run"""
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            timings = []
+            for query in queries:
+                conn.execute(query["sql_query"], query["params"] or []).fetchall()
+                best = float('inf')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    conn.execute(query["sql_query"], query["params"] or []).fetchall()
+                    best = min(best, time.perf_counter() - start)
+                timings.append(best)
+            return timings
+        finally:
+            conn.close()
+    
+    def _plans(self, scratch: sqlite3.Connection, query: Dict[str, Any]) -> bool:
+        try:
+            scratch.execute(f"EXPLAIN QUERY PLAN {query['sql_query']}", query["params"] or []).fetchall()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def _total(self, queries: List[Dict[str, Any]], costs: List[Tuple[float, List[str]]]) -> float:
+        return sum(query["executions"] * cost for query, (cost, _) in zip(queries, costs))
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print("Index Advisor")
+    print("=" * 60)
+    if not report["indexes"]:
+        print(f"No index improves the estimated cost of the {len(report['queries'])} recorded queries")
+        return
+    print(f"Recommended indexes for {len(report['queries'])} recorded query shapes:")
+    for index in report["indexes"]:
+        built = f", built in {index['build_seconds']:.2f}s" if "build_seconds" in index else ""
+        print(f"  {index['sql']};  -- used by {index['queries']} of the recorded queries{built}")
+    print()
+    for query in report["queries"]:
+        if not query["indexes"]:
+            continue
+        print(f"  {' '.join(query['sql_query'].split())[:100]}")
+        line = (f"    x{query['executions']}: estimated cost {query['estimated_cost_before']:,.0f} -> "
+                f"{query['estimated_cost_after']:,.0f}")
+        if "seconds_before" in query:
+            line += f", measured {query['seconds_before'] * 1000:.2f}ms -> {query['seconds_after'] * 1000:.2f}ms"
+        print(line)
+    print("=" * 60)
+    print(f"Estimated workload speedup: {report['estimated_speedup']:.1f}x")
+    if "measured" in report:
+        measured = report["measured"]
+        print(f"Measured workload speedup:  {measured['measured_speedup']:.1f}x "
+              f"({measured['workload_seconds_before']:.3f}s -> {measured['workload_seconds_after']:.3f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommend composite and covering indexes for the logged query workload")
+    parser.add_argument("--db", default="product_data.db", help="SQLite database the workload runs against")
+    parser.add_argument("--log", default="query_workload.db", help="Workload log written by the agent (WORKLOAD_LOG_PATH)")
+    parser.add_argument("--max-indexes", type=int, default=5, help="Most indexes to recommend")
+    parser.add_argument("--measure", action="store_true", help="Time the workload with the indexes on a copy of the database")
+    parser.add_argument("--apply", action="store_true", help="Create the indexes in the database and time the workload before and after")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per query when measuring")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+    
+    log = WorkloadLog(args.log)
+    workload = log.queries()
+    log.close()
+    if not workload:
+        print(f"No queries recorded in {args.log}")
+        return
+    
+    advisor = IndexAdvisor(args.db, max_indexes=args.max_indexes)
+    report = advisor.advise(workload)
+    if report["indexes"] and (args.measure or args.apply):
+        if args.apply:
+            report["measured"] = advisor.measure(args.db, report["indexes"], report["queries"], args.repeat)
+        else:
+            scratch_dir = tempfile.mkdtemp()
+            try:
+                copy_path = os.path.join(scratch_dir, os.path.basename(args.db))
+                shutil.copyfile(args.db, copy_path)
+                report["measured"] = advisor.measure(copy_path, report["indexes"], report["queries"], args.repeat)
+            finally:
+                shutil.rmtree(scratch_dir)
+    
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+import re
+from typing import Dict, Any, Optional, List, Callable, Tuple
+import pandas as pd
+
+# Optional slots recognised inside a question
+ITEM_PATTERN = re.compile(r'\b(?:product|item)(?:\s*id)?\s*(?:#|no\.?|number)?\s*(\d+)\b', re.IGNORECASE)
+DATE_RANGE_PATTERN = re.compile(r'\b(?:between|from)\s+(\d{4}-\d{2}-\d{2})\s+(?:and|to|until|through)\s+(\d{4}-\d{2}-\d{2})\b', re.IGNORECASE)
+SINGLE_DATE_PATTERN = re.compile(r'\bon\s+(\d{4}-\d{2}-\d{2})\b', re.IGNORECASE)
+SINCE_PATTERN = re.compile(r'\b(?:since|after)\s+(\d{4}-\d{2}-\d{2})\b', re.IGNORECASE)
+
+# Metric names that contain words the qualifier checks below would otherwise read as qualifiers
+METRIC_PHRASES = re.compile(r'\bcost\s+per\s+click\b|\bnot\s+eligible\b', re.IGNORECASE)
+
+# Qualifiers no template honours: the question needs the model whichever intent it mentions
+UNHANDLED_QUALIFIERS = [
+    # Negation
+    re.compile(r'\b(?:excluding|exclude|except|without|not|other than|apart from)\b', re.IGNORECASE),
+    # Grouping, ranking and trends
+    re.compile(r'\b(?:each|every|per|daily|weekly|monthly|yearly|breakdown|trend|over\s+time|by\s+(?:day|date|week|month|year|quarter|product|item)s?|top\s+\d+|\d+\s+(?:best|worst|top))\b',
+               re.IGNORECASE),
+    # Dates the slot patterns do not parse: months, years and relative periods
+    re.compile(r'\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?'
+               r'|\d{4}|today|yesterday|tonight|last|this|past|previous|recent(?:ly)?|ytd|mtd|week|month|year|quarter|q[1-4])\b',
+               re.IGNORECASE),
+]
+
+# Words that carry no meaning a template could drop; anything else left in a question sends it to the model
+FILLER_WORDS = {
+    "what", "whats", "what's", "is", "are", "was", "were", "my", "our", "the", "a", "an", "of", "for", "me",
+    "show", "tell", "give", "get", "calculate", "compute", "find", "please", "can", "could", "you", "i", "we",
+    "do", "does", "did", "current", "currently", "all", "across", "overall", "so", "far", "to", "date",
+}
+
+# For totals, "across all products" restates the default scope
+ALL_PRODUCTS = ["products", "items"]
+
+# Latest eligibility check per product; items are re-checked over time
+LATEST_ELIGIBILITY = """
+    WITH latest AS (
+        SELECT p.item_id, p.eligibility, p.message
+        FROM product_eligibility p
+        JOIN (
+            SELECT item_id, MAX(eligibility_datetime_utc) AS checked_at
+            FROM product_eligibility
+            GROUP BY item_id
+        ) m ON p.item_id = m.item_id AND p.eligibility_datetime_utc = m.checked_at
+    )
+"""
+
+
+def format_currency(value) -> str:
+    """Format a number as dollars, tolerating NULL aggregates"""
+    return f"${value:,.2f}" if pd.notna(value) else "$0.00"
+
+
+def format_number(value) -> str:
+    """Format a count with thousands separators"""
+    return f"{int(value):,}" if pd.notna(value) else "0"
+
+
+class IntentMatch:
+    """A recognised question resolved to parameterized SQL and an answer template"""
+    
+    def __init__(self, name: str, sql_query: str, params: List[Any], scope: str,
+                 answer: Callable[[pd.DataFrame, str], str]):
+        self.name = name
+        self.sql_query = sql_query
+        self.params = params
+        self.scope = scope
+        self._answer = answer
+    
+    @property
+    def display_sql(self) -> str:
+        """SQL with the validated slot values inlined, for showing to users"""
+        parts = self.sql_query.split('?')
+        rendered = parts[0]
+        for value, part in zip(self.params, parts[1:]):
+            rendered += (str(value) if isinstance(value, int) else f"'{value}'") + part
+        return rendered
+    
+    def render_answer(self, results_df: pd.DataFrame) -> str:
+        """Fill the answer template from the query results"""
+        if results_df.empty:
+            return f"No matching data was found{self.scope}."
+        return self._answer(results_df, self.scope)
+
+
+class Intent:
+    """A canonical KPI question: trigger patterns, a SQL template and an answer template"""
+    
+    def __init__(self, name: str, patterns: List[str], sql_template: str,
+                 answer: Callable[[pd.DataFrame, str], str], date_column: Optional[str] = None,
+                 supports_item: bool = False, exclude: Optional[List[str]] = None,
+                 vocabulary: Optional[List[str]] = None):
+        self.name = name
+        self.patterns = [re.compile(p, re.IGNORECASE) for p in patterns]
+        self.exclude = [re.compile(p, re.IGNORECASE) for p in (exclude or [])]
+        self.sql_template = sql_template
+        self.answer = answer
+        self.date_column = date_column
+        self.supports_item = supports_item
+        # Words besides FILLER_WORDS that canonical phrasings of this question use
+        self.vocabulary = set(vocabulary or [])
+    
+    def matches(self, question: str) -> bool:
+        """Return True if the question triggers this intent"""
+        if any(p.search(question) for p in self.exclude):
+            return False
+        return any(p.search(question) for p in self.patterns)
+    
+    def unexplained_words(self, question: str, slot_spans: List[Tuple[int, int]]) -> List[str]:
+        """Words left once the trigger phrases, slots, filler and this intent's vocabulary are removed"""
+        spans = list(slot_spans)
+        for pattern in self.patterns:
+            for match in pattern.finditer(question):
+                # Triggers such as '\bad' end mid-word; the rest of that word belongs to them
+                end = match.end()
+                while end < len(question) and question[end].isalnum():
+                    end += 1
+                spans.append((match.start(), end))
+        remainder = list(question.lower())
+        for start, end in spans:
+            remainder[start:end] = [' '] * (end - start)
+        words = re.findall(r"[a-z0-9']+", ''.join(remainder))
+        return [word for word in words if word not in FILLER_WORDS and word not in self.vocabulary]
+
+
+class IntentRouter:
+    """Rule-based matcher that answers known KPI questions without calling the model"""
+    
+    def __init__(self, intents: Optional[List[Intent]] = None):
+        self.intents = intents if intents is not None else default_intents()
+        self._stats = {"matched": 0, "fallthrough": 0}
+    
+    def match(self, question: str) -> Optional[IntentMatch]:
+        """Resolve a question to an IntentMatch, or None to fall through to the model"""
+        slots = self.extract_slots(question)
+        if self.has_unhandled_qualifier(question, slots["spans"]):
+            self._stats["fallthrough"] += 1
+            return None
+        
+        for intent in self.intents:
+            if not intent.matches(question):
+                continue
+            # The template answers the canonical question only; any other word may change what is asked
+            if intent.unexplained_words(question, slots["spans"]):
+                continue
+            
+            # A slot the template cannot honour means the model should handle it
+            if slots["item_id"] is not None and not intent.supports_item:
+                break
+            if slots["date_range"] is not None and intent.date_column is None:
+                break
+            
+            self._stats["matched"] += 1
+            return self.build_match(intent, slots)
+        
+        self._stats["fallthrough"] += 1
+        return None
+    
+    def has_unhandled_qualifier(self, question: str, slot_spans: List[Tuple[int, int]]) -> bool:
+        """True if the question negates, groups, ranks or dates its metric in a way no template supports"""
+        text = list(question)
+        for start, end in slot_spans:
+            text[start:end] = [' '] * (end - start)
+        text = METRIC_PHRASES.sub(' ', ''.join(text))
+        return any(pattern.search(text) for pattern in UNHANDLED_QUALIFIERS)
+    
+    def extract_slots(self, question: str) -> Dict[str, Any]:
+        """Pull the optional item_id and date-range slots, and the spans they cover, out of a question"""
+        item_match = ITEM_PATTERN.search(question)
+        date_range = None
+        date_match = None
+        
+        range_match = DATE_RANGE_PATTERN.search(question)
+        single_match = SINGLE_DATE_PATTERN.search(question)
+        since_match = SINCE_PATTERN.search(question)
+        if range_match:
+            date_range, date_match = (range_match.group(1), range_match.group(2)), range_match
+        elif single_match:
+            date_range, date_match = (single_match.group(1), single_match.group(1)), single_match
+        elif since_match:
+            date_range, date_match = (since_match.group(1), None), since_match
+        
+        return {
+            "item_id": int(item_match.group(1)) if item_match else None,
+            "date_range": date_range,
+            "spans": [match.span() for match in (item_match, date_match) if match is not None]
+        }
+    
+    def build_match(self, intent: Intent, slots: Dict[str, Any]) -> IntentMatch:
+        """Fill the intent's SQL template with WHERE clauses for the provided slots"""
+        conditions = []
+        params = []
+        scope = ""
+        
+        if slots["item_id"] is not None:
+            conditions.append("item_id = ?")
+            params.append(slots["item_id"])
+            scope += f" for product {slots['item_id']}"
+        
+        if slots["date_range"] is not None:
+            start, end = slots["date_range"]
+            conditions.append(f"{intent.date_column} >= ?")
+            params.append(start)
+            if end is not None:
+                conditions.append(f"{intent.date_column} < date(?, '+1 day')")
+                params.append(end)
+                scope += f" on {start}" if start == end else f" between {start} and {end}"
+            else:
+                scope += f" since {start}"
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Templates that reference {where} more than once reuse the same parameters
+        sql_query = intent.sql_template.format(where=where).strip()
+        params = params * intent.sql_template.count("{where}")
+        return IntentMatch(intent.name, sql_query, params, scope, intent.answer)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return how many questions took the fast path"""
+        stats = dict(self._stats)
+        total = stats["matched"] + stats["fallthrough"]
+        stats["match_rate"] = stats["matched"] / total if total else 0.0
+        return stats
+
+
+def default_intents() -> List[Intent]:
+    """Templates for the canonical KPIs and the /example-questions list, most specific first"""
+    return [
+        Intent(
+            "ad_vs_organic_sales",
+            [r'\bads?\b.*\b(?:vs\.?|versus|compared to)\b.*\borganic\b', r'\borganic\b.*\b(?:vs\.?|versus)\b.*\bads?\b'],
+            """
+            SELECT ad.ad_sales, total.total_sales, total.total_sales - ad.ad_sales AS organic_sales
+            FROM (SELECT SUM(ad_sales) AS ad_sales FROM ad_sales_metrics {where}) ad,
+                 (SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics {where}) total
+            """,
+            lambda df, scope: (
+                f"Total revenue{scope} is {format_currency(df['total_sales'].iloc[0])}: "
+                f"{format_currency(df['ad_sales'].iloc[0])} came from ads and "
+                f"{format_currency(df['organic_sales'].iloc[0])} from organic sales."
+            ),
+            date_column="date", supports_item=True,
+            vocabulary=ALL_PRODUCTS + ["total", "revenue", "sales", "from", "how", "much", "came"]
+        ),
+        Intent(
+            "total_sales",
+            [r'\btotal\s+sales\b', r'\bhow much (?:did i|have i|have we|did we) sell\b'],
+            "SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics {where}",
+            lambda df, scope: f"Your total sales{scope} are {format_currency(df['total_sales'].iloc[0])}.",
+            date_column="date", supports_item=True,
+            exclude=[r'\bby\s+(?:day|date|product|item)\b', r'\bper\s+(?:day|product|item)\b', r'\bover time\b', r'\btrend\b'],
+            vocabulary=ALL_PRODUCTS
+        ),
+        Intent(
+            "roas",
+            [r'\broas\b', r'\breturn on ad spend\b'],
+            """
+            SELECT SUM(ad_sales) AS ad_sales, SUM(ad_spend) AS ad_spend,
+                   SUM(ad_sales) / NULLIF(SUM(ad_spend), 0) AS roas
+            FROM ad_sales_metrics {where}
+            """,
+            lambda df, scope: (
+                f"Your RoAS (Return on Ad Spend){scope} is {df['roas'].iloc[0] or 0:.2f}: "
+                f"{format_currency(df['ad_sales'].iloc[0])} in ad sales from "
+                f"{format_currency(df['ad_spend'].iloc[0])} of ad spend."
+            ),
+            date_column="date", supports_item=True,
+            exclude=[r'\b(?:highest|lowest|top|best|worst|by\s+product|per\s+product)\b'],
+            vocabulary=ALL_PRODUCTS
+        ),
+        Intent(
+            "highest_cpc_product",
+            [r'\b(?:highest|max(?:imum)?|top|most expensive)\b.*\b(?:cpc|cost per click)\b'],
+            """
+            SELECT item_id, SUM(ad_spend) AS ad_spend, SUM(clicks) AS clicks,
+                   SUM(ad_spend) / SUM(clicks) AS cpc
+            FROM ad_sales_metrics {where}
+            GROUP BY item_id
+            HAVING SUM(clicks) > 0
+            ORDER BY cpc DESC
+            LIMIT 1
+            """,
+            lambda df, scope: (
+                f"Product {df['item_id'].iloc[0]} had the highest CPC (Cost Per Click){scope} at "
+                f"{format_currency(df['cpc'].iloc[0])} ({format_currency(df['ad_spend'].iloc[0])} "
+                f"spent over {format_number(df['clicks'].iloc[0])} clicks)."
+            ),
+            date_column="date",
+            vocabulary=["which", "product", "item", "had", "has", "have", "with"]
+        ),
+        Intent(
+            "average_cpc",
+            [r'\b(?:cpc|cost per click)\b'],
+            """
+            SELECT SUM(ad_spend) AS ad_spend, SUM(clicks) AS clicks,
+                   SUM(ad_spend) / NULLIF(SUM(clicks), 0) AS cpc
+            FROM ad_sales_metrics {where}
+            """,
+            lambda df, scope: (
+                f"The average CPC (Cost Per Click){scope} is {format_currency(df['cpc'].iloc[0])} "
+                f"across {format_number(df['clicks'].iloc[0])} clicks."
+            ),
+            date_column="date", supports_item=True,
+            exclude=[r'\b(?:lowest|min(?:imum)?|by\s+product|per\s+product|each)\b'],
+            vocabulary=ALL_PRODUCTS + ["average", "avg", "mean"]
+        ),
+        Intent(
+            "ctr",
+            [r'\bctr\b', r'\bclick[\s-]*through rate\b'],
+            """
+            SELECT SUM(clicks) AS clicks, SUM(impressions) AS impressions,
+                   CAST(SUM(clicks) AS REAL) / NULLIF(SUM(impressions), 0) AS ctr
+            FROM ad_sales_metrics {where}
+            """,
+            lambda df, scope: (
+                f"Your CTR (Click Through Rate){scope} is {(df['ctr'].iloc[0] or 0) * 100:.2f}% "
+                f"({format_number(df['clicks'].iloc[0])} clicks from "
+                f"{format_number(df['impressions'].iloc[0])} impressions)."
+            ),
+            date_column="date", supports_item=True,
+            exclude=[r'\b(?:highest|lowest|top|best|worst|by\s+product|per\s+product|each)\b'],
+            vocabulary=ALL_PRODUCTS
+        ),
+        Intent(
+            "ineligible_products",
+            [r'\b(?:not|in)eligible\b', r'\bnot eligible\b'],
+            LATEST_ELIGIBILITY + """
+            SELECT item_id, message FROM latest WHERE eligibility = 0 ORDER BY item_id
+            """,
+            lambda df, scope: (
+                f"{format_number(len(df))} products are currently not eligible for advertising. "
+                f"The most common reason is: {df['message'].mode().iloc[0] if df['message'].notna().any() else 'not provided'}"
+            ),
+            exclude=[r'\bhow many\b', r'\bcount\b'],
+            vocabulary=["which", "products", "product", "items", "list", "and", "why", "reason", "reasons",
+                        "for", "advertising", "ads"]
+        ),
+        Intent(
+            "eligible_product_count",
+            [r'\bhow many\b.*\beligible\b', r'\bcount\b.*\beligible\b', r'\beligible products?\b.*\bcount\b'],
+            LATEST_ELIGIBILITY + """
+            SELECT COUNT(*) AS eligible_products FROM latest WHERE eligibility = 1
+            """,
+            lambda df, scope: (
+                f"{format_number(df['eligible_products'].iloc[0])} products are currently eligible for advertising."
+            ),
+            exclude=[r'\bnot eligible\b', r'\bineligible\b'],
+            vocabulary=["products", "items", "advertising", "ads"]
+        ),
+        Intent(
+            "total_ad_spend",
+            [r'\b(?:total|overall)\s+ad\s+spend\b', r'\bhow much\b.*\bspen[dt]\b.*\bad'],
+            "SELECT SUM(ad_spend) AS ad_spend FROM ad_sales_metrics {where}",
+            lambda df, scope: f"Your total ad spend{scope} is {format_currency(df['ad_spend'].iloc[0])}.",
+            date_column="date", supports_item=True,
+            exclude=[r'\bby\s+(?:day|date|product|item)\b', r'\bper\s+(?:day|product|item)\b'],
+            vocabulary=ALL_PRODUCTS
+        ),
+        Intent(
+            "total_ad_sales",
+            [r'\b(?:total|overall)\s+ad\s+sales\b'],
+            "SELECT SUM(ad_sales) AS ad_sales FROM ad_sales_metrics {where}",
+            lambda df, scope: f"Your total ad sales{scope} are {format_currency(df['ad_sales'].iloc[0])}.",
+            date_column="date", supports_item=True,
+            exclude=[r'\bby\s+(?:day|date|product|item)\b', r'\bper\s+(?:day|product|item)\b'],
+            vocabulary=ALL_PRODUCTS
+        ),
+        Intent(
+            "top_impressions_products",
+            [r'\b(?:highest|most|top)\b.*\bimpressions\b'],
+            """
+            SELECT item_id, SUM(impressions) AS impressions, SUM(clicks) AS clicks
+            FROM ad_sales_metrics {where}
+            GROUP BY item_id
+            ORDER BY impressions DESC
+            LIMIT 10
+            """,
+            lambda df, scope: (
+                f"Product {df['item_id'].iloc[0]} had the most impressions{scope} with "
+                f"{format_number(df['impressions'].iloc[0])}. The top {len(df)} products are listed below."
+            ),
+            date_column="date",
+            vocabulary=["which", "products", "items", "had", "has", "have", "got", "with", "by"]
+        ),
+        Intent(
+            "ad_units_sold",
+            [r'\bunits\b.*\b(?:sold|ordered)\b.*\b(?:from |through |via )?ad(?:s|vertising)?\b'],
+            "SELECT SUM(units_sold) AS units_sold FROM ad_sales_metrics {where}",
+            lambda df, scope: f"{format_number(df['units_sold'].iloc[0])} units were sold from advertising{scope}.",
+            date_column="date", supports_item=True,
+            exclude=[r'\bby\s+(?:day|date|product|item)\b', r'\bper\s+(?:day|product|item)\b'],
+            vocabulary=ALL_PRODUCTS + ["how", "many", "total"]
+        ),
+    ]
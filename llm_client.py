@@ -0,0 +1,152 @@
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator
+
+# HTTP statuses worth retrying: timeouts, quota (429) and transient server errors
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Quota and transient errors; google.api_core exceptions carry the HTTP status as `code`"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, 'code', None) in RETRYABLE_STATUS
+
+
+class TokenBucket:
+    """Allows `rate` call starts per second on average, with bursts of up to `capacity`"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the seconds spent waiting"""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class LLMClient:
+    """Model calls with single-flight coalescing, a concurrency limit, a token bucket and jittered retries"""
+    
+    def __init__(self, max_concurrency: int = 8, rate_per_second: float = 0, burst: int = 0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate_per_second, burst or max_concurrency)
+        
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._in_flight = 0
+        self._queued = 0
+        self._stats = {"calls": 0, "coalesced": 0, "retries": 0, "failures": 0, "throttled_seconds": 0.0}
+    
+    def generate(self, model, prompt: str, **kwargs) -> Any:
+        """generate_content, sharing one call among identical prompts that are already in flight"""
+        key = hashlib.sha256(f"{id(model)}\0{prompt}\0{sorted(kwargs.items())!r}".encode()).hexdigest()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            return flight.result()
+        
+        try:
+            flight.set_result(self._attempt(lambda: model.generate_content(prompt, **kwargs)))
+        except Exception as e:
+            flight.set_exception(e)
+        finally:
+            with self._lock:
+                del self._flights[key]
+        return flight.result()
+    
+    def stream(self, model, prompt: str, **kwargs) -> Iterator[Any]:
+        """Streaming generate_content; holds a concurrency slot until the stream is exhausted or closed"""
+        # Each caller needs every chunk, so streams are limited and retried but not coalesced
+        response = self._attempt(lambda: model.generate_content(prompt, stream=True, **kwargs), hold=True)
+        try:
+            yield from response
+        finally:
+            self._release()
+    
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff, so retrying callers do not hit the quota again in lockstep"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return in-flight and queued calls and the coalescing, retry and throttling counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = self._in_flight
+            stats["queued"] = self._queued
+        stats["max_concurrency"] = self.max_concurrency
+        stats["rate_per_second"] = self.bucket.rate
+        return stats
+    
+    def _attempt(self, call, hold: bool = False) -> Any:
+        """Run call in a concurrency slot, retrying retryable errors; with hold the slot stays taken on success"""
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                result = call()
+            except Exception as e:
+                self._release()
+                if attempt >= self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self._stats["failures"] += 1
+                    raise
+                with self._lock:
+                    self._stats["retries"] += 1
+                # Back off outside the slot so waiting retries do not hold capacity
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            if not hold:
+                self._release()
+            return result
+    
+    def _acquire(self) -> None:
+        with self._lock:
+            self._queued += 1
+        try:
+            if self._slots is not None:
+                self._slots.acquire()
+            throttled = self.bucket.acquire()
+        finally:
+            with self._lock:
+                self._queued -= 1
+        with self._lock:
+            self._in_flight += 1
+            self._stats["calls"] += 1
+            self._stats["throttled_seconds"] += throttled
+    
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        if self._slots is not None:
+            self._slots.release()
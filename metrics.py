@@ -0,0 +1,256 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds: cache hits and fast-path answers land in the first buckets, model calls in the last
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Upper bounds in estimated tokens for prompt sizes
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# Stage timings of the request being handled, filled in by the endpoint and read by the middleware
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_timings', default=None)
+
+# Prompt tokens the request sent to the model per stage, filled in by the agent and returned with the answer
+request_prompt_tokens: ContextVar[Optional[Dict[str, int]]] = ContextVar('request_prompt_tokens', default=None)
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Render stage timings (seconds) as a Server-Timing header value (milliseconds)"""
+    return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in the Prometheus data model"""
+    
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str],
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+    
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: {"buckets": list(values["buckets"]), "sum": values["sum"], "count": values["count"]}
+                      for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = dict(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values["buckets"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(float(bound))})} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {values['count']}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(values['sum'])}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {values['count']}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label set"""
+    
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+    
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return render_family(self.name, self.help_text, "counter",
+                             [(dict(zip(self.label_names, labels)), value) for labels, value in sorted(values.items())])
+
+
+def render_family(name: str, help_text: str, kind: str, samples: List[Tuple[Dict[str, Any], float]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{format_labels(labels)} {format_value(value)}" for labels, value in samples)
+    return lines
+
+
+class Metrics:
+    """Per-stage latency histograms, request and error counters, and agent gauges as Prometheus text"""
+    
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.stage_seconds = Histogram("agent_stage_duration_seconds", "Time spent in each pipeline stage",
+                                       ("endpoint", "stage"), buckets)
+        self.request_seconds = Histogram("agent_http_request_duration_seconds",
+                                         "HTTP request time until the response body was sent", ("path",), buckets)
+        self.requests = Counter("agent_http_requests_total", "HTTP responses by path and status", ("path", "status"))
+        self.errors = Counter("agent_stage_errors_total", "Errors caught and handled inside a pipeline stage", ("stage",))
+        self.batch_sql_fallbacks = Counter("agent_batch_sql_fallbacks_total",
+                                           "Batched questions whose SQL needed a separate per-question model call", ())
+        self.prompt_tokens = Histogram("agent_prompt_tokens", "Estimated prompt tokens per model request",
+                                       ("stage",), TOKEN_BUCKETS)
+        self.time_to_first_token = Histogram("agent_time_to_first_token_seconds",
+                                             "Time from request start to the first streamed response chunk",
+                                             ("endpoint",), buckets)
+    
+    def observe_stages(self, endpoint: str, timings: Dict[str, float]) -> None:
+        for stage, seconds in timings.items():
+            self.stage_seconds.observe(seconds, endpoint, stage)
+    
+    def observe_prompt_tokens(self, stage: str, tokens: int) -> None:
+        self.prompt_tokens.observe(tokens, stage)
+        request_tokens = request_prompt_tokens.get()
+        if request_tokens is not None:
+            request_tokens[stage] = request_tokens.get(stage, 0) + tokens
+    
+    def observe_time_to_first_token(self, endpoint: str, seconds: float) -> None:
+        self.time_to_first_token.observe(seconds, endpoint)
+    
+    def count_error(self, stage: str) -> None:
+        self.errors.inc(stage)
+    
+    def count_batch_sql_fallbacks(self, questions: int) -> None:
+        self.batch_sql_fallbacks.inc(amount=questions)
+    
+    def observe_request(self, path: str, status: int, seconds: float) -> None:
+        self.request_seconds.observe(seconds, path)
+        self.requests.inc(path, str(status))
+    
+    def render(self, agent=None) -> str:
+        """Prometheus text exposition of every metric, plus the agent's cache, pool and LLM gauges"""
+        lines = []
+        for metric in (self.stage_seconds, self.request_seconds, self.requests, self.errors, self.batch_sql_fallbacks,
+                       self.prompt_tokens, self.time_to_first_token):
+            lines.extend(metric.render())
+        if agent is not None:
+            for family in agent_families(agent):
+                lines.extend(render_family(*family))
+        return '\n'.join(lines) + '\n'
+
+
+def agent_families(agent) -> List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]:
+    """Gauges and counters read from the agent components' stats() at scrape time"""
+    sql_cache = agent.sql_cache.stats()
+    result_cache = agent.result_cache.stats()
+    charts = agent.chart_renderer.stats()
+    caches = {
+        "sql": (sql_cache["memory_hits"] + sql_cache["disk_hits"], sql_cache["misses"], sql_cache["hit_rate"]),
+        "result": (result_cache["hits"], result_cache["misses"], result_cache["hit_rate"]),
+        "chart": (charts["cache"]["hits"], charts["cache"]["misses"], charts["cache"]["hit_rate"]),
+    }
+    pool = agent.db_pool.stats()
+    llm = agent.llm.stats()
+    cancellations = agent.cancellation.stats()
+    
+    families = [
+        ("agent_cache_hits_total", "Cache hits", "counter", [({"cache": name}, hits) for name, (hits, _, _) in caches.items()]),
+        ("agent_cache_misses_total", "Cache misses", "counter", [({"cache": name}, misses) for name, (_, misses, _) in caches.items()]),
+        ("agent_cache_hit_ratio", "Cache hit rate since startup", "gauge", [({"cache": name}, rate) for name, (_, _, rate) in caches.items()]),
+        ("agent_db_pool_connections", "Read pool connections by state", "gauge",
+         [({"state": "in_use"}, pool["in_use"]), ({"state": "idle"}, pool["idle"])]),
+        ("agent_db_pool_size", "Read pool capacity", "gauge", [({}, pool["size"])]),
+        ("agent_db_pool_utilization_ratio", "Share of the read pool in use", "gauge", [({}, pool["in_use"] / pool["size"] if pool["size"] else 0.0)]),
+        ("agent_db_pool_waits_total", "Connection requests that had to wait for a free connection", "counter", [({}, pool["waits"])]),
+        ("agent_llm_calls_in_flight", "Model calls running", "gauge", [({}, llm["in_flight"])]),
+        ("agent_llm_calls_queued", "Model calls waiting for a concurrency slot or rate token", "gauge", [({}, llm["queued"])]),
+        ("agent_llm_calls_total", "Model calls made, retries included", "counter", [({}, llm["calls"])]),
+        ("agent_llm_coalesced_total", "Model calls answered by an identical call already in flight", "counter", [({}, llm["coalesced"])]),
+        ("agent_llm_retries_total", "Model calls retried after a quota or transient error", "counter", [({}, llm["retries"])]),
+        ("agent_llm_failures_total", "Model calls that failed after retries", "counter", [({}, llm["failures"])]),
+        ("agent_render_in_flight", "Chart renders running or queued on the renderer pool", "gauge", [({}, charts["in_flight"])]),
+        ("agent_render_queue_depth", "Chart renders waiting for a renderer process", "gauge", [({}, charts["queue_depth"])]),
+        ("agent_cancelled_requests_total", "Requests cancelled by a client disconnect", "counter", [({}, cancellations["requests"])]),
+        ("agent_cancelled_stages_total", "Stage work skipped, abandoned or interrupted after a disconnect", "counter",
+         [({"stage": stage, "outcome": outcome}, count)
+          for stage, counts in sorted(cancellations["stages"].items()) for outcome, count in counts.items()]),
+    ]
+    models = agent.model_stats()
+    if models:
+        labels = {stage: {"stage": stage, "backend": stats["backend"], "model": stats["model"]} for stage, stats in models.items()}
+        families.extend([
+            ("agent_model_calls_total", "Model backend calls per stage", "counter",
+             [(labels[stage], stats["calls"]) for stage, stats in models.items()]),
+            ("agent_model_errors_total", "Model backend calls that failed or timed out", "counter",
+             [(labels[stage], stats["errors"]) for stage, stats in models.items()]),
+            ("agent_model_seconds_total", "Time spent waiting on each model backend", "counter",
+             [(labels[stage], stats["seconds"]) for stage, stats in models.items()]),
+            ("agent_model_tokens_total", "Prompt and output tokens per model backend", "counter",
+             [({**labels[stage], "kind": kind}, stats[f"{kind}_tokens"]) for stage, stats in models.items()
+              for kind in ("prompt", "output", "cached")]),
+            ("agent_model_context_cache_failures_total", "Failed attempts to create a provider context cache", "counter",
+             [(labels[stage], stats["context_cache_failures"]) for stage, stats in models.items()
+              if "context_cache_failures" in stats]),
+        ])
+    if agent.intent_router is not None:
+        families.append(("agent_fast_path_match_ratio", "Share of questions answered from SQL templates", "gauge",
+                         [({}, agent.intent_router.stats()["match_rate"])]))
+    if agent.query_guard is not None:
+        guard = agent.query_guard.stats()
+        families.append(("agent_query_guard_decisions_total", "Query guard decisions", "counter",
+                         [({"decision": decision}, guard[decision])
+                          for decision in ("passed", "limited", "rejected", "budget_exceeded", "explain_failed")]))
+    return families
+
+
+class MetricsMiddleware:
+    """ASGI middleware: counts and times every request and adds a Server-Timing header with its stage timings"""
+    
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        timings = {}
+        request_timings.set(timings)
+        request_prompt_tokens.set({})
+        start = time.perf_counter()
+        status = 500
+        
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Streamed responses send headers before their stages run, so they only carry app time
+                header = server_timing({**timings, "app": time.perf_counter() - start})
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode())]}
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            self.metrics.observe_request(getattr(route, "path", "unmatched"), status, time.perf_counter() - start)
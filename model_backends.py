@@ -0,0 +1,239 @@
+import datetime
+import json
+import logging
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, Optional, Tuple
+from intent_router import IntentRouter
+from result_digest import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Stand-in for questions the local backend has no template for; valid SQL so the pipeline still runs end to end
+LOCAL_FALLBACK_SQL = "SELECT COUNT(*) AS row_count FROM total_sales_metrics"
+LOCAL_ANSWER = "This answer comes from the local test model; the query results contain the figures."
+
+
+def response_text(response) -> str:
+    """Text of a response or stream chunk; Gemini raises instead of returning '' for empty candidates"""
+    try:
+        return response.text or ''
+    except (ValueError, AttributeError):
+        return ''
+
+
+class LocalResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class ModelBackend(ABC):
+    """A model provider with its own generation settings and timeout, recording latency and token usage"""
+    
+    kind = "base"
+    
+    def __init__(self, model_name: str, timeout: float = 60.0, temperature: Optional[float] = None,
+                 max_output_tokens: Optional[int] = None):
+        self.model_name = model_name
+        self.timeout = timeout
+        self.generation_config = {key: value for key, value in
+                                  (("temperature", temperature), ("max_output_tokens", max_output_tokens))
+                                  if value is not None}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "errors": 0, "seconds": 0.0, "prompt_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+    
+    def generate_content(self, prompt: str, stream: bool = False, generation_config: Optional[Dict[str, Any]] = None,
+                         **kwargs) -> Any:
+        """Same call shape as genai.GenerativeModel.generate_content, with this backend's settings applied"""
+        config = {**self.generation_config, **(generation_config or {})}
+        start_time = time.perf_counter()
+        try:
+            response = self._generate(prompt, config, stream)
+        except Exception:
+            self._record(start_time, error=True)
+            raise
+        if stream:
+            return self._stream(prompt, response, start_time)
+        self._record(start_time, *self.usage(prompt, response, response_text(response)))
+        return response
+    
+    def usage(self, prompt: str, response, text: str) -> Tuple[int, int, int]:
+        """Prompt, output and cached prompt tokens of a call; estimated from the text unless the provider reports them"""
+        return estimate_tokens(prompt), estimate_tokens(text), 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return call, error, latency and token totals for this backend"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_seconds"] = stats["seconds"] / stats["calls"] if stats["calls"] else 0.0
+        stats.update(backend=self.kind, model=self.model_name, timeout=self.timeout,
+                     generation_config=dict(self.generation_config))
+        return stats
+    
+    def warm_up(self) -> None:
+        """Load the provider's client library ahead of the first call"""
+    
+    def cache_prefix(self, prefix: str) -> None:
+        """Let prompts that start with prefix reuse the provider's cached copy of it, where the provider has one"""
+    
+    @abstractmethod
+    def _generate(self, prompt: str, config: Dict[str, Any], stream: bool) -> Any:
+        """Call the provider: a response with .text, or an iterable of such chunks when stream is set"""
+    
+    def _stream(self, prompt: str, response, start_time: float) -> Iterator[Any]:
+        # The call was made eagerly in generate_content so connection errors are retried; usage is recorded at the end
+        text = []
+        try:
+            for chunk in response:
+                text.append(response_text(chunk))
+                yield chunk
+        except Exception:
+            self._record(start_time, error=True)
+            raise
+        self._record(start_time, *self.usage(prompt, response, ''.join(text)))
+    
+    def _record(self, start_time: float, prompt_tokens: int = 0, output_tokens: int = 0, cached_tokens: int = 0,
+                error: bool = False) -> None:
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["errors"] += int(error)
+            self._stats["seconds"] += time.perf_counter() - start_time
+            self._stats["prompt_tokens"] += prompt_tokens
+            self._stats["output_tokens"] += output_tokens
+            self._stats["cached_tokens"] += cached_tokens
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini through google.generativeai"""
+    
+    kind = "gemini"
+    
+    def __init__(self, model_name: str = 'gemini-1.5-flash', api_key: Optional[str] = None,
+                 cache_min_tokens: int = 32768, cache_ttl: float = 3600.0, **settings):
+        super().__init__(model_name, **settings)
+        self.api_key = api_key
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Gemini only caches contexts above a per-model minimum size (32k tokens for the 1.5 models)
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_ttl = cache_ttl
+        self._prefixes = []
+        self._caches = {}
+        self._cache_lock = threading.Lock()
+        self._cache_failures = 0
+    
+    def client(self):
+        """The genai model, imported and configured on first use because google.generativeai is slow to import"""
+        with self._model_lock:
+            if self._model is None:
+                import google.generativeai as genai
+                if self.api_key:
+                    genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+    
+    def warm_up(self) -> None:
+        self.client()
+    
+    def cache_prefix(self, prefix: str) -> None:
+        # Smaller prefixes are still sent first, where models with implicit prefix caching can reuse them
+        if estimate_tokens(prefix) >= self.cache_min_tokens:
+            self._prefixes.append(prefix)
+    
+    def cached_model(self, prefix: str):
+        """A model bound to a context cache holding prefix, created on first use and renewed before it expires.
+        After a failed create the prefix is sent inline until the next attempt, one TTL later."""
+        with self._cache_lock:
+            model, renew_at = self._caches.get(prefix, (None, 0.0))
+            if time.monotonic() < renew_at:
+                return model
+            # client() imports and configures genai
+            self.client()
+            import google.generativeai as genai
+            try:
+                cached = genai.caching.CachedContent.create(model=f"models/{self.model_name}", contents=[prefix],
+                                                            ttl=datetime.timedelta(seconds=self.cache_ttl))
+                model = genai.GenerativeModel.from_cached_content(cached)
+            except Exception as e:
+                # Not every model or prefix size supports explicit caching
+                logger.warning("Context caching unavailable for %s, sending the prompt prefix inline: %s",
+                               self.model_name, e)
+                self._cache_failures += 1
+                self._caches[prefix] = (None, time.monotonic() + self.cache_ttl)
+                return None
+            self._caches[prefix] = (model, time.monotonic() + self.cache_ttl * 0.9)
+            return model
+    
+    def _generate(self, prompt: str, config: Dict[str, Any], stream: bool) -> Any:
+        model, text = self.client(), prompt
+        for prefix in self._prefixes:
+            cached = self.cached_model(prefix) if prompt.startswith(prefix) else None
+            if cached is not None:
+                model, text = cached, prompt[len(prefix):]
+                break
+        return model.generate_content(text, stream=stream, generation_config=config or None,
+                                      request_options={"timeout": self.timeout})
+    
+    def usage(self, prompt: str, response, text: str) -> Tuple[int, int, int]:
+        metadata = getattr(response, 'usage_metadata', None)
+        if metadata is None or not getattr(metadata, 'prompt_token_count', 0):
+            return super().usage(prompt, response, text)
+        return (metadata.prompt_token_count, getattr(metadata, 'candidates_token_count', 0) or 0,
+                getattr(metadata, 'cached_content_token_count', 0) or 0)
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._cache_lock:
+            stats["context_caches"] = sum(1 for model, _ in self._caches.values() if model is not None)
+            stats["context_cache_failures"] = self._cache_failures
+        return stats
+
+
+class LocalBackend(ModelBackend):
+    """Deterministic offline stand-in: SQL from the fast-path templates, a fixed answer, optional simulated latency"""
+    
+    kind = "local"
+    
+    def __init__(self, model_name: str = 'templates', latency: float = 0.0, **settings):
+        super().__init__(model_name, **settings)
+        self.latency = latency
+        self.router = IntentRouter()
+    
+    def _generate(self, prompt: str, config: Dict[str, Any], stream: bool) -> Any:
+        if self.latency > self.timeout:
+            time.sleep(self.timeout)
+            raise TimeoutError(f"Local model did not answer within {self.timeout}s")
+        time.sleep(self.latency)
+        
+        numbered = re.findall(r'^\s*(\d+)\. (.+)$', prompt, re.MULTILINE)
+        if config.get("response_mime_type") == "application/json" and numbered:
+            text = json.dumps([{"id": int(i), "sql": self.sql_for(question)} for i, question in numbered])
+        elif 'SQL expert' in prompt and 'Question:' in prompt:
+            text = self.sql_for(re.search(r'Question: (.+)', prompt).group(1))
+        else:
+            text = LOCAL_ANSWER
+        if stream:
+            return [LocalResponse(word) for word in re.findall(r'\S+\s*', text)]
+        return LocalResponse(text)
+    
+    def sql_for(self, question: str) -> str:
+        match = self.router.match(question.strip())
+        return match.display_sql if match else LOCAL_FALLBACK_SQL
+
+
+BACKENDS = {"gemini": GeminiBackend, "local": LocalBackend}
+
+
+def create_backend(kind: str, model_name: Optional[str] = None, api_key: Optional[str] = None,
+                   latency: float = 0.0, cache_min_tokens: int = 32768, cache_ttl: float = 3600.0,
+                   **settings) -> ModelBackend:
+    """Build a backend by name ('gemini' or 'local'); settings are timeout, temperature and max_output_tokens"""
+    kind = kind.lower()
+    if kind == "gemini":
+        return GeminiBackend(model_name or 'gemini-1.5-flash', api_key=api_key, cache_min_tokens=cache_min_tokens,
+                             cache_ttl=cache_ttl, **settings)
+    if kind == "local":
+        return LocalBackend(model_name or 'templates', latency=latency, **settings)
+    raise ValueError(f"Unknown model backend '{kind}', expected one of: {', '.join(BACKENDS)}")
@@ -0,0 +1,149 @@
+import sqlite3
+from typing import Dict, List, Sequence
+from result_digest import estimate_tokens
+
+# Tables the model may query; rollups, ingestion bookkeeping and advisor indexes are internal
+SCHEMA_TABLES = ("ad_sales_metrics", "total_sales_metrics", "product_eligibility")
+
+# What the column names alone do not say
+COLUMN_NOTES = {
+    ("total_sales_metrics", "total_sales"): "organic + ad sales",
+    ("product_eligibility", "eligibility"): "1 eligible, 0 not",
+    ("product_eligibility", "message"): "reason when ineligible",
+}
+
+TABLE_NOTES = {
+    "ad_sales_metrics": "ad-driven metrics per item per day",
+    "total_sales_metrics": "all sales per item per day",
+    "product_eligibility": "advertising eligibility checks",
+}
+
+SQLITE_TYPES = {"BIGINT": "int", "INTEGER": "int", "INT": "int", "FLOAT": "real", "REAL": "real",
+                "DOUBLE": "real", "TEXT": "text", "DATETIME": "datetime", "DATE": "date"}
+
+# The schema text the SQL prompts used before the compact description, kept for COMPACT_PROMPTS=false and comparisons
+LEGACY_SCHEMA = """
+        Database Schema:
+        
+        1. ad_sales_metrics table:
+           - date: Date of the metrics
+           - item_id: Product identifier
+           - ad_sales: Sales generated from advertising
+           - impressions: Number of ad impressions
+           - ad_spend: Cost of advertising
+           - clicks: Number of ad clicks
+           - units_sold: Number of units sold from ads
+        
+        2. total_sales_metrics table:
+           - date: Date of the metrics
+           - item_id: Product identifier
+           - total_sales: Total sales (including organic and ad-driven)
+           - total_units_ordered: Total units ordered
+        
+        3. product_eligibility table:
+           - eligibility_datetime_utc: Timestamp of eligibility check
+           - item_id: Product identifier
+           - eligibility: 1 for eligible, 0 for not eligible
+           - message: Reason for ineligibility (if any)
+        
+        Key relationships:
+        - All tables can be joined on item_id
+        - date columns can be used for time-based analysis
+        """
+
+# Static part of every SQL prompt, sent first so providers can cache it as a shared prefix
+SQL_PREFIX = """You are a SQL expert. Write SQLite queries that answer questions about this database.
+
+{schema}
+
+Common calculations: RoAS = ad_sales / ad_spend; CPC = ad_spend / clicks; CTR = clicks / impressions.
+"""
+SQL_TASK = """
+Question: {question}
+Return ONLY the SQL query, nothing else."""
+BATCH_SQL_TASK = """
+Questions:
+{numbered}
+Return ONLY a JSON array with one object per question, like [{{"id": 1, "sql": "SELECT ..."}}], nothing else."""
+
+
+def compact_schema(conn: sqlite3.Connection, tables: Sequence[str] = SCHEMA_TABLES) -> str:
+    """One line per table with its columns and types as they are in the database, plus notes the names do not carry"""
+    lines = []
+    for table in tables:
+        columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+        if not columns:
+            continue
+        described = []
+        for _, name, column_type, *_ in columns:
+            column = f"{name} {SQLITE_TYPES.get(column_type.upper(), column_type.lower() or 'any')}"
+            note = COLUMN_NOTES.get((table, name))
+            described.append(f"{column} ({note})" if note else column)
+        note = TABLE_NOTES.get(table)
+        lines.append(f"{table}({', '.join(described)})" + (f" -- {note}" if note else ""))
+    if not lines:
+        return ""
+    return "Tables, joinable on item_id:\n" + "\n".join(lines)
+
+
+class PromptBuilder:
+    """Assembles SQL prompts as a static prefix (instructions, schema, formulas) followed by the questions"""
+    
+    def __init__(self, schema: str, compact: bool = True):
+        self.schema = schema
+        self.compact = compact
+        self.prefix = SQL_PREFIX.format(schema=schema.strip()) if compact else ""
+    
+    def sql_prompt(self, question: str) -> str:
+        if not self.compact:
+            return legacy_sql_prompt(self.schema, question)
+        return self.prefix + SQL_TASK.format(question=question)
+    
+    def batch_sql_prompt(self, questions: List[str]) -> str:
+        if not self.compact:
+            return legacy_batch_sql_prompt(self.schema, questions)
+        numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+        return self.prefix + BATCH_SQL_TASK.format(numbered=numbered)
+    
+    def stats(self) -> Dict[str, int]:
+        """Size of the static prefix shared by every SQL prompt"""
+        return {"compact": self.compact, "prefix_tokens": estimate_tokens(self.prefix),
+                "schema_tokens": estimate_tokens(self.schema)}
+
+
+def legacy_sql_prompt(schema_info: str, question: str) -> str:
+    return f"""
+        You are a SQL expert. Given the following database schema and a question, generate the appropriate SQL query.
+        
+        {schema_info}
+        
+        Question: {question}
+        
+        Generate a SQLite-compatible SQL query that answers this question.
+        Return ONLY the SQL query, nothing else.
+        
+        Common calculations:
+        - RoAS (Return on Ad Spend) = ad_sales / ad_spend
+        - CPC (Cost Per Click) = ad_spend / clicks
+        - CTR (Click Through Rate) = clicks / impressions
+        """
+
+
+def legacy_batch_sql_prompt(schema_info: str, questions: List[str]) -> str:
+    numbered = "\n".join(f"        {i}. {question}" for i, question in enumerate(questions, 1))
+    return f"""
+        You are a SQL expert. Given the following database schema and a numbered list of questions, generate the appropriate SQL query for each question.
+        
+        {schema_info}
+        
+        Questions:
+{numbered}
+
+        Generate one SQLite-compatible SQL query per question.
+        Return ONLY a JSON array with one object per question, like [{{"id": 1, "sql": "SELECT ..."}}], nothing else.
+        
+        Common calculations:
+        - RoAS (Return on Ad Spend) = ad_sales / ad_spend
+        - CPC (Cost Per Click) = ad_spend / clicks
+        - CTR (Click Through Rate) = clicks / impressions
+        """
@@ -0,0 +1,235 @@
+import sqlite3
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import pandas as pd
+
+
+def normalize_question(question: str) -> str:
+    """Fold case, punctuation and whitespace so equivalent questions share a key"""
+    folded = re.sub(r'[^\w\s]', ' ', question.lower())
+    return ' '.join(folded.split())
+
+
+class QuestionCache:
+    """Two-tier (memory LRU + on-disk SQLite) cache of question -> SQL query"""
+
+    def __init__(self, path: str = 'query_cache.db', max_memory_entries: int = 256,
+                 max_disk_entries: int = 5000, ttl_seconds: float = 86400):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._conn = None
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS sql_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        question TEXT,
+                        sql_query TEXT,
+                        created_at REAL,
+                        last_access REAL
+                    )
+                """)
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sql_cache_last_access ON sql_cache(last_access)")
+                self._conn.commit()
+            except Exception as e:
+                print(f"Error opening SQL cache at {path}: {e}")
+                self._conn = None
+
+    def make_key(self, question: str, schema_info: str) -> str:
+        """Build the cache key from the normalized question and a schema hash"""
+        schema_hash = hashlib.sha256(schema_info.encode()).hexdigest()
+        return hashlib.sha256(f"{normalize_question(question)}\0{schema_hash}".encode()).hexdigest()
+
+    def get(self, question: str, schema_info: str) -> Optional[str]:
+        """Return the cached SQL for a question, or None on a miss"""
+        key = self.make_key(question, schema_info)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                sql_query, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return sql_query
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT sql_query, created_at FROM sql_cache WHERE cache_key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        sql_query, created_at = row
+                        if now - created_at <= self.ttl_seconds:
+                            self._conn.execute(
+                                "UPDATE sql_cache SET last_access = ? WHERE cache_key = ?", (now, key)
+                            )
+                            self._conn.commit()
+                            self._remember(key, sql_query, created_at)
+                            self._stats["disk_hits"] += 1
+                            return sql_query
+                        self._conn.execute("DELETE FROM sql_cache WHERE cache_key = ?", (key,))
+                        self._conn.commit()
+                except Exception as e:
+                    print(f"Error reading SQL cache: {e}")
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, question: str, schema_info: str, sql_query: str) -> None:
+        """Store a generated SQL query in both tiers"""
+        key = self.make_key(question, schema_info)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, sql_query, now)
+
+            if self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sql_cache VALUES (?, ?, ?, ?, ?)",
+                        (key, normalize_question(question), sql_query, now, now)
+                    )
+                    self._evict_disk(now)
+                    self._conn.commit()
+                except Exception as e:
+                    print(f"Error writing SQL cache: {e}")
+
+    def clear(self) -> None:
+        """Drop every cached entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM sql_cache")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current tier sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = 0
+            if self._conn is not None:
+                stats["disk_entries"] = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        total = hits + stats["misses"]
+        stats["hit_rate"] = hits / total if total else 0.0
+        return stats
+
+    def _remember(self, key: str, sql_query: str, created_at: float) -> None:
+        self._memory[key] = (sql_query, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now: float) -> None:
+        self._conn.execute("DELETE FROM sql_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM sql_cache WHERE cache_key IN "
+                "(SELECT cache_key FROM sql_cache ORDER BY last_access LIMIT ?)", (overflow,)
+            )
+            self._stats["evictions"] += overflow
+
+
+def data_version(db_path: str) -> Optional[str]:
+    """Return a token that changes whenever the database file is rewritten"""
+    try:
+        stat = os.stat(db_path)
+    except OSError:
+        return None
+    return f"{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class ResultCache:
+    """Memory-bounded LRU of SQL text -> result DataFrame, scoped to a data version"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "oversized": 0}
+
+    def get(self, sql_query: str, version: Optional[str]) -> Optional[pd.DataFrame]:
+        """Return a copy of the cached result for this SQL at this data version"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(sql_query)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(sql_query)
+            self._stats["hits"] += 1
+            return entry[0].copy()
+
+    def put(self, sql_query: str, version: Optional[str], df: pd.DataFrame) -> None:
+        """Store a result, evicting least recently used entries past the byte budget"""
+        if version is None:
+            return
+
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            self._check_version(version)
+            if size > self.max_entry_bytes or size > self.max_bytes:
+                self._stats["oversized"] += 1
+                return
+
+            if sql_query in self._entries:
+                self._bytes -= self._entries.pop(sql_query)[1]
+            self._entries[sql_query] = (df.copy(), size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current memory usage"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+            stats["data_version"] = self._version
+
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+    def _check_version(self, version: Optional[str]) -> None:
+        if version != self._version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
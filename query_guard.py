@@ -0,0 +1,207 @@
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+# Joined tables and their aliases, so plan lines like "SCAN a" resolve to a table
+TABLE_REFERENCE_PATTERN = re.compile(
+    r'(?:\bfrom|\bjoin|,)\s+(\w+)(?:\s+(?:as\s+)?(?!on\b|where\b|join\b|inner\b|left\b|right\b|full\b|cross\b|natural\b'
+    r'|group\b|order\b|limit\b|using\b|having\b|union\b)(\w+))?',
+    re.IGNORECASE
+)
+LOOP_PATTERN = re.compile(r'^(SCAN|SEARCH) (\S+)(?: AS (\S+))?(?: USING (.*?)(?: \((.*)\))?)?$')
+INDEX_NAME_PATTERN = re.compile(r'INDEX (\w+)')
+DERIVED_PATTERN = re.compile(r'^(?:MATERIALIZE|CO-ROUTINE) (.+)$')
+AGGREGATE_PATTERN = re.compile(r'\b(?:sum|avg|count|min|max|total|group_concat)\s*\(|\bgroup\s+by\b', re.IGNORECASE)
+LIMIT_PATTERN = re.compile(r'\blimit\s+\d+', re.IGNORECASE)
+
+
+class QueryRejected(Exception):
+    """The cost guard refused to run a query whose plan is too expensive"""
+
+
+class QueryBudgetExceeded(Exception):
+    """A query ran past its VM-step or wall-clock budget and was interrupted"""
+
+
+class QueryGuard:
+    """Checks EXPLAIN QUERY PLAN against table sizes before a query runs, and bounds it while it runs"""
+    
+    def __init__(self, max_cost: float = 10_000_000, row_limit: int = 10_000, max_seconds: float = 10.0,
+                 max_vm_steps: int = 0, progress_interval: int = 1000):
+        self.max_cost = max_cost
+        self.row_limit = row_limit
+        self.max_seconds = max_seconds
+        self.max_vm_steps = max_vm_steps
+        self.progress_interval = progress_interval
+        
+        self._lock = threading.Lock()
+        self._version = object()
+        self._tables = {}
+        self._stats = {"checked": 0, "passed": 0, "limited": 0, "rejected": 0, "budget_exceeded": 0,
+                       "explain_failed": 0}
+        self._max_estimated_cost = 0.0
+    
+    def check(self, conn: sqlite3.Connection, sql_query: str, params: Optional[list],
+              version: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Return the SQL to run and a note for the response when it was limited; raise QueryRejected if it must not run"""
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql_query}", params or []).fetchall()
+        except sqlite3.Error:
+            # Let the query itself surface the error
+            self._count("explain_failed")
+            return sql_query, None
+        
+        tables = self.table_info(conn, version)
+        aliases = {alias.lower(): table.lower() for table, alias in TABLE_REFERENCE_PATTERN.findall(sql_query) if alias}
+        cost = self.estimate_cost(plan, tables, aliases)
+        with self._lock:
+            self._stats["checked"] += 1
+            self._max_estimated_cost = max(self._max_estimated_cost, cost)
+        
+        if cost <= self.max_cost or self._streams_with_limit(sql_query, plan):
+            self._count("passed")
+            return sql_query, None
+        
+        # Row-at-a-time plans stop early under a LIMIT; anything that aggregates or sorts must run in full
+        if not AGGREGATE_PATTERN.search(sql_query) and not self._materializes(plan):
+            self._count("limited")
+            limited = f"SELECT * FROM ({sql_query.strip().rstrip(';')}) LIMIT {self.row_limit}"
+            print(f"Query guard: estimated cost {cost:,.0f} exceeds {self.max_cost:,.0f}, limiting to {self.row_limit} rows")
+            return limited, f"(The query plan was too expensive to run in full, so only the first {self.row_limit} rows were read.)"
+        
+        self._count("rejected")
+        print(f"Query guard: rejected query with estimated cost {cost:,.0f} (limit {self.max_cost:,.0f})")
+        raise QueryRejected(f"The query would visit about {cost:,.0f} rows, over the limit of {self.max_cost:,.0f}")
+    
+    @contextmanager
+    def budget(self, conn: sqlite3.Connection):
+        """Interrupt the statement run inside this block once it exceeds the step or time budget"""
+        deadline = time.monotonic() + self.max_seconds if self.max_seconds > 0 else None
+        state = {"steps": 0, "exceeded": None}
+        
+        def progress():
+            state["steps"] += self.progress_interval
+            if self.max_vm_steps and state["steps"] > self.max_vm_steps:
+                state["exceeded"] = f"{self.max_vm_steps:,} VM steps"
+            elif deadline is not None and time.monotonic() > deadline:
+                state["exceeded"] = f"{self.max_seconds:g}s"
+            return 1 if state["exceeded"] else 0
+        
+        conn.set_progress_handler(progress, self.progress_interval)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if state["exceeded"] is None:
+                raise
+            self._count("budget_exceeded")
+            raise QueryBudgetExceeded(f"The query was stopped after {state['exceeded']}") from e
+        finally:
+            conn.set_progress_handler(None, self.progress_interval)
+    
+    def estimate_cost(self, plan: List[tuple], tables: Dict[str, Dict[str, Any]], aliases: Dict[str, str],
+                      detailed: bool = False) -> float:
+        """Rows visited by the plan's nested loops, correlated subqueries re-run per outer row"""
+        # detailed also charges table lookups behind non-covering indexes and rows fed to temp b-tree sorts,
+        # which is what separates covering and sort-order indexes from plain ones
+        children = {}
+        for node_id, parent, _, detail in plan:
+            children.setdefault(parent, []).append((node_id, detail))
+        derived_rows = {}
+        largest = max((info["rows"] for info in tables.values()), default=1)
+        
+        def loop_rows(detail: str) -> float:
+            if detail == "SCAN CONSTANT ROW":
+                return 1
+            match = LOOP_PATTERN.match(detail)
+            name, using, constraints = match.group(2).lower(), match.group(4) or "", match.group(5) or ""
+            if name in derived_rows:
+                return derived_rows[name]
+            table = tables.get(aliases.get(name, name))
+            index = INDEX_NAME_PATTERN.search(using)
+            if table is None and index:
+                table = next((info for info in tables.values() if index.group(1).lower() in info["indexes"]), None)
+            rows = table["rows"] if table else largest
+            if match.group(1) == "SCAN" or not constraints:
+                return rows
+            if "rowid=" in constraints:
+                return 1
+            equalities = len(re.findall(r'(?<![<>!])=\?', constraints))
+            ranges = len(re.findall(r'[<>]=?\?', constraints))
+            if table and index and index.group(1).lower() in table["unique"]:
+                if equalities >= table["unique"][index.group(1).lower()]:
+                    return 1
+            estimate = rows ** (1 / (equalities + 1)) / (4 ** ranges)
+            return max(estimate, 1)
+        
+        def cost(parent: int) -> float:
+            loops, total = 1.0, 0.0
+            for node_id, detail in children.get(parent, []):
+                if LOOP_PATTERN.match(detail):
+                    loops *= loop_rows(detail)
+                    total += loops * (2 if detailed and self._looks_up_table(detail) else 1)
+                elif detailed and detail.startswith("USE TEMP B-TREE"):
+                    total += loops
+                elif detail.startswith("CORRELATED"):
+                    total += loops * cost(node_id)
+                else:
+                    sub_cost = cost(node_id)
+                    total += sub_cost
+                    derived = DERIVED_PATTERN.match(detail)
+                    if derived:
+                        # Derived tables usually aggregate, so assume they shrink their input;
+                        # the runtime budget backs up the cases where they do not
+                        derived_rows[derived.group(1).lower()] = max(sub_cost ** 0.5, 1)
+            return total
+        
+        return cost(0)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return guard decision counters and limits"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["max_estimated_cost"] = self._max_estimated_cost
+        stats["max_cost"] = self.max_cost
+        stats["max_seconds"] = self.max_seconds
+        stats["max_vm_steps"] = self.max_vm_steps
+        return stats
+    
+    def _count(self, decision: str) -> None:
+        with self._lock:
+            self._stats[decision] += 1
+    
+    def _streams_with_limit(self, sql_query: str, plan: List[tuple]) -> bool:
+        """A LIMIT on a plan that never materializes stops the loops early"""
+        return bool(LIMIT_PATTERN.search(sql_query)) and not AGGREGATE_PATTERN.search(sql_query) \
+            and not self._materializes(plan)
+    
+    def _materializes(self, plan: List[tuple]) -> bool:
+        return any(detail.startswith(("USE TEMP B-TREE", "MATERIALIZE", "CORRELATED")) for _, _, _, detail in plan)
+    
+    def _looks_up_table(self, detail: str) -> bool:
+        """A loop over a non-covering index fetches the table row for every index entry"""
+        using = LOOP_PATTERN.match(detail).group(4) or ""
+        return using.startswith("INDEX ")
+    
+    def table_info(self, conn: sqlite3.Connection, version: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        """Row counts, index names and unique key widths per table, refreshed when the data changes"""
+        with self._lock:
+            if version is not None and version == self._version:
+                return self._tables
+        
+        tables = {}
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+            info = {"rows": max(conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0], 1),
+                    "indexes": set(), "unique": {}}
+            for _, index_name, unique, *_ in conn.execute(f'PRAGMA index_list("{name}")').fetchall():
+                info["indexes"].add(index_name.lower())
+                if unique:
+                    info["unique"][index_name.lower()] = len(conn.execute(f'PRAGMA index_info("{index_name}")').fetchall())
+            tables[name.lower()] = info
+        
+        with self._lock:
+            self._tables = tables
+            self._version = version
+        return tables
@@ -0,0 +1,272 @@
+import re
+import threading
+from typing import Dict, Any, List, Optional, Set
+
+# Raw tables that have rollups: measure columns and the rollup column that counts raw rows
+ROLLUP_SOURCES = {
+    "ad_sales_metrics": {
+        "measures": {"ad_sales", "impressions", "ad_spend", "clicks", "units_sold"},
+        "row_count": "ad_rows",
+    },
+    "total_sales_metrics": {
+        "measures": {"total_sales", "total_units_ordered"},
+        "row_count": "total_rows",
+    },
+}
+
+DIMENSIONS = {"date", "item_id"}
+
+# Non-dimension columns of the raw tables and rollups. Outside an aggregate they name raw values on the
+# source table but pre-aggregated ones on a rollup, so an output alias may only stand in for them in ORDER BY
+ROLLUP_COLUMNS = set().union(
+    *(source["measures"] | {source["row_count"]} for source in ROLLUP_SOURCES.values())
+) | {"roas", "cpc", "ctr"}
+
+# Smallest rollup that still carries every dimension a query touches
+ROLLUP_BY_DIMENSIONS = [
+    ({"date"}, "daily_totals"),
+    ({"item_id"}, "item_totals"),
+    ({"date", "item_id"}, "item_daily_metrics"),
+]
+
+SQL_KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "as", "group", "by", "order", "asc", "desc",
+    "limit", "offset", "having", "between", "in", "is", "null", "case", "when", "then", "else",
+    "end", "like", "glob", "cast", "real", "integer", "float", "text", "numeric", "true", "false",
+}
+
+SCALAR_FUNCTIONS = {
+    "round", "nullif", "coalesce", "ifnull", "abs", "date", "datetime", "strftime", "substr",
+    "cast", "min", "max", "printf", "julianday",
+}
+
+UNSUPPORTED_PATTERN = re.compile(
+    r'\b(?:join|union|intersect|except|with|over|distinct|avg|group_concat)\b|\bcount\s*\(\s*(?!\*|1\s*\))',
+    re.IGNORECASE
+)
+STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+FROM_PATTERN = re.compile(
+    r'\bfrom\s+(\w+)(?:\s+(?:as\s+)?(?!where\b|group\b|order\b|limit\b|having\b)(\w+))?\s*(,)?',
+    re.IGNORECASE
+)
+WHERE_PATTERN = re.compile(r'\bwhere\b(.*?)(?=\bgroup\s+by\b|\bhaving\b|\border\s+by\b|\blimit\b|$)',
+                           re.IGNORECASE | re.DOTALL)
+ORDER_BY_PATTERN = re.compile(r'\border\s+by\b', re.IGNORECASE)
+CLAUSE_AFTER_FROM = re.compile(r'\bgroup\s+by\b|\bhaving\b|\border\s+by\b|\blimit\b', re.IGNORECASE)
+SELECT_LIST_PATTERN = re.compile(r'\bselect\b(.*?)\bfrom\b', re.IGNORECASE | re.DOTALL)
+GROUP_BY_PATTERN = re.compile(r'\bgroup\s+by\b(.*?)(?=\bhaving\b|\border\s+by\b|\blimit\b|$)',
+                              re.IGNORECASE | re.DOTALL)
+OUTPUT_ALIAS_PATTERN = re.compile(r'(.*?)\s+as\s+(\w+)$', re.IGNORECASE | re.DOTALL)
+AGGREGATE_PLACEHOLDER = re.compile(r'__count__|__(?:sum|total)_\w+__')
+
+
+def split_top_level(text: str) -> List[str]:
+    """Split a select list or GROUP BY clause on the commas outside parentheses"""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+class QueryRewriter:
+    """Routes simple aggregate queries on the raw tables to the precomputed rollups"""
+    
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+        self._lock = threading.Lock()
+        self._checked_version = object()
+        self._rollups_current = False
+        self._stats = {"rewritten": 0, "not_eligible": 0, "rollups_stale": 0}
+    
+    def rewrite(self, sql_query: str, version: Optional[str]) -> str:
+        """Return an equivalent query against a rollup, or the original query if not eligible"""
+        if not self._rollups_available(version):
+            with self._lock:
+                self._stats["rollups_stale"] += 1
+            return sql_query
+        
+        rewritten = self.rewrite_sql(sql_query)
+        with self._lock:
+            self._stats["rewritten" if rewritten else "not_eligible"] += 1
+        return rewritten or sql_query
+    
+    def rewrite_sql(self, sql_query: str) -> Optional[str]:
+        """Pure rewrite step: the rollup form of sql_query, or None when it cannot be routed"""
+        sql = sql_query.strip().rstrip(';').strip()
+        if ';' in sql or '--' in sql or '/*' in sql or '"' in sql or '`' in sql or '[' in sql:
+            return None
+        
+        # Hide string literals so their contents are never mistaken for identifiers
+        literals = []
+        def hide(match):
+            literals.append(match.group(0))
+            return f" __literal{len(literals) - 1}__ "
+        masked = STRING_PATTERN.sub(hide, sql)
+        
+        if len(re.findall(r'\bselect\b', masked, re.IGNORECASE)) != 1 or UNSUPPORTED_PATTERN.search(masked):
+            return None
+        
+        from_match = FROM_PATTERN.search(masked)
+        if not from_match or from_match.group(3):
+            return None
+        table = from_match.group(1).lower()
+        alias = from_match.group(2)
+        source = ROLLUP_SOURCES.get(table)
+        if source is None:
+            return None
+        
+        # Bare SUM(measure) and COUNT(*) are the only aggregates a rollup can answer
+        qualifier = rf'(?:(?:{re.escape(table)}|{re.escape(alias or table)})\.)?'
+        def replace_aggregate(match):
+            if match.group(1):
+                return " __count__ "
+            column = match.group(3).lower()
+            if column not in source["measures"]:
+                return match.group(0)
+            return f" __{match.group(2).lower()}_{column}__ "
+        masked = re.sub(
+            rf'\bcount\s*\(\s*(\*|1)\s*\)|\b(sum|total)\s*\(\s*{qualifier}(\w+)\s*\)',
+            replace_aggregate, masked, flags=re.IGNORECASE
+        )
+        if re.search(r'\b(?:sum|total|count)\s*\(', masked, re.IGNORECASE):
+            return None
+        
+        dimensions = self._referenced_dimensions(masked, table, alias, source)
+        if dimensions is None or not self._projection_aggregated(masked, table, alias, literals):
+            return None
+        rollup = next(name for dims, name in ROLLUP_BY_DIMENSIONS if dimensions <= dims)
+        
+        # Rebuild the SQL against the rollup
+        rewritten = re.sub(r' __count__ ', f"COALESCE(SUM({source['row_count']}), 0)", masked)
+        rewritten = re.sub(r' __(sum|total)_(\w+)__ ', lambda m: f"{m.group(1).upper()}({m.group(2)})", rewritten)
+        rewritten = re.sub(rf'\b{re.escape(table)}\.', f"{rollup}.", rewritten, flags=re.IGNORECASE)
+        start, end = FROM_PATTERN.search(rewritten).span(1)
+        rewritten = rewritten[:start] + rollup + rewritten[end:]
+        
+        # Rollups hold keys from both source tables; keep only keys present in this one
+        presence = f"{source['row_count']} > 0"
+        where_match = WHERE_PATTERN.search(rewritten)
+        if where_match:
+            start, end = where_match.span(1)
+            rewritten = f"{rewritten[:start]} {presence} AND ({where_match.group(1).strip()}) {rewritten[end:]}"
+        else:
+            from_end = FROM_PATTERN.search(rewritten).end()
+            clause = CLAUSE_AFTER_FROM.search(rewritten, from_end)
+            insert_at = clause.start() if clause else len(rewritten)
+            rewritten = f"{rewritten[:insert_at].rstrip()} WHERE {presence} {rewritten[insert_at:]}"
+        
+        rewritten = re.sub(r'\s*__literal(\d+)__\s*', lambda m: f" {literals[int(m.group(1))]} ", rewritten)
+        return ' '.join(rewritten.split())
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return how many queries were routed to rollups"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["rollups_current"] = self._rollups_current
+        return stats
+    
+    def _referenced_dimensions(self, masked: str, table: str, alias: Optional[str],
+                               source: Dict[str, Any]) -> Optional[Set[str]]:
+        """Collect dimensions used outside aggregates; None if any other column is referenced.
+        
+        SQLite resolves a bare name to the table column before an output alias everywhere but ORDER BY,
+        so WHERE may only use dimensions, and a measure name is refused outside ORDER BY even when an
+        output alias shares it.
+        """
+        output_aliases = {a.lower() for a in re.findall(r'\bas\s+(\w+)', masked, re.IGNORECASE)}
+        # Drop alias definitions so only references to names are checked below
+        references = re.sub(r'\bas\s+\w+', ' as ', masked, flags=re.IGNORECASE)
+        allowed = SQL_KEYWORDS | {table, (alias or table).lower()}
+        where_match = WHERE_PATTERN.search(references)
+        where_start, where_end = where_match.span(1) if where_match else (0, 0)
+        order_match = ORDER_BY_PATTERN.search(references)
+        order_start = order_match.start() if order_match else len(references)
+        
+        dimensions = set()
+        for match in re.finditer(r'\b(?:\w+\.)?([A-Za-z_]\w*)\b(\s*\()?', references):
+            name = match.group(1).lower()
+            if name.startswith('__') or name in allowed:
+                continue
+            in_where = where_start <= match.start() < where_end
+            if name in output_aliases and not in_where and (name not in ROLLUP_COLUMNS or match.start() >= order_start):
+                continue
+            if match.group(2) and name in SCALAR_FUNCTIONS:
+                continue
+            if name in DIMENSIONS:
+                dimensions.add(name)
+                continue
+            # A measure outside SUM() or any unknown identifier needs raw rows
+            return None
+        return dimensions
+    
+    def _projection_aggregated(self, masked: str, table: str, alias: Optional[str], literals: List[str]) -> bool:
+        """True when every projected expression is a rollup aggregate or a grouped dimension.
+        
+        A rollup holds one row per key, so anything that returns raw rows (SELECT *, bare columns
+        without GROUP BY) must keep running against the raw table.
+        """
+        def normalize(expression: str) -> str:
+            expression = re.sub(rf'\b(?:{re.escape(table)}|{re.escape(alias or table)})\.', '', expression,
+                                flags=re.IGNORECASE)
+            expression = ' '.join(expression.lower().split())
+            return re.sub(r'\s*__literal(\d+)__\s*', lambda m: literals[int(m.group(1))], expression)
+        
+        projected = []
+        for item in split_top_level(SELECT_LIST_PATTERN.search(masked).group(1)):
+            alias_match = OUTPUT_ALIAS_PATTERN.match(item)
+            projected.append((alias_match.group(1), alias_match.group(2).lower()) if alias_match else (item, None))
+        
+        # GROUP BY keys may name an output alias or a 1-based select list position
+        group_keys = set()
+        group_match = GROUP_BY_PATTERN.search(masked)
+        if group_match:
+            by_alias = {name: expression for expression, name in projected if name}
+            for key in split_top_level(group_match.group(1)):
+                if key.isdigit() and 1 <= int(key) <= len(projected):
+                    key = projected[int(key) - 1][0]
+                group_keys.add(normalize(by_alias.get(key.lower(), key)))
+        grouped_dimensions = group_keys & DIMENSIONS
+        
+        aggregated = False
+        for expression, _ in projected:
+            if expression == '*' or expression.endswith('.*'):
+                return False
+            has_aggregate = bool(AGGREGATE_PLACEHOLDER.search(expression))
+            aggregated |= has_aggregate
+            if normalize(expression) in group_keys:
+                continue
+            dimensions = {match.group(1).lower() for match in
+                          re.finditer(r'\b(?:\w+\.)?([A-Za-z_]\w*)\b(?!\s*\()', expression)
+                          if match.group(1).lower() in DIMENSIONS}
+            if not (has_aggregate or dimensions) or not dimensions <= grouped_dimensions:
+                return False
+        return aggregated or bool(group_keys)
+    
+    def _rollups_available(self, version: Optional[str]) -> bool:
+        """Check once per data version that the rollups exist and match the raw row counts"""
+        with self._lock:
+            if version == self._checked_version:
+                return self._rollups_current
+        
+        current = False
+        try:
+            with self.db_pool.connection() as conn:
+                built = dict(conn.execute("SELECT source_table, source_rows FROM rollup_metadata").fetchall())
+                current = all(
+                    built.get(table) == conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ROLLUP_SOURCES
+                )
+        except Exception:
+            current = False
+        
+        with self._lock:
+            self._checked_version = version
+            self._rollups_current = current
+        return current
@@ -0,0 +1,149 @@
+import re
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+
+# Rough size of a Gemini token in characters of English text and numbers
+CHARS_PER_TOKEN = 4
+
+TIME_COLUMN_PATTERN = re.compile(r'(date|time|day|week|month|year)', re.IGNORECASE)
+ID_COLUMN_PATTERN = re.compile(r'(^id$|_id$)', re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used to keep prompts inside the budget"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+# Longest text value quoted in column statistics
+MAX_VALUE_CHARS = 60
+
+
+def format_value(value) -> str:
+    if isinstance(value, (int, np.integer)):
+        return f"{value:,}"
+    if isinstance(value, (float, np.floating)):
+        return f"{value:,.4g}" if abs(value) < 1000 else f"{value:,.2f}"
+    text = str(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 3] + "..."
+
+
+class ResultDigest:
+    """Compact, token-bounded description of a query result for the response prompt"""
+    
+    def __init__(self, token_budget: int = 1500, top_k: int = 5, preview_points: int = 12):
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.preview_points = preview_points
+    
+    def build(self, df: pd.DataFrame) -> str:
+        """Return the full table when it fits the budget, otherwise a digest that does"""
+        if df.empty:
+            return "No results found"
+        if self.token_budget <= 0:
+            return df.to_string()
+        # Every row costs at least a token, so only render the full table when it could fit
+        if len(df) <= self.token_budget:
+            full_table = df.to_string()
+            if estimate_tokens(full_table) <= self.token_budget:
+                return full_table
+        
+        time_column = self.time_column(df)
+        measure = self.measure_column(df)
+        sections = [self.overview(df, time_column), self.column_stats(df)]
+        
+        # Optional sections shrink until they fit what is left of the budget, or are dropped
+        k, points = self.top_k, self.preview_points
+        while True:
+            optional = []
+            if time_column and measure:
+                optional.append(self.time_series_preview(df, time_column, measure, points))
+            optional.append(self.extreme_rows(df, measure, k))
+            digest = "\n\n".join(s for s in sections + optional if s)
+            if estimate_tokens(digest) <= self.token_budget or (k <= 1 and points <= 2):
+                break
+            k, points = max(k // 2, 1), max(points // 2, 2)
+        
+        if estimate_tokens(digest) > self.token_budget:
+            digest = "\n\n".join(s for s in sections if s)
+        # Wide results can still overflow on column stats alone; cut at the budget
+        return digest[:self.token_budget * CHARS_PER_TOKEN]
+    
+    def overview(self, df: pd.DataFrame, time_column: Optional[str]) -> str:
+        total_rows = df.attrs.get("total_rows", len(df))
+        lines = [f"Result digest: {total_rows} rows x {len(df.columns)} columns ({', '.join(map(str, df.columns))})"]
+        if total_rows > len(df):
+            lines.append(f"Statistics below cover the first {len(df)} rows.")
+        if time_column:
+            values = df[time_column].dropna()
+            if len(values):
+                lines.append(f"Time range ({time_column}): {values.min()} to {values.max()}")
+        return "\n".join(lines)
+    
+    def column_stats(self, df: pd.DataFrame) -> str:
+        lines = ["Column statistics:"]
+        for column in df.columns:
+            series = df[column]
+            nulls = int(series.isna().sum())
+            null_note = f", nulls={nulls}" if nulls else ""
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                values = series.dropna()
+                if values.empty:
+                    lines.append(f"- {column}: all null")
+                    continue
+                stats = f"min={format_value(values.min())}, max={format_value(values.max())}"
+                if not ID_COLUMN_PATTERN.search(str(column)):
+                    stats += f", mean={format_value(values.mean())}, sum={format_value(values.sum())}"
+                lines.append(f"- {column}: {stats}, distinct={values.nunique()}{null_note}")
+            else:
+                distinct = series.nunique()
+                if distinct == len(series) - nulls:
+                    lines.append(f"- {column}: all values distinct{null_note}")
+                    continue
+                counts = series.value_counts().head(3)
+                common = ", ".join(f"{format_value(value)} ({count})" for value, count in counts.items())
+                lines.append(f"- {column}: distinct={distinct}, most common: {common}{null_note}")
+        return "\n".join(lines)
+    
+    def extreme_rows(self, df: pd.DataFrame, measure: Optional[str], k: int) -> str:
+        if len(df) <= 2 * k:
+            return f"All rows:\n{df.to_string(index=False)}"
+        if measure is None:
+            return f"First {k} rows:\n{df.head(k).to_string(index=False)}"
+        top = df.nlargest(k, measure)
+        bottom = df.nsmallest(k, measure)
+        return (f"Top {k} rows by {measure}:\n{top.to_string(index=False)}\n\n"
+                f"Bottom {k} rows by {measure}:\n{bottom.to_string(index=False)}")
+    
+    def time_series_preview(self, df: pd.DataFrame, time_column: str, measure: str, points: int) -> str:
+        """Evenly spaced points of the measure over time (summed per period when rows repeat a period)"""
+        series = df.groupby(time_column, sort=True)[measure].sum()
+        if len(series) <= 1:
+            return ""
+        if len(series) > points:
+            positions = np.unique(np.linspace(0, len(series) - 1, points).round().astype(int))
+            series = series.iloc[positions]
+            label = f"{measure} over {time_column} ({len(series)} of {df[time_column].nunique()} periods):"
+        else:
+            label = f"{measure} over {time_column}:"
+        return label + "\n" + "\n".join(f"{period}: {format_value(value)}" for period, value in series.items())
+    
+    def time_column(self, df: pd.DataFrame) -> Optional[str]:
+        """A datetime column, or a text column named like one (SQLite returns dates as text)"""
+        for column in df.columns:
+            series = df[column]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                return column
+            if (TIME_COLUMN_PATTERN.search(str(column)) and not pd.api.types.is_numeric_dtype(series)
+                    and series.nunique() > 1):
+                return column
+        return None
+    
+    def measure_column(self, df: pd.DataFrame) -> Optional[str]:
+        """The first numeric column that is not an identifier"""
+        candidates: List[str] = [
+            column for column in df.columns
+            if pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])
+            and not ID_COLUMN_PATTERN.search(str(column))
+        ]
+        return candidates[0] if candidates else None
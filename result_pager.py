@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+import pandas as pd
+
+
+class StaleResultError(Exception):
+    """The database changed after the result handle was issued, so its rows would shift"""
+
+
+def read_bounded(conn, sql_query: str, params: Optional[list], max_rows: int,
+                 chunk_rows: int = 1000) -> Tuple[pd.DataFrame, int]:
+    """Keep at most max_rows rows of a query, counting the rest from the cursor without holding them"""
+    cursor = conn.execute(sql_query, params or [])
+    if cursor.description is None:
+        return pd.DataFrame(), 0
+    columns = [description[0] for description in cursor.description]
+    
+    rows = cursor.fetchmany(max_rows) if max_rows > 0 else cursor.fetchall()
+    total_rows = len(rows)
+    while max_rows > 0:
+        batch = cursor.fetchmany(chunk_rows)
+        if not batch:
+            break
+        total_rows += len(batch)
+    cursor.close()
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True), total_rows
+
+
+def iter_records(conn, sql_query: str, params: Optional[list], chunk_rows: int) -> Iterator[List[Dict[str, Any]]]:
+    """Yield a query's rows as lists of records, chunk_rows at a time, straight from the cursor"""
+    cursor = conn.execute(sql_query, params or [])
+    try:
+        columns = [description[0] for description in cursor.description or []]
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield [dict(zip(columns, row)) for row in rows]
+    finally:
+        cursor.close()
+
+
+def encode_cursor(offset: int) -> str:
+    """Opaque pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """Row offset encoded in a cursor; raises ValueError when malformed"""
+    if not cursor:
+        return 0
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(payload["offset"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+class ResultHandles:
+    """Registry of truncated query results that clients can page through or stream in full"""
+    
+    def __init__(self, ttl_seconds: float = 3600, max_handles: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_handles = max_handles
+        self._lock = threading.Lock()
+        self._handles = OrderedDict()
+        self._stats = {"registered": 0, "expired": 0, "evicted": 0}
+    
+    def register(self, sql_query: str, params: Optional[list], version: Optional[str], total_rows: int) -> str:
+        """Return a stable handle for this query on this data version, refreshing its expiry"""
+        key = json.dumps([version, sql_query, list(params or [])], default=str)
+        handle = hashlib.sha256(key.encode()).hexdigest()[:32]
+        with self._lock:
+            if handle not in self._handles:
+                self._stats["registered"] += 1
+            self._handles[handle] = {
+                "sql_query": sql_query,
+                "params": list(params or []),
+                "version": version,
+                "total_rows": total_rows,
+                "created_at": time.time(),
+            }
+            self._handles.move_to_end(handle)
+            while len(self._handles) > self.max_handles:
+                self._handles.popitem(last=False)
+                self._stats["evicted"] += 1
+        return handle
+    
+    def get(self, handle: str) -> Optional[Dict[str, Any]]:
+        """Look up a handle, or None if it is unknown or expired"""
+        with self._lock:
+            entry = self._handles.get(handle)
+            if entry is None:
+                return None
+            if time.time() - entry["created_at"] > self.ttl_seconds:
+                del self._handles[handle]
+                self._stats["expired"] += 1
+                return None
+            return dict(entry)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return registry counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["handles"] = len(self._handles)
+        return stats
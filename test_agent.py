@@ -91,8 +91,10 @@ def test_streaming_question(question, description):
                             print(f"✅ Query executed, found {data['row_count']} results")
                         elif data['step'] == 'generating_response':
                             print("🔄 Generating response...")
+                        elif data['step'] == 'response_chunk':
+                            print(data['text'], end='', flush=True)
                         elif data['step'] == 'response_generated':
-                            print("✅ Response generated")
+                            print(f"\n✅ Response generated (first token after {data['time_to_first_token'] or 0:.2f} seconds)")
                         elif data['step'] == 'creating_visualization':
                             print("🔄 Creating visualization...")
                         elif data['step'] == 'complete':
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sys
+import time
+
+# Simulated latency of one Gemini round trip
+MODEL_LATENCY = 0.5
+CONCURRENT_REQUESTS = 8
+# Identical questions fired at once, like a dashboard refreshed in many tabs
+IDENTICAL_REQUESTS = 50
+
+class SlowResponse:
+    def __init__(self, text):
+        self.text = text
+
+class SlowModel:
+    """Offline stand-in for the Gemini model that blocks like a real network call"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        time.sleep(MODEL_LATENCY)
+        if 'SQL expert' in prompt:
+            return SlowResponse("SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics")
+        return SlowResponse("Your total sales are shown above.")
+
+async def send_concurrent_requests(app, count, identical=False):
+    """Fire `count` /ask requests at once and return the total wall time"""
+    import httpx
+    
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=60) as client:
+        start_time = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/ask", json={"question": "What is my total sales today?" if identical
+                                      else f"What is my total sales for run {i}?"})
+            for i in range(count)
+        ])
+        elapsed = time.perf_counter() - start_time
+    
+    failed = [r for r in responses if r.status_code != 200]
+    if failed:
+        print(f"❌ {len(failed)} requests failed: {failed[0].text}")
+        sys.exit(1)
+    return elapsed
+
+def main():
+    """Check that concurrent /ask requests overlap instead of running one after another"""
+    print("🤖 Product Data AI Agent - Concurrency Test")
+    print("=" * 60)
+    
+    os.environ.setdefault('GEMINI_API_KEY', 'offline-test')
+    os.environ['SQL_CACHE_PATH'] = ''
+    os.environ['FAST_PATH_ENABLED'] = 'false'
+    import api_server
+    
+    model = SlowModel()
+    agent = api_server.get_agent()
+    agent.sql_model = agent.response_model = model
+    agent.create_visualization = lambda question, results_df, output_format=None: None
+    
+    # Each request makes two model calls, so serial execution would take this long
+    serial_time = CONCURRENT_REQUESTS * 2 * MODEL_LATENCY
+    elapsed = asyncio.run(send_concurrent_requests(api_server.app, CONCURRENT_REQUESTS))
+    
+    print(f"Requests: {CONCURRENT_REQUESTS}, model latency: {MODEL_LATENCY}s per call")
+    print(f"Serial lower bound: {serial_time:.2f}s")
+    print(f"Concurrent wall time: {elapsed:.2f}s")
+    
+    if elapsed >= serial_time / 2:
+        print("❌ Requests did not overlap - the event loop is being blocked")
+        sys.exit(1)
+    print(f"✅ Requests overlapped ({serial_time / elapsed:.1f}x faster than serial)")
+    
+    # Identical in-flight prompts should share one model call instead of each making their own
+    model.calls = 0
+    asyncio.run(send_concurrent_requests(api_server.app, IDENTICAL_REQUESTS, identical=True))
+    print(f"Identical requests: {IDENTICAL_REQUESTS}, model calls: {model.calls} "
+          f"({agent.llm.stats()['coalesced']} coalesced)")
+    if model.calls > IDENTICAL_REQUESTS / 2:
+        print("❌ Identical requests were not coalesced")
+        sys.exit(1)
+    print(f"✅ Identical requests coalesced ({IDENTICAL_REQUESTS * 2} calls without coalescing)")
+
+if __name__ == "__main__":
+    main()
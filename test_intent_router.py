@@ -0,0 +1,74 @@
+import sys
+from intent_router import IntentRouter
+
+# (question, intent, SQL parameters, fragment the SQL must contain)
+ROUTED = [
+    ("What is my total sales?", "total_sales", [], "SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics"),
+    ("Calculate the RoAS (Return on Ad Spend).", "roas", [], "SUM(ad_sales) / NULLIF(SUM(ad_spend), 0) AS roas"),
+    ("Which product had the highest CPC (Cost Per Click)?", "highest_cpc_product", [], "ORDER BY cpc DESC"),
+    ("How many products are eligible for advertising?", "eligible_product_count", [], "WHERE eligibility = 1"),
+    ("What is the total ad spend across all products?", "total_ad_spend", [], "SUM(ad_spend) AS ad_spend"),
+    ("Which products have the highest impressions?", "top_impressions_products", [], "ORDER BY impressions DESC"),
+    ("What is the average cost per click?", "average_cpc", [], "SUM(ad_spend) / NULLIF(SUM(clicks), 0) AS cpc"),
+    ("How many units were sold from advertising?", "ad_units_sold", [], "SUM(units_sold) AS units_sold"),
+    ("Which products are not eligible and why?", "ineligible_products", [], "WHERE eligibility = 0"),
+    ("What is the total revenue from ads vs organic sales?", "ad_vs_organic_sales", [], "AS organic_sales"),
+    ("What is the click through rate?", "ctr", [], "AS ctr"),
+    ("How much have we spent on ads?", "total_ad_spend", [], "SUM(ad_spend) AS ad_spend"),
+    ("What is my total sales for product 29?", "total_sales", [29], "WHERE item_id = ?"),
+    ("Total ad spend between 2025-06-01 and 2025-06-07", "total_ad_spend", ["2025-06-01", "2025-06-07"],
+     "WHERE date >= ? AND date < date(?, '+1 day')"),
+    ("What is the RoAS since 2025-06-01?", "roas", ["2025-06-01"], "WHERE date >= ?"),
+    ("Which products have the highest impressions on 2025-06-03?", "top_impressions_products",
+     ["2025-06-03", "2025-06-03"], "WHERE date >= ? AND date < date(?, '+1 day')"),
+]
+
+# Questions a template would answer wrongly: they must go to the model
+FALL_THROUGH = [
+    "What is my total sales for each product?",
+    "Top 5 products by total sales",
+    "Total sales excluding product 29",
+    "What is the total sales in June 2025?",
+    "Total ad spend last week",
+    "Show RoAS by day",
+    "Show daily total sales",
+    "What is the average total sales?",
+    "Which product had the highest CPC per day?",
+    "Total ad spend yesterday",
+    "What is the CTR except product 3?",
+    "How many units were sold from advertising per product?",
+    "Total sales by category",
+]
+
+def main():
+    """Check that canonical questions take the fast path with the right SQL and that qualified ones do not"""
+    print("🤖 Product Data AI Agent - Intent Router Test")
+    print("=" * 60)
+    
+    router = IntentRouter()
+    failures = 0
+    for question, name, params, fragment in ROUTED:
+        match = router.match(question)
+        if match is None or match.name != name or match.params != params or fragment not in match.sql_query:
+            found = f"{match.name} {match.params}\n   {match.sql_query}" if match else "no match"
+            print(f"❌ expected {name} {params}: {question}\n   -> {found}")
+            failures += 1
+        else:
+            print(f"✅ {name:<26} {question}")
+    
+    for question in FALL_THROUGH:
+        match = router.match(question)
+        if match is not None:
+            print(f"❌ expected the model, got {match.name} {match.params}: {question}")
+            failures += 1
+        else:
+            print(f"✅ {'model':<26} {question}")
+    
+    total = len(ROUTED) + len(FALL_THROUGH)
+    if failures:
+        print(f"❌ {failures} of {total} questions were routed wrongly")
+        sys.exit(1)
+    print(f"✅ All {total} questions routed as expected")
+
+if __name__ == "__main__":
+    main()
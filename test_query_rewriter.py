@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import pandas as pd
+from database_setup import rebuild_database
+from query_rewriter import QueryRewriter
+
+# (query, whether it should be routed to a rollup)
+QUERIES = [
+    ("SELECT SUM(ad_sales) AS total_ad_sales FROM ad_sales_metrics", True),
+    ("SELECT COUNT(*) FROM ad_sales_metrics WHERE item_id = 5", True),
+    ("SELECT date, SUM(ad_spend) AS spend FROM ad_sales_metrics GROUP BY date ORDER BY date DESC LIMIT 10", True),
+    ("SELECT item_id, SUM(ad_sales) / SUM(ad_spend) AS roas FROM ad_sales_metrics GROUP BY item_id", True),
+    ("SELECT strftime('%Y-%m', date) AS month, SUM(total_sales) FROM total_sales_metrics GROUP BY month", True),
+    ("SELECT item_id FROM ad_sales_metrics GROUP BY item_id", True),
+    # Raw-row shapes: a rollup has one row per key and different columns
+    ("SELECT * FROM ad_sales_metrics", False),
+    ("SELECT item_id FROM ad_sales_metrics", False),
+    ("SELECT * FROM ad_sales_metrics WHERE item_id = 5", False),
+    ("SELECT * FROM ad_sales_metrics ORDER BY date DESC LIMIT 10", False),
+    ("SELECT date, item_id FROM total_sales_metrics WHERE date >= '2025-06-02'", False),
+    # An ungrouped dimension next to an aggregate is an arbitrary raw row
+    ("SELECT item_id, SUM(ad_sales) FROM ad_sales_metrics", False),
+    ("SELECT strftime('%Y', date), SUM(ad_sales) FROM ad_sales_metrics GROUP BY item_id", False),
+    # An alias named after a measure does not make a filter on that name safe: WHERE reads the raw column
+    ("SELECT item_id, SUM(clicks) AS clicks FROM ad_sales_metrics WHERE clicks > 10 GROUP BY item_id", False),
+    ("SELECT SUM(ad_sales) AS ad_spend FROM ad_sales_metrics WHERE ad_spend > 5", False),
+    ("SELECT item_id, SUM(ad_sales) AS units_sold FROM ad_sales_metrics WHERE units_sold >= 4 GROUP BY item_id", False),
+    ("SELECT date, SUM(ad_sales) AS total_sales FROM ad_sales_metrics GROUP BY date HAVING total_sales > 100", False),
+    ("SELECT item_id, SUM(clicks) AS clicks FROM ad_sales_metrics GROUP BY item_id ORDER BY clicks DESC", True),
+]
+
+def build_sample_database(db_path):
+    """Small raw tables where some (date, item_id) keys exist in only one of the sales tables"""
+    dates = pd.date_range("2025-06-01", periods=6, freq="D")
+    ad_rows = [(date, item, 10.0 * item + i, 100 * item, 2.0 * item, 5 * item, item)
+               for i, date in enumerate(dates) for item in range(1, 8) if (item + i) % 3]
+    total_rows = [(date, item, 30.0 * item + i, 3 * item)
+                  for i, date in enumerate(dates) for item in range(1, 10) if (item * i) % 4 != 1]
+    rebuild_database({
+        "ad_sales_metrics": pd.DataFrame(ad_rows, columns=["date", "item_id", "ad_sales", "impressions",
+                                                           "ad_spend", "clicks", "units_sold"]),
+        "total_sales_metrics": pd.DataFrame(total_rows, columns=["date", "item_id", "total_sales",
+                                                                 "total_units_ordered"]),
+        "product_eligibility": pd.DataFrame({"eligibility_datetime_utc": [dates[0]], "item_id": [1],
+                                             "eligibility": [True], "message": [None]}),
+    }, db_path)
+
+def rows(conn, sql):
+    return sorted(tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+                  for row in conn.execute(sql).fetchall())
+
+def main():
+    """Check that routed queries return exactly what they return on the raw tables"""
+    print("🤖 Product Data AI Agent - Rollup Rewrite Test")
+    print("=" * 60)
+    
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "rollups.db")
+        build_sample_database(db_path)
+        rewriter = QueryRewriter(db_pool=None)
+        conn = sqlite3.connect(db_path)
+        try:
+            for sql, routed in QUERIES:
+                rewritten = rewriter.rewrite_sql(sql)
+                if (rewritten is not None) != routed:
+                    print(f"❌ {'not routed' if routed else 'routed'}: {sql}\n   -> {rewritten}")
+                    failures += 1
+                elif rewritten is not None and rows(conn, rewritten) != rows(conn, sql):
+                    print(f"❌ different results: {sql}\n   -> {rewritten}")
+                    failures += 1
+                else:
+                    print(f"✅ {'rollup' if routed else 'raw   '}  {sql}")
+        finally:
+            conn.close()
+    
+    if failures:
+        print(f"❌ {failures} of {len(QUERIES)} queries failed")
+        sys.exit(1)
+    print(f"✅ All {len(QUERIES)} queries return the raw-table results")
+
+if __name__ == "__main__":
+    main()
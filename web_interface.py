@@ -4,6 +4,7 @@ import json
 import base64
 import io
 from PIL import Image
+import plotly.io as pio
 import time
 
 # Configure page
@@ -64,6 +65,7 @@ def ask_question(question, stream=False):
         
         progress_bar = st.progress(0)
         status_text = st.empty()
+        answer_text = st.empty()
         
         try:
             response = requests.post(
@@ -75,6 +77,7 @@ def ask_question(question, stream=False):
             if response.status_code == 200:
                 step = 0
                 final_result = None
+                streamed_answer = ""
                 
                 for line in response.iter_lines():
                     if line:
@@ -97,10 +100,12 @@ def ask_question(question, stream=False):
                             elif data['step'] == 'generating_response':
                                 status_text.text("Generating response...")
                                 progress_bar.progress(95)
+                            elif data['step'] == 'response_chunk':
+                                streamed_answer += data['text']
+                                answer_text.markdown(streamed_answer)
                             elif data['step'] == 'response_generated':
                                 progress_bar.progress(100)
                                 status_text.text("Complete!")
-                                time.sleep(0.5)
                             elif data['step'] == 'creating_visualization':
                                 status_text.text("Creating visualization...")
                             elif data['step'] == 'complete':
@@ -112,6 +117,7 @@ def ask_question(question, stream=False):
                 
                 # Display final results
                 if final_result:
+                    answer_text.empty()
                     display_results(final_result)
             else:
                 st.error(f"API Error: {response.status_code}")
@@ -157,15 +163,22 @@ def display_results(result):
     if result['results']:
         st.markdown("### Data")
         st.dataframe(result['results'], use_container_width=True)
+        if result.get('truncated'):
+            st.caption(f"Showing the first {len(result['results'])} of {result['row_count']} rows. "
+                       f"Full result: {API_BASE_URL}/results/{result['result_handle']}/stream")
     
     # Visualization
     if result.get('visualization'):
         st.markdown("### Visualization")
         try:
-            # Decode base64 image
-            img_data = base64.b64decode(result['visualization'])
-            img = Image.open(io.BytesIO(img_data))
-            st.image(img, use_column_width=True)
+            if result.get('visualization_format') == 'png':
+                # Server-rendered chart, only sent when PNG was requested
+                img_data = base64.b64decode(result['visualization'])
+                img = Image.open(io.BytesIO(img_data))
+                st.image(img, use_column_width=True)
+            else:
+                # Plotly figure JSON, drawn in the browser
+                st.plotly_chart(pio.from_json(result['visualization']), use_container_width=True)
         except Exception as e:
             st.error(f"Error displaying visualization: {str(e)}")
     